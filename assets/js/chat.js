@@ -0,0 +1,259 @@
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, name.length + 1) === (name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+const csrftoken = getCookie('csrftoken');
+// Page-specific values are rendered as data attributes on the chat container
+const chatApp = document.getElementById('chat-app').dataset;
+const chatMessages = document.getElementById('chat-messages');
+const userInput = document.getElementById('user-input');
+const typingIndicator = document.createElement('div');
+typingIndicator.className = 'typing-indicator';
+typingIndicator.textContent = 'Assistant is typing...';
+
+function showTypingIndicator() {
+    chatMessages.appendChild(typingIndicator);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function hideTypingIndicator() {
+    if (typingIndicator.parentNode === chatMessages) {
+        chatMessages.removeChild(typingIndicator);
+    }
+}
+
+function addMessage(message, isUser = false) {
+    const messageDiv = document.createElement('div');
+    messageDiv.className = `message ${isUser ? 'user-message' : 'bot-message'}`;
+    messageDiv.textContent = message;
+    chatMessages.appendChild(messageDiv);
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+function askQuestion(question) {
+    userInput.value = question;
+    sendMessage();
+}
+
+function handleStreamEvent(frame, messageDiv) {
+    let eventType = 'message';
+    let data = '';
+    frame.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            eventType = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+        }
+    });
+    if (!data) {
+        return;
+    }
+
+    const payload = JSON.parse(data);
+    if (eventType === 'error') {
+        throw new Error(payload.error);
+    } else if (eventType === 'done') {
+        messageDiv.textContent = payload.response;
+    } else if (payload.token) {
+        messageDiv.textContent += payload.token;
+    }
+    chatMessages.scrollTop = chatMessages.scrollHeight;
+}
+
+async function streamResponse(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let messageDiv = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        if (!messageDiv) {
+            hideTypingIndicator();
+            messageDiv = document.createElement('div');
+            messageDiv.className = 'message bot-message';
+            chatMessages.appendChild(messageDiv);
+        }
+
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        frames.forEach(frame => handleStreamEvent(frame, messageDiv));
+    }
+}
+
+function sendMessage() {
+    const message = userInput.value.trim();
+    if (message) {
+        addMessage(message, true);
+        userInput.value = '';
+        showTypingIndicator();
+
+        fetch(chatApp.responseUrl, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrftoken
+            },
+            body: JSON.stringify({ message: message, stream: true })
+        })
+        .then(response => {
+            if ((response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+                return streamResponse(response);
+            }
+            // Errors raised before streaming starts come back as plain JSON
+            return response.json().then(data => {
+                throw new Error(data.error || 'Unexpected response');
+            });
+        })
+        .catch(error => {
+            hideTypingIndicator();
+            addMessage('I apologize, but I encountered an error. Please try again.');
+            console.error('Error:', error);
+        });
+    }
+}
+
+function saveSession() {
+    const messages = Array.from(document.querySelectorAll('.message')).map(msg => ({
+        content: msg.textContent,
+        type: msg.classList.contains('user-message') ? 'user' : 'assistant'
+    }));
+
+    const sessionData = {
+        event_id: chatApp.eventId || '',
+        phase: chatApp.phase || '',
+        messages: messages,
+        timestamp: new Date().toISOString()
+    };
+
+    fetch(chatApp.saveUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrftoken
+        },
+        body: JSON.stringify(sessionData)
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            alert('Session saved successfully!');
+            // Optionally refresh the sessions list
+            location.reload();
+        } else {
+            alert('Failed to save session: ' + data.error);
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Failed to save session. Please try again.');
+    });
+}
+
+function pollJob(jobId) {
+    fetch(`/jobs/${jobId}/`)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'succeeded') {
+                hideTypingIndicator();
+                addMessage(job.result.response);
+            } else if (job.status === 'failed') {
+                hideTypingIndicator();
+                addMessage('I apologize, but I encountered an error. Please try again.');
+            } else {
+                setTimeout(() => pollJob(jobId), 1000);
+            }
+        })
+        .catch(error => {
+            hideTypingIndicator();
+            console.error('Error:', error);
+        });
+}
+
+// Writing sessions started in the background pass the job to wait for
+const pendingJob = new URLSearchParams(window.location.search).get('job');
+if (pendingJob) {
+    showTypingIndicator();
+    pollJob(pendingJob);
+}
+
+userInput.addEventListener('keypress', function(e) {
+    if (e.key === 'Enter') {
+        e.preventDefault();
+        sendMessage();
+    }
+});
+
+function renderPhaseSessions(data, eventId, phase) {
+    // The API returns one page of sessions; later pages are appended to the first
+    const container = document.getElementById('phase-sessions');
+    if (data.page === 1) {
+        container.replaceChildren();
+    }
+    container.querySelector('.load-more-sessions')?.remove();
+    if (data.page === 1 && !data.sessions.length) {
+        container.textContent = 'No saved sessions for this phase yet.';
+        return;
+    }
+    data.sessions.forEach(session => {
+        const link = document.createElement('a');
+        link.className = 'session-item d-block p-2 rounded text-reset text-decoration-none';
+        link.href = `/session/${session.id}/`;
+        link.textContent = `${session.title} (${session.formatted_date})`;
+        container.appendChild(link);
+    });
+    if (data.has_next) {
+        const more = document.createElement('button');
+        more.type = 'button';
+        more.className = 'load-more-sessions btn btn-sm btn-link';
+        more.textContent = 'Load more';
+        more.addEventListener('click', () => {
+            more.disabled = true;
+            loadPhaseSessions(eventId, phase, data.page + 1);
+        });
+        container.appendChild(more);
+    }
+}
+
+function loadPhaseSessions(eventId, phase, page = 1) {
+    fetch(`/api/sessions/${eventId}/${phase}/?page=${page}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Failed to load sessions');
+            }
+            // Ignore a page that arrives after switching to another phase
+            if (chatApp.phase === phase) {
+                renderPhaseSessions(data, eventId, phase);
+            }
+        })
+        .catch(error => console.error('Error loading sessions:', error));
+}
+
+function switchPhase(eventId, phase) {
+    document.querySelectorAll('.phase-tab').forEach(tab => {
+        tab.classList.toggle('active', tab.dataset.phase === phase);
+    });
+    chatApp.phase = phase;
+    loadPhaseSessions(eventId, phase);
+}
+
+// Event chat pages list the saved sessions of the current phase
+if (chatApp.eventId && document.getElementById('phase-sessions')) {
+    loadPhaseSessions(chatApp.eventId, chatApp.phase);
+}
@@ -0,0 +1,156 @@
+// The event is rendered as data attributes on the page container
+const eventDetail = document.getElementById('event-detail').dataset;
+const currentEventId = eventDetail.eventId;
+let shownPhase = null;
+
+function switchPhase(phase) {
+    // Update tab highlighting
+    document.querySelectorAll('.phase-tab').forEach(tab => {
+        if (tab.dataset.phase === phase) {
+            tab.classList.remove('bg-body-secondary');
+            tab.classList.add('bg-primary');
+        } else {
+            tab.classList.remove('bg-primary');
+            tab.classList.add('bg-body-secondary');
+        }
+    });
+
+    // Show the phase sessions container
+    document.getElementById('phase-sessions').style.display = 'block';
+    document.getElementById('all-sessions').style.display = 'none';
+
+    // Update the phase title
+    const phaseDisplayNames = {
+        'facts': 'Factual Description',
+        'feelings': 'Emotional Response',
+        'thoughts': 'Behavioral Associations',
+        'growth': 'Positive Reframing & Growth'
+    };
+    document.getElementById('phase-title').textContent = `${phaseDisplayNames[phase]} Sessions`;
+
+    // Show loading state
+    const sessionsList = document.getElementById('sessions-list');
+    sessionsList.innerHTML = '<div class="list-group-item text-center"><div class="spinner-border spinner-border-sm text-primary me-2" role="status"></div>Loading sessions...</div>';
+
+    shownPhase = phase;
+    loadPhaseSessions(phase, 1);
+}
+
+function renderSession(session) {
+    const sessionElement = document.createElement('div');
+    sessionElement.className = 'list-group-item list-group-item-action';
+    sessionElement.innerHTML = `
+        <div class="d-flex w-100 justify-content-between align-items-center">
+            <div>
+                <h6 class="mb-1">${session.title}</h6>
+                <p class="mb-1 text-body-secondary small">
+                    <i class="bi bi-clock me-1"></i>
+                    ${session.formatted_date}
+                </p>
+            </div>
+            <button class="btn btn-sm btn-primary" onclick="loadSession(${session.id})">
+                View Session
+            </button>
+        </div>
+    `;
+    return sessionElement;
+}
+
+function loadPhaseSessions(phase, page) {
+    const sessionsList = document.getElementById('sessions-list');
+
+    // Fetch one page of sessions for this phase using the stored event ID;
+    // "Load more" appends the next page to those already shown
+    fetch(`/api/sessions/${currentEventId}/${phase}/?page=${page}`)
+        .then(response => {
+            if (!response.ok) {
+                if (response.status === 404) {
+                    throw new Error('No sessions found for this phase');
+                }
+                throw new Error(`Server error (${response.status}). Please try again.`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data.success) {
+                throw new Error(data.error || 'Failed to load sessions');
+            }
+            // A page that arrives after switching to another phase is dropped
+            if (phase !== shownPhase) {
+                return;
+            }
+
+            if (page === 1) {
+                sessionsList.innerHTML = ''; // Clear the loading state
+            }
+            sessionsList.querySelector('.load-more-sessions')?.remove();
+
+            if (page === 1 && (!data.sessions || data.sessions.length === 0)) {
+                sessionsList.innerHTML = `
+                    <div class="list-group-item text-center text-muted">
+                        <p class="mb-0">No sessions found for this phase</p>
+                        <small>Click "Start Writing" to begin a new session</small>
+                    </div>`;
+                return;
+            }
+
+            data.sessions.forEach(session => sessionsList.appendChild(renderSession(session)));
+
+            if (data.has_next) {
+                const more = document.createElement('button');
+                more.type = 'button';
+                more.className = 'load-more-sessions list-group-item list-group-item-action text-center text-primary';
+                more.textContent = 'Load more sessions';
+                more.addEventListener('click', () => {
+                    more.disabled = true;
+                    loadPhaseSessions(phase, page + 1);
+                });
+                sessionsList.appendChild(more);
+            }
+        })
+        .catch(error => {
+            console.error('Error fetching sessions:', error);
+            if (page > 1) {
+                // Keep the sessions already shown and let the user try the page again
+                const more = sessionsList.querySelector('.load-more-sessions');
+                if (more) {
+                    more.disabled = false;
+                    more.textContent = 'Could not load more sessions. Try again';
+                }
+                return;
+            }
+            sessionsList.innerHTML = `
+                <div class="list-group-item text-center">
+                    <div class="text-danger mb-2">
+                        <i class="bi bi-exclamation-circle me-2"></i>
+                        ${error.message}
+                    </div>
+                    <button class="btn btn-sm btn-outline-primary" onclick="switchPhase('${phase}')">
+                        <i class="bi bi-arrow-clockwise me-1"></i>
+                        Try Again
+                    </button>
+                </div>`;
+        });
+}
+
+function closePhaseView() {
+    document.getElementById('phase-sessions').style.display = 'none';
+    document.getElementById('all-sessions').style.display = 'block';
+    shownPhase = null;
+
+    // Reset all tabs to their default state based on the current phase
+    const currentPhase = eventDetail.currentPhase;
+    document.querySelectorAll('.phase-tab').forEach(tab => {
+        if (tab.dataset.phase === currentPhase) {
+            tab.classList.remove('bg-body-secondary');
+            tab.classList.add('bg-primary');
+        } else {
+            tab.classList.remove('bg-primary');
+            tab.classList.add('bg-body-secondary');
+        }
+    });
+}
+
+function loadSession(sessionId) {
+    window.location.href = `/session/${sessionId}/`;
+}
@@ -0,0 +1,267 @@
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from functools import wraps
+from .models import AdmissionSlot, RateLimitBucket
+import asyncio
+import logging
+import math
+import random
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Admission control for the views that call the LLM. A request is admitted if
+#   1. the user's token bucket has a token (ADMISSION_USER_BURST tokens, refilled
+#      at ADMISSION_USER_RATE per minute), and
+#   2. it can take one of ADMISSION_MAX_CONCURRENT run slots, waiting up to
+#      ADMISSION_QUEUE_TIMEOUT seconds in one of ADMISSION_QUEUE_SIZE queue slots
+#      if they are all taken.
+# Otherwise it gets a 429 with Retry-After. Buckets and slots are database rows
+# claimed with conditional updates, like LLMJob claims, so the limits hold across
+# gunicorn workers without a broker. A slot is held until the response (including
+# a streamed one) is finished; its lease expires after ADMISSION_SLOT_LEASE
+# seconds in case the worker holding it dies.
+
+RATE_LIMITED_MESSAGE = "You're sending messages faster than the writing assistant can keep up. Please wait a moment."
+BUSY_MESSAGE = "The writing assistant is busy right now. Please try again shortly."
+BUCKET_UPDATE_ATTEMPTS = 5
+
+_provisioned = set()
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+
+def take_token(user_id):
+    """Take one token from the user's bucket; returns 0, or seconds until a token is available"""
+    rate = settings.ADMISSION_USER_RATE / 60
+    burst = settings.ADMISSION_USER_BURST
+    for _ in range(BUCKET_UPDATE_ATTEMPTS):
+        now = timezone.now()
+        bucket = RateLimitBucket.objects.filter(user_id=user_id).values('tokens', 'updated_at').first()
+        if bucket is None:
+            try:
+                RateLimitBucket.objects.create(user_id=user_id, tokens=burst - 1, updated_at=now)
+                return 0
+            except IntegrityError:
+                continue
+        tokens = min(burst, bucket['tokens'] + (now - bucket['updated_at']).total_seconds() * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        # Only applies if no other request took a token since we read the bucket
+        if RateLimitBucket.objects.filter(user_id=user_id, updated_at=bucket['updated_at']).update(
+            tokens=tokens - 1, updated_at=now
+        ):
+            return 0
+    # Heavy contention on one user's bucket is itself a sign of a burst
+    return 1 / rate
+
+
+def _provision(pool, size):
+    """Create any missing slot rows, once per process and pool size"""
+    if (pool, size) in _provisioned:
+        return
+    AdmissionSlot.objects.bulk_create(
+        [AdmissionSlot(pool=pool, number=number) for number in range(size)],
+        ignore_conflicts=True
+    )
+    _provisioned.add((pool, size))
+
+
+def _free_slots(pool, size, now):
+    available = Q(holder='') | Q(expires_at__lt=now)
+    return list(AdmissionSlot.objects.filter(available, pool=pool, number__lt=size).values_list('id', flat=True))
+
+
+def acquire_slot(pool, size, holder):
+    """Claim a free (or expired) slot among the first `size` of a pool; returns its id or None"""
+    _provision(pool, size)
+    now = timezone.now()
+    available = Q(holder='') | Q(expires_at__lt=now)
+    candidates = _free_slots(pool, size, now)
+    if not candidates and AdmissionSlot.objects.filter(pool=pool, number__lt=size).count() < size:
+        # The rows were removed since this process created them (e.g. a flushed database)
+        _provisioned.discard((pool, size))
+        _provision(pool, size)
+        candidates = _free_slots(pool, size, now)
+    # Spread concurrent claimers over the free slots instead of all racing for the first
+    random.shuffle(candidates)
+    for slot_id in candidates:
+        if AdmissionSlot.objects.filter(available, id=slot_id).update(
+            holder=holder,
+            acquired_at=now,
+            expires_at=now + timedelta(seconds=settings.ADMISSION_SLOT_LEASE)
+        ):
+            return slot_id
+    return None
+
+
+def release_slot(slot_id, holder):
+    AdmissionSlot.objects.filter(id=slot_id, holder=holder).update(holder='', acquired_at=None, expires_at=None)
+
+
+class Ticket:
+    """A held run slot"""
+
+    def __init__(self, slot_id, holder):
+        self.slot_id = slot_id
+        self.holder = holder
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            release_slot(self.slot_id, self.holder)
+
+
+def _check_rate(user_id):
+    wait = take_token(user_id)
+    if wait:
+        logger.warning(f"Rate limited user {user_id} for {wait:.1f}s")
+        raise AdmissionRejected(RATE_LIMITED_MESSAGE, wait)
+
+
+def _busy():
+    return AdmissionRejected(BUSY_MESSAGE, settings.ADMISSION_BUSY_RETRY_AFTER)
+
+
+def admit(user_id):
+    """Admit a request or raise AdmissionRejected; release the returned Ticket when done"""
+    _check_rate(user_id)
+    holder = uuid.uuid4().hex
+    slot_id = acquire_slot('run', settings.ADMISSION_MAX_CONCURRENT, holder)
+    if slot_id is not None:
+        return Ticket(slot_id, holder)
+
+    queue_slot_id = acquire_slot('queue', settings.ADMISSION_QUEUE_SIZE, holder)
+    if queue_slot_id is None:
+        logger.warning(f"Admission queue full, rejecting user {user_id}")
+        raise _busy()
+    try:
+        deadline = time.monotonic() + settings.ADMISSION_QUEUE_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.ADMISSION_POLL_INTERVAL)
+            slot_id = acquire_slot('run', settings.ADMISSION_MAX_CONCURRENT, holder)
+            if slot_id is not None:
+                return Ticket(slot_id, holder)
+    finally:
+        release_slot(queue_slot_id, holder)
+    logger.warning(f"User {user_id} waited {settings.ADMISSION_QUEUE_TIMEOUT}s without a slot")
+    raise _busy()
+
+
+async def aadmit(user_id):
+    """Async version of admit: waits in the queue without blocking the event loop"""
+    await sync_to_async(_check_rate)(user_id)
+    holder = uuid.uuid4().hex
+    acquire = sync_to_async(acquire_slot)
+    slot_id = await acquire('run', settings.ADMISSION_MAX_CONCURRENT, holder)
+    if slot_id is not None:
+        return Ticket(slot_id, holder)
+
+    queue_slot_id = await acquire('queue', settings.ADMISSION_QUEUE_SIZE, holder)
+    if queue_slot_id is None:
+        logger.warning(f"Admission queue full, rejecting user {user_id}")
+        raise _busy()
+    try:
+        deadline = time.monotonic() + settings.ADMISSION_QUEUE_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.ADMISSION_POLL_INTERVAL)
+            slot_id = await acquire('run', settings.ADMISSION_MAX_CONCURRENT, holder)
+            if slot_id is not None:
+                return Ticket(slot_id, holder)
+    finally:
+        await sync_to_async(release_slot)(queue_slot_id, holder)
+    logger.warning(f"User {user_id} waited {settings.ADMISSION_QUEUE_TIMEOUT}s without a slot")
+    raise _busy()
+
+
+def rejected_response(request, rejection):
+    retry_after = str(max(1, math.ceil(rejection.retry_after)))
+    if request.content_type == 'application/json' or 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'error': rejection.message, 'retry_after': int(retry_after)}, status=429)
+    else:
+        response = HttpResponse(rejection.message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = retry_after
+    return response
+
+
+def _hold_until_sent(response, ticket):
+    """Release the ticket once the response body has been produced"""
+    if not response.streaming:
+        ticket.release()
+        return response
+
+    if response.is_async:
+        content = response.streaming_content
+
+        async def release_after():
+            try:
+                async for chunk in content:
+                    yield chunk
+            finally:
+                await sync_to_async(ticket.release)()
+    else:
+        content = response.streaming_content
+
+        def release_after():
+            try:
+                yield from content
+            finally:
+                ticket.release()
+
+    response.streaming_content = release_after()
+    return response
+
+
+def admission_control(view):
+    """Apply per-user rate limits and the shared concurrency limit to an LLM view.
+
+    Goes below @login_required, which must run first.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if not settings.ADMISSION_ENABLED:
+                return await view(request, *args, **kwargs)
+            user = await request.auser()
+            try:
+                ticket = await aadmit(user.id)
+            except AdmissionRejected as e:
+                return rejected_response(request, e)
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                await sync_to_async(ticket.release)()
+                raise
+            if not response.streaming:
+                await sync_to_async(ticket.release)()
+                return response
+            return _hold_until_sent(response, ticket)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.ADMISSION_ENABLED:
+            return view(request, *args, **kwargs)
+        try:
+            ticket = admit(request.user.id)
+        except AdmissionRejected as e:
+            return rejected_response(request, e)
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            ticket.release()
+            raise
+        return _hold_until_sent(response, ticket)
+    return wrapper
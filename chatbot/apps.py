@@ -7,3 +7,7 @@ class ChatbotConfig(AppConfig):
 
     def ready(self):
         import chatbot.models  # Import the models module to connect signals
+        import chatbot.prompts  # Invalidates memoized prompt fragments on profile save
+        import chatbot.user_cache  # Invalidates cached users, profiles and events on save
+        import chatbot.search  # Repairs SQLite full-text triggers after migrations
+        import chatbot.telemetry  # Times database queries made during LLM calls
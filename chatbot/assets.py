@@ -0,0 +1,55 @@
+from django.conf import settings
+from pathlib import Path
+from rcssmin import cssmin
+from rjsmin import jsmin
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Static asset bundles. The page scripts and styles are written as plain files
+# under ASSET_SOURCE_DIR; `manage.py build_assets` concatenates and minifies
+# them into the bundles below under ASSET_BUILD_DIR (inside STATICFILES_DIRS).
+# collectstatic then gives each bundle a content-hashed name and pre-compresses
+# it (see STORAGES), and WhiteNoise serves the hashed names with immutable
+# far-future cache headers.
+#
+# Minification uses rjsmin and rcssmin (see requirements.txt), so the committed
+# bundles match what `build_assets --check` produces anywhere.
+
+BUNDLES = {
+    'app.css': ['css/base.css', 'css/home.css', 'css/event_detail.css'],
+    'app.js': ['js/theme.js'],
+    'chat.js': ['js/chat.js'],
+    'chat_page.css': ['css/chat.css'],
+    'event_detail.js': ['js/event_detail.js'],
+}
+
+
+def build_bundle(name):
+    """Minified contents of one bundle"""
+    source_dir = Path(settings.ASSET_SOURCE_DIR)
+    minify = cssmin if name.endswith('.css') else jsmin
+    parts = [minify((source_dir / source).read_text(encoding='utf-8')) for source in BUNDLES[name]]
+    # Separate scripts with ';' so one file's last statement can't run into the next
+    separator = "\n" if name.endswith('.css') else ";\n"
+    return separator.join(parts) + "\n"
+
+
+def build_assets(check=False):
+    """Write every bundle to ASSET_BUILD_DIR; returns the names that changed.
+
+    With check=True nothing is written, so callers can fail on stale bundles.
+    """
+    build_dir = Path(settings.ASSET_BUILD_DIR)
+    changed = []
+    for name in BUNDLES:
+        content = build_bundle(name)
+        path = build_dir / name
+        if path.exists() and path.read_text(encoding='utf-8') == content:
+            continue
+        changed.append(name)
+        if not check:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(content, encoding='utf-8')
+            logger.info(f"Built {path}")
+    return changed
@@ -0,0 +1,225 @@
+from django.shortcuts import redirect, aget_object_or_404
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from django.contrib import messages
+from django.utils import timezone
+from django.urls import reverse
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from .models import Event, UserProfile, UserThread, ChatMessage
+from .llm import get_llm_client, CircuitOpenError
+from .prompts import build_turn_messages
+from .context_window import aselect_recent_turns
+from .summaries import aget_phase_summary, unsummarized
+from .jobs import enqueue_job
+from .phases import MarkerDetector
+from .retrieval import retrieve_snippets
+from .telemetry import LLMCall
+from .admission import admission_control
+from .user_cache import aget_profile_and_event
+from .export import aexport_chunks
+from .views import (save_chat_turn, create_opening_message, sse_event, export_response,
+                    LLM_UNAVAILABLE_MESSAGE)
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Async counterparts of the chat views in views.py. They are routed in place of
+# the sync versions when settings.ASYNC_CHAT_VIEWS is enabled (the default when
+# serving through ep.asgi), so a single worker can hold many in-flight LLM calls.
+
+async def abuild_chat_messages(user, message, event_id=None, phase=None):
+    """Async version of views.build_chat_messages"""
+    user_profile, current_event = await aget_profile_and_event(user, event_id)
+    if event_id and current_event is None:
+        raise Http404("Event not found")
+
+    active_phase = None
+    summary = None
+    previous_messages = []
+    if current_event:
+        active_phase = phase or current_event.current_phase
+        summary = await aget_phase_summary(user, current_event, active_phase)
+        previous_messages = await aselect_recent_turns(unsummarized(ChatMessage.objects.filter(
+            user_thread__user=user,
+            user_thread__event=current_event,
+            phase=active_phase
+        ), summary))
+
+    snippets = []
+    if settings.RETRIEVAL_ENABLED:
+        snippets = await sync_to_async(retrieve_snippets)(user, message, current_event)
+
+    messages = build_turn_messages(
+        user_profile, current_event, active_phase, previous_messages, message,
+        summary=summary.summary if summary else None,
+        snippets=snippets
+    )
+    return messages, current_event, active_phase
+
+async def asave_chat_turn(user, current_event, phase, message, assistant_message, phase_complete=None):
+    """Async version of views.save_chat_turn"""
+    # The turn is written in a single transaction, which needs the sync ORM
+    await sync_to_async(save_chat_turn)(
+        user, current_event, phase, message, assistant_message, phase_complete=phase_complete
+    )
+
+async def astream_chat_completion(user, messages, current_event, phase, message, call=None):
+    """Async version of views.stream_chat_completion"""
+    call = call or LLMCall('chat_turn', user, current_event, phase)
+    chunks = []
+    marker = MarkerDetector()
+    try:
+        with call.active():
+            stream = await get_llm_client().achat_completion(
+                messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True
+            )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                chunks.append(token)
+                marker.feed(token)
+                yield sse_event({'token': token})
+
+        assistant_message = "".join(chunks)
+        if current_event:
+            with call.active():
+                await asave_chat_turn(user, current_event, phase, message, assistant_message, phase_complete=marker.found)
+        call.finish()
+
+        yield sse_event({'response': assistant_message}, event='done')
+    except CircuitOpenError:
+        logger.warning("OpenAI circuit open, failing fast")
+        call.finish('circuit_open')
+        yield sse_event({'error': LLM_UNAVAILABLE_MESSAGE}, event='error')
+    except Exception as e:
+        logger.error(f"Error streaming OpenAI response: {str(e)}", exc_info=True)
+        call.finish('error')
+        yield sse_event({'error': str(e)}, event='error')
+
+@login_required
+@admission_control
+async def aget_chatbot_response(request):
+    try:
+        try:
+            data = json.loads(request.body)
+            message = data.get('message')
+            event_id = data.get('event_id')
+            phase = data.get('phase')
+            stream = bool(data.get('stream'))
+            background = bool(data.get('background'))
+
+            if not message:
+                logger.warning("No message provided in request")
+                return JsonResponse({'error': 'No message provided'})
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON request: {str(e)}")
+            return JsonResponse({'error': 'Invalid request format'})
+
+        user = await request.auser()
+        if background:
+            job = await sync_to_async(enqueue_job)('chat_turn', {
+                'message': message,
+                'event_id': event_id,
+                'phase': phase,
+            }, user=user)
+            return JsonResponse({
+                'job_id': job.id,
+                'status_url': reverse('job_status', args=[job.id])
+            }, status=202)
+
+        call = LLMCall('chat_turn', user=user)
+        try:
+            with call.active(), call.stage('prompt'):
+                messages, current_event, active_phase = await abuild_chat_messages(user, message, event_id, phase)
+            call.set_context(current_event, active_phase)
+        except UserProfile.DoesNotExist:
+            logger.error(f"UserProfile not found for user {user.username}")
+            return JsonResponse({'error': 'User profile not found'})
+        except Http404:
+            logger.error(f"Event not found: {event_id}")
+            return JsonResponse({'error': 'Event not found'})
+        except Exception as e:
+            logger.error(f"Error getting user context: {str(e)}", exc_info=True)
+            return JsonResponse({'error': 'Failed to get user context'})
+
+        if stream:
+            response = StreamingHttpResponse(
+                astream_chat_completion(user, messages, current_event, active_phase, message, call),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        try:
+            with call.active():
+                response = await get_llm_client().achat_completion(
+                    messages,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+                assistant_message = response.choices[0].message.content
+
+                if current_event:
+                    await asave_chat_turn(user, current_event, active_phase, message, assistant_message)
+            call.finish()
+
+            return JsonResponse({'response': assistant_message})
+
+        except CircuitOpenError:
+            logger.warning("OpenAI circuit open, failing fast")
+            call.finish('circuit_open')
+            return JsonResponse({'error': LLM_UNAVAILABLE_MESSAGE}, status=503)
+        except Exception as e:
+            logger.error(f"Error in OpenAI communication: {str(e)}", exc_info=True)
+            call.finish('error')
+            return JsonResponse({'error': str(e)})
+
+    except Exception as e:
+        logger.error(f"Error in aget_chatbot_response: {str(e)}", exc_info=True)
+        return JsonResponse({'error': 'Failed to get AI response'})
+
+@login_required
+@admission_control
+async def astart_writing_session(request, event_id):
+    user = await request.auser()
+    event = await aget_object_or_404(Event, id=event_id, user=user)
+
+    # Create a new thread for this writing session
+    user_thread = await UserThread.objects.acreate(
+        user=user,
+        event=event,
+        thread_id=str(timezone.now().timestamp())
+    )
+
+    try:
+        if settings.LLM_BACKGROUND_JOBS:
+            job = await sync_to_async(enqueue_job)('opening_turn', {
+                'event_id': event.id,
+                'user_thread_id': user_thread.id,
+            }, user=user)
+            return redirect(f'/chat/?event_id={event_id}&job={job.id}')
+
+        await sync_to_async(create_opening_message)(user, event, user_thread)
+        return redirect(f'/chat/?event_id={event_id}')
+
+    except Exception as e:
+        logger.error(f"Error starting writing session: {str(e)}", exc_info=True)
+        messages.error(request, "Failed to start writing session. Please try again.")
+        return redirect('event_detail', event_id=event.id)
+
+@login_required
+@require_http_methods(["GET"])
+async def aexport_history(request):
+    """Async version of views.export_history"""
+    user = await request.auser()
+    logger.info(f"Exporting writing history of user {user.id} as {request.GET.get('format', 'ndjson')}")
+    return export_response(request, user, aexport_chunks)
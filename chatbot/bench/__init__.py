@@ -0,0 +1,9 @@
+"""Benchmark harness for the chat and event endpoints.
+
+``fake_openai`` serves an OpenAI-compatible chat completions API with a set
+latency and token rate, ``seed`` fills a database with users, events, threads,
+messages and saved sessions, and ``runner`` drives the scenarios through the
+Django test client and reports throughput, latency percentiles and queries per
+request. ``manage.py bench`` puts them together on a throwaway test database
+and compares the results with an earlier run.
+"""
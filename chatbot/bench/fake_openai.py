@@ -0,0 +1,144 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import json
+import threading
+import time
+
+# A local stand-in for the OpenAI chat completions endpoint. Each response
+# waits `latency` seconds before its first token, then produces tokens at
+# `token_rate` per second, streamed as server-sent events when the request asks
+# for stream=True. Usage is reported like the real API (prompt tokens are
+# estimated at four characters each), so telemetry sees realistic records.
+
+WORDS = "the of and to in a is that for it as was with be by on not he this are or his from at which but".split()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        server = self.server
+        completion_tokens = min(server.completion_tokens, body.get('max_tokens') or server.completion_tokens)
+        prompt_chars = sum(len(str(message.get('content', ''))) for message in body.get('messages', []))
+        usage = {
+            'prompt_tokens': max(1, prompt_chars // 4),
+            'completion_tokens': completion_tokens,
+            'total_tokens': max(1, prompt_chars // 4) + completion_tokens,
+        }
+        completion_id = f"chatcmpl-bench-{next(server.ids)}"
+        model = body.get('model', 'gpt-4')
+        tokens = [WORDS[i % len(WORDS)] + ' ' for i in range(completion_tokens)]
+
+        time.sleep(server.latency)
+        if body.get('stream'):
+            self._stream(completion_id, model, tokens, usage, body.get('stream_options') or {})
+        else:
+            time.sleep(completion_tokens / server.token_rate)
+            self._send_json({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                    'finish_reason': 'stop',
+                }],
+                'usage': usage,
+            })
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, completion_id, model, tokens, usage, stream_options):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(choices, **extra):
+            return {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                    'model': model, 'choices': choices, **extra}
+
+        for token in tokens:
+            self._write_event(chunk([{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]))
+            time.sleep(1 / self.server.token_rate)
+        self._write_event(chunk([{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]))
+        if stream_options.get('include_usage'):
+            self._write_event(chunk([], usage=usage))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, payload):
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer:
+    """Runs the fake API on a background thread; use as a context manager"""
+
+    def __init__(self, latency=0.2, token_rate=50.0, completion_tokens=60, host='127.0.0.1', port=0):
+        self.httpd = ThreadingHTTPServer((host, port), FakeOpenAIHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.token_rate = token_rate
+        self.httpd.completion_tokens = completion_tokens
+        self.httpd.ids = itertools.count(1)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-openai', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Serve the fake API in the foreground, e.g. for load tests against runserver"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument('--token-rate', type=float, default=50.0, help="Tokens per second")
+    parser.add_argument('--completion-tokens', type=int, default=60)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.latency, args.token_rate, args.completion_tokens, port=args.port)
+    print(f"Fake OpenAI API on {server.base_url} (set OPENAI_BASE_URL to use it)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from ..telemetry import percentile
+from .seed import PHASES, sentence
+import json
+import random
+import statistics
+import threading
+import time
+
+# Benchmark scenarios. Each scenario sends one request for a randomly chosen
+# seeded user through the Django test client, so the whole request/response
+# cycle (middleware, views, ORM, templates) is measured without a web server.
+# Every request is timed and its queries are counted on the worker's own
+# connection. The first `warmup` requests of each scenario are not recorded.
+
+LATENCY_PERCENTILES = [50, 90, 95, 99]
+
+
+def _chat_turn(client, user, event_ids, rng):
+    return client.post('/chat/response/', json.dumps({'message': sentence(rng, 12), 'event_id': rng.choice(event_ids)}),
+                       content_type='application/json')
+
+
+def _chat_stream(client, user, event_ids, rng):
+    return client.post('/chat/response/', json.dumps({'message': sentence(rng, 12), 'event_id': rng.choice(event_ids),
+                                                      'stream': True}),
+                       content_type='application/json')
+
+
+def _event_detail(client, user, event_ids, rng):
+    return client.get(f'/events/{rng.choice(event_ids)}/')
+
+
+def _poll_event(client, user, event_ids, rng):
+    # Revalidate an event page the client has seen before, as an open tab does;
+    # mostly 304s, so the cost is dominated by loading the session and user
+    url = f'/events/{rng.choice(event_ids)}/'
+    etags = client.__dict__.setdefault('bench_etags', {})
+    response = client.get(url, HTTP_IF_NONE_MATCH=etags.get(url, '""'))
+    etags[url] = response.get('ETag', etags.get(url))
+    return response
+
+
+def _phase_sessions(client, user, event_ids, rng):
+    return client.get(f'/api/sessions/{rng.choice(event_ids)}/{rng.choice(PHASES)}/')
+
+
+def _save_session(client, user, event_ids, rng):
+    messages = [{'type': 'user' if i % 2 == 0 else 'assistant', 'content': sentence(rng)} for i in range(10)]
+    return client.post('/chat/save/', json.dumps({'event_id': rng.choice(event_ids), 'phase': rng.choice(PHASES),
+                                                  'messages': messages}),
+                       content_type='application/json')
+
+
+SCENARIOS = {
+    'chat_turn': _chat_turn,
+    'chat_stream': _chat_stream,
+    'event_detail': _event_detail,
+    'poll_event': _poll_event,
+    'phase_sessions': _phase_sessions,
+    'save_session': _save_session,
+}
+
+
+def _failed(response):
+    if response.status_code >= 400:
+        return True
+    # Several JSON endpoints report errors with a 200 and an 'error' key
+    if response.get('Content-Type', '').startswith('application/json'):
+        try:
+            data = json.loads(response.content)
+        except ValueError:
+            return True
+        return isinstance(data, dict) and ('error' in data or data.get('success') is False)
+    return False
+
+
+def _timed_request(scenario, client, user, event_ids, rng):
+    """(latency_ms, queries, failed) for one request, including reading a streamed body"""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = scenario(client, user, event_ids, rng)
+        if response.streaming:
+            body = b"".join(response.streaming_content)
+            failed = response.status_code >= 400 or b"event: error" in body
+        else:
+            failed = _failed(response)
+        elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, len(queries), failed
+
+
+def summarize(latencies, queries, errors, wall_seconds):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        'latency_ms': {
+            **{f'p{pct}': round(percentile(latencies, pct), 2) for pct in LATENCY_PERCENTILES},
+            'mean': round(statistics.fmean(latencies), 2),
+            'max': round(latencies[-1], 2),
+        } if latencies else {},
+        'queries_per_request': {
+            'mean': round(statistics.fmean(queries), 2),
+            'max': max(queries),
+        } if queries else {},
+    }
+
+
+def run_scenario(name, seeded, requests=100, concurrency=1, warmup=5, seed=0):
+    """Send `requests` requests of one scenario and summarize them.
+
+    With concurrency 1 the requests run on the calling thread, so they see the
+    caller's transaction (as in tests); otherwise each worker thread uses its
+    own database connection.
+    """
+    scenario = SCENARIOS[name]
+    local = threading.local()
+    lock = threading.Lock()
+    latencies, query_counts = [], []
+    errors = 0
+
+    def client_for(user):
+        clients = getattr(local, 'clients', None)
+        if clients is None:
+            clients = local.clients = {}
+        if user.id not in clients:
+            clients[user.id] = Client()
+            clients[user.id].force_login(user)
+        return clients[user.id]
+
+    def work(index):
+        nonlocal errors
+        rng = random.Random(f"{seed}-{name}-{index}")
+        user, event_ids = rng.choice(seeded)
+        elapsed, queries, failed = _timed_request(scenario, client_for(user), user, event_ids, rng)
+        if index < warmup:
+            return
+        with lock:
+            latencies.append(elapsed)
+            query_counts.append(queries)
+            errors += failed
+
+    def worker(indexes):
+        try:
+            for index in indexes:
+                work(index)
+        finally:
+            connection.close()
+
+    for index in range(warmup):
+        work(index)
+    started = time.perf_counter()
+    indexes = list(range(warmup, warmup + requests))
+    if concurrency <= 1:
+        for index in indexes:
+            work(index)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, [indexes[i::concurrency] for i in range(concurrency)]))
+    wall_seconds = time.perf_counter() - started
+    return summarize(latencies, query_counts, errors, wall_seconds)
+
+
+def compare(baseline, current):
+    """Rows of (scenario, metric, baseline, current, change %) for scenarios in both runs"""
+    rows = []
+    metrics = [
+        ('throughput_rps', lambda s: s['throughput_rps']),
+        ('p50_ms', lambda s: s['latency_ms'].get('p50')),
+        ('p95_ms', lambda s: s['latency_ms'].get('p95')),
+        ('p99_ms', lambda s: s['latency_ms'].get('p99')),
+        ('queries', lambda s: s['queries_per_request'].get('mean')),
+    ]
+    for name, stats in current['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        for metric, read in metrics:
+            old, new = read(before), read(stats)
+            change = round((new - old) / old * 100, 1) if old and new is not None else None
+            rows.append((name, metric, old, new, change))
+    return rows
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from ..models import ChatMessage, ChatSession, ChatSessionMessage, Event, UserThread
+import datetime
+import random
+
+# Deterministic benchmark data. The same arguments and seed always produce the
+# same users, events, threads, messages and sessions, so runs on different
+# commits are measured against identical data.
+
+VOCABULARY = (
+    "morning evening school work family friend argument exam move city house "
+    "nervous proud relieved angry tired hopeful remember felt thought realised "
+    "because after before while again never always wanted needed tried learned"
+).split()
+PHASES = [phase for phase, _ in Event.WRITING_PHASE_CHOICES]
+
+
+def sentence(rng, words=20):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+
+def seed(users=20, events_per_user=3, messages_per_event=40, sessions_per_event=5,
+         messages_per_session=20, seed=0):
+    """Create the benchmark data and return [(user, [event ids])]"""
+    rng = random.Random(seed)
+    seeded = []
+    with transaction.atomic():
+        for user_index in range(users):
+            # No password: scenarios log in with force_login, which skips the slow hasher
+            user = User.objects.create_user(f"bench-{seed}-{user_index}", password=None)
+            events = Event.objects.bulk_create([
+                Event(
+                    user=user,
+                    title=f"Event {event_index}",
+                    description=sentence(rng, 40),
+                    date_occurred=datetime.date(2024, 1, 1) - datetime.timedelta(days=rng.randrange(3650)),
+                    current_phase=rng.choice(PHASES),
+                )
+                for event_index in range(events_per_user)
+            ])
+            threads = UserThread.objects.bulk_create([
+                UserThread(user=user, event=event, thread_id=f"thread_{user.id}_{event.id}")
+                for event in events
+            ])
+            ChatMessage.objects.bulk_create([
+                ChatMessage(
+                    event=event,
+                    user_thread=thread,
+                    message_type='user' if i % 2 == 0 else 'assistant',
+                    content=sentence(rng),
+                    phase=PHASES[min(i * len(PHASES) // max(messages_per_event, 1), len(PHASES) - 1)],
+                )
+                for event, thread in zip(events, threads)
+                for i in range(messages_per_event)
+            ])
+            sessions = ChatSession.objects.bulk_create([
+                ChatSession(
+                    event=event,
+                    phase=rng.choice(PHASES),
+                    title=sentence(rng, 6),
+                    message_count=messages_per_session,
+                )
+                for event in events
+                for _ in range(sessions_per_event)
+            ])
+            ChatSessionMessage.objects.bulk_create([
+                ChatSessionMessage(
+                    session=session,
+                    position=position,
+                    message_type='user' if position % 2 == 0 else 'assistant',
+                    content=sentence(rng),
+                )
+                for session in sessions
+                for position in range(messages_per_session)
+            ])
+            seeded.append((user, [event.id for event in events]))
+    return seeded
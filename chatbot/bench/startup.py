@@ -0,0 +1,74 @@
+"""Import-time profile of a fresh worker process.
+
+A worker is booted in a child interpreter with ``python -X importtime``: it
+imports the WSGI or ASGI application (settings, app registry, middleware) and
+resolves the URLconf, which imports every view module. The child reports how
+long each step took; the importtime lines on its stderr give the cost of every
+module, which is summed per top-level package.
+"""
+from collections import defaultdict
+import json
+import os
+import re
+import subprocess
+import sys
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# Run in the child; prints the step timings as JSON on stdout
+BOOT_SCRIPT = """
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings!r})
+from importlib import import_module
+application = import_module({module!r}).application
+booted = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+resolved = time.perf_counter()
+print(json.dumps({{
+    'application_ms': (booted - started) * 1000,
+    'urls_ms': (resolved - booted) * 1000,
+    'modules': len(sys.modules),
+}}))
+"""
+
+
+def parse_importtime(lines):
+    """(module, self_us, cumulative_us, depth) for each `-X importtime` line"""
+    modules = []
+    for line in lines:
+        match = IMPORTTIME_RE.match(line.rstrip())
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def by_package(modules):
+    """Total self time in microseconds per top-level package, largest first"""
+    totals = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def profile_startup(app='asgi', settings_module=None, env=None):
+    """Boot a worker in a child process; returns step timings and per-module import costs"""
+    script = BOOT_SCRIPT.format(
+        settings=settings_module or os.environ.get('DJANGO_SETTINGS_MODULE', 'ep.settings'),
+        module=f"ep.{app}",
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        capture_output=True, text=True, env={**os.environ, **(env or {})}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Worker failed to boot:\n{result.stderr[-2000:]}")
+    modules = parse_importtime(result.stderr.splitlines())
+    return {
+        **json.loads(result.stdout.strip().splitlines()[-1]),
+        'import_ms': sum(module[1] for module in modules) / 1000,
+        'packages': by_package(modules),
+        'slowest': sorted(modules, key=lambda module: -module[2]),
+    }
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.core.cache import cache
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Selects the most recent conversation turns that fit a token budget. Token
+# counts come from the tiktoken encoding that load_encoding() reads from
+# TIKTOKEN_CACHE_DIR when a worker boots (or from a characters-per-token
+# estimate when TOKEN_COUNTER is 'estimate'), and are cached per ChatMessage id
+# since message content never changes after it is saved.
+
+# Tokens the chat format adds around every message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+CHARS_PER_TOKEN = 4
+TOKEN_COUNT_CACHE_KEY = 'msg-tokens:{id}'
+
+
+_encoding = None
+# Set once the encoding was found missing, so the process keeps estimating
+_encoding_missing = False
+
+
+def load_encoding():
+    """Load the encoding of OPENAI_MODEL from TIKTOKEN_CACHE_DIR.
+
+    If `manage.py fetch_encoding` hasn't filled the directory, logs a warning and
+    falls back to the estimate rather than letting tiktoken download it. Returns
+    None when tokens are estimated.
+    """
+    global _encoding, _encoding_missing
+    if settings.TOKEN_COUNTER == 'estimate':
+        return None
+    cache_dir = Path(settings.TIKTOKEN_CACHE_DIR)
+    if not cache_dir.is_dir() or not any(cache_dir.iterdir()):
+        logger.warning(f"No tiktoken encoding in {cache_dir}; estimating token counts. "
+                       f"Run `manage.py fetch_encoding` at build time or set TOKEN_COUNTER=estimate")
+        _encoding_missing = True
+        return None
+    _encoding = fetch_encoding()
+    return _encoding
+
+
+def fetch_encoding():
+    """The tiktoken encoding of OPENAI_MODEL, downloaded into TIKTOKEN_CACHE_DIR if missing"""
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(settings.OPENAI_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+
+def get_encoding():
+    if _encoding is not None or _encoding_missing:
+        return _encoding
+    return load_encoding()
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    """Token count of a message list as sent to the chat completions API"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def get_message_token_counts(chat_messages):
+    """Map ChatMessage id -> token count, reading and filling the per-message cache"""
+    keys = {TOKEN_COUNT_CACHE_KEY.format(id=msg.id): msg for msg in chat_messages}
+    cached = cache.get_many(keys.keys())
+    missing = {}
+    counts = {}
+    for key, msg in keys.items():
+        if key in cached:
+            counts[msg.id] = cached[key]
+        else:
+            counts[msg.id] = missing[key] = count_tokens(msg.content) + MESSAGE_OVERHEAD_TOKENS
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return counts
+
+
+def fit_to_budget(newest_first, budget):
+    """Keep the longest run of most recent messages within budget, oldest first"""
+    counts = get_message_token_counts(newest_first)
+    selected = []
+    used = 0
+    for msg in newest_first:
+        used += counts[msg.id]
+        if used > budget:
+            break
+        selected.append(msg)
+    selected.reverse()
+    return selected
+
+
+def recent_messages_query(queryset):
+    """Newest-first, capped query for candidate history messages"""
+    return queryset.only('id', 'message_type', 'content').order_by(
+        '-created_at', '-id'
+    )[:settings.CHAT_CONTEXT_MAX_MESSAGES]
+
+
+def select_recent_turns(queryset, budget=None):
+    """Most recent messages from queryset whose tokens fit within budget"""
+    budget = settings.CHAT_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    return fit_to_budget(list(recent_messages_query(queryset)), budget)
+
+
+async def aselect_recent_turns(queryset, budget=None):
+    """Async version of select_recent_turns"""
+    budget = settings.CHAT_CONTEXT_TOKEN_BUDGET if budget is None else budget
+    newest_first = [msg async for msg in recent_messages_query(queryset)]
+    return fit_to_budget(newest_first, budget)
@@ -0,0 +1,193 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from itertools import groupby
+from .models import Event, ChatMessage, ChatSession, ChatSessionMessage
+import json
+import zipfile
+
+# Export of everything a user has written: their events, chat messages and
+# saved sessions. Rows are read with .iterator(chunk_size=EXPORT_CHUNK_SIZE) and
+# turned into flat records (event, then its messages, then its sessions each
+# followed by their transcript), which the formats below render one at a time.
+# Nothing holds more than one chunk of rows, so memory use does not grow with
+# the size of the history. Each event costs three queries; session transcripts
+# are merged with their sessions instead of being fetched per session.
+#
+# The formats are NDJSON (one record per line), Markdown, and a zip archive
+# holding both. They produce bytes in STREAM_CHUNK_BYTES pieces for a
+# StreamingHttpResponse or a file.
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'markdown': ('text/markdown; charset=utf-8', 'md'),
+    'zip': ('application/zip', 'zip'),
+}
+STREAM_CHUNK_BYTES = 64 * 1024
+ROLE_NAMES = {'user': 'You', 'assistant': 'Assistant', 'system': 'System'}
+PHASE_NAMES = dict(Event.WRITING_PHASE_CHOICES)
+
+
+def _messages(user, event_id, chunk_size):
+    messages = ChatMessage.objects.filter(user_thread__user=user, event_id=event_id).order_by('created_at', 'id')
+    for message in messages.values('id', 'phase', 'message_type', 'content', 'created_at').iterator(chunk_size):
+        yield {'type': 'message', 'event_id': event_id, **message}
+
+
+def _sessions(event_id, chunk_size):
+    sessions = ChatSession.objects.filter(event_id=event_id).order_by('timestamp', 'id').values(
+        'id', 'phase', 'title', 'timestamp', 'message_count'
+    )
+    transcripts = ChatSessionMessage.objects.filter(session__event_id=event_id).order_by(
+        'session__timestamp', 'session_id', 'position'
+    ).values('session_id', 'position', 'message_type', 'content')
+    # Both queries run in session order, so each transcript follows its session
+    groups = groupby(transcripts.iterator(chunk_size), key=lambda row: row['session_id'])
+    pending = next(groups, None)
+    for session in sessions.iterator(chunk_size):
+        yield {'type': 'session', 'event_id': event_id, **session}
+        if pending is not None and pending[0] == session['id']:
+            for row in pending[1]:
+                yield {'type': 'session_message', **row}
+            pending = next(groups, None)
+
+
+def export_records(user, chunk_size=None):
+    """Every event, message, session and session message of the user, grouped by event"""
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    events = Event.objects.filter(user=user).order_by('date_occurred', 'id').values(
+        'id', 'title', 'description', 'date_occurred', 'current_phase', 'created_at', 'updated_at'
+    )
+    for event in events.iterator(chunk_size):
+        yield {'type': 'event', **event}
+        yield from _messages(user, event['id'], chunk_size)
+        yield from _sessions(event['id'], chunk_size)
+    # General chat, not tied to an event
+    yield from _messages(user, None, chunk_size)
+
+
+def ndjson(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+def _timestamp(value):
+    return timezone.localtime(value).strftime("%B %d, %Y %I:%M %p")
+
+
+def markdown(records, user):
+    yield f"# Writing history of {user.get_username()}\n\nExported {_timestamp(timezone.now())}\n"
+    section = phase = None
+    for record in records:
+        kind = record['type']
+        if kind == 'event':
+            section = phase = None
+            yield f"\n## {record['title']}\n\n*{record['date_occurred']:%B %d, %Y}*"
+            yield f" · current phase: {PHASE_NAMES.get(record['current_phase'], record['current_phase'])}\n"
+            if record['description']:
+                yield f"\n{record['description']}\n"
+        elif kind == 'message':
+            if section != ('messages', record['event_id']):
+                section, phase = ('messages', record['event_id']), None
+                yield "\n### Chat\n" if record['event_id'] else "\n## Chat without an event\n"
+            if record['phase'] != phase:
+                phase = record['phase']
+                yield f"\n#### {PHASE_NAMES.get(phase, phase)}\n"
+            role = ROLE_NAMES.get(record['message_type'], record['message_type'])
+            yield f"\n**{role}** ({_timestamp(record['created_at'])}): {record['content']}\n"
+        elif kind == 'session':
+            if section != 'sessions':
+                section = 'sessions'
+                yield "\n### Saved sessions\n"
+            title = record['title'] or f"Session {record['id']}"
+            yield f"\n#### {title}\n\n*{PHASE_NAMES.get(record['phase'], record['phase'])}, {_timestamp(record['timestamp'])}*\n"
+        elif kind == 'session_message':
+            role = ROLE_NAMES.get(record['message_type'], record['message_type'])
+            yield f"\n**{role}**: {record['content']}\n"
+
+
+class _Pipe:
+    """Write-only file for ZipFile that hands the written bytes to a generator"""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts, self.size = [], 0
+        return data
+
+
+def _encoded(parts):
+    for part in parts:
+        yield part.encode('utf-8')
+
+
+def archive(user, chunk_size=None):
+    """A zip of history.ndjson and history.md, written as it is read"""
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive_file:
+        members = [
+            ('history.ndjson', lambda: ndjson(export_records(user, chunk_size))),
+            ('history.md', lambda: markdown(export_records(user, chunk_size), user)),
+        ]
+        for name, render in members:
+            # ZipFile writes a data descriptor after each member, since the pipe can't seek
+            with archive_file.open(name, 'w') as member:
+                for data in _encoded(render()):
+                    member.write(data)
+                    if pipe.size >= STREAM_CHUNK_BYTES:
+                        yield pipe.drain()
+            yield pipe.drain()
+    yield pipe.drain()
+
+
+def _chunked(pieces):
+    """Join small byte strings into STREAM_CHUNK_BYTES chunks"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def export_chunks(user, export_format, chunk_size=None):
+    """The user's history in one of FORMATS, as a generator of byte chunks"""
+    if export_format == 'zip':
+        return _chunked(chunk for chunk in archive(user, chunk_size) if chunk)
+    if export_format == 'markdown':
+        return _chunked(_encoded(markdown(export_records(user, chunk_size), user)))
+    return _chunked(_encoded(ndjson(export_records(user, chunk_size))))
+
+
+async def aexport_chunks(user, export_format, chunk_size=None):
+    """Async iterator over export_chunks, for streaming under ASGI.
+
+    Django buffers a sync iterator whole when serving it asynchronously, so
+    each chunk is produced on the thread-sensitive executor instead.
+    """
+    chunks = export_chunks(user, export_format, chunk_size)
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def export_filename(user, export_format):
+    return f"writing-history-{user.get_username()}-{timezone.localdate():%Y-%m-%d}.{FORMATS[export_format][1]}"
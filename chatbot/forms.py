@@ -15,11 +15,12 @@ class UserProfileForm(forms.ModelForm):
 
     class Meta:
         model = UserProfile
-        fields = ['bio_context', 'writing_goals', 'personality_preference']
+        fields = ['bio_context', 'writing_goals', 'personality_preference', 'cache_opening_prompts']
         widgets = {
             'bio_context': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
             'writing_goals': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
             'personality_preference': forms.Select(attrs={'class': 'form-control'}),
+            'cache_opening_prompts': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
 class EventForm(forms.ModelForm):
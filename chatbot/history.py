@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+import base64
+import hashlib
+
+# Keyset pagination for the message history APIs. Pages are ordered by
+# (created_at, id) and the cursor carries the last row's pair, so each page is
+# a range scan on the (event, created_at) or (user_thread, created_at) index no
+# matter how deep into the history it is. Messages are never edited or deleted
+# one by one, so the newest (created_at, id) identifies the state of a history
+# for ETags; it is read from the end of the same index in one row.
+
+# API field -> (model column it reads, serializer)
+MESSAGE_FIELDS = {
+    'id': ('id', lambda msg: msg.id),
+    'content': ('content', lambda msg: msg.content),
+    'type': ('message_type', lambda msg: msg.message_type),
+    'message_type': ('message_type', lambda msg: msg.message_type),
+    'phase': ('phase', lambda msg: msg.phase),
+    'timestamp': ('created_at', lambda msg: msg.created_at.isoformat()),
+}
+
+
+def encode_cursor(msg):
+    raw = f"{msg.created_at.isoformat()}|{msg.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        created_at, msg_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        created_at = parse_datetime(created_at)
+        msg_id = int(msg_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if created_at is None:
+        raise ValueError("Invalid cursor")
+    return created_at, msg_id
+
+
+def parse_fields(value, default):
+    """Requested fields from a comma-separated fields= value, or default"""
+    if not value:
+        return list(default)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in MESSAGE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(value):
+    if not value:
+        return settings.HISTORY_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, settings.HISTORY_MAX_PAGE_SIZE))
+
+
+def history_etag(queryset, *request_parts):
+    """Weak validator for a page: the history's newest message plus the page request"""
+    newest = queryset.order_by('-created_at', '-id').values_list('created_at', 'id').first()
+    raw = "|".join(str(part) for part in (newest, *request_parts))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def paginate_messages(queryset, cursor, limit, fields):
+    """One page of messages after cursor, serialized with fields.
+
+    Returns (messages, next_cursor); next_cursor is None on the last page.
+    """
+    columns = {'id', 'created_at'} | {MESSAGE_FIELDS[field][0] for field in fields}
+    queryset = queryset.only(*columns).order_by('created_at', 'id')
+    if cursor:
+        created_at, msg_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=msg_id))
+
+    rows = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    messages = [
+        {field: MESSAGE_FIELDS[field][1](msg) for field in fields}
+        for msg in rows[:limit]
+    ]
+    return messages, next_cursor
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import LLMJob
+from datetime import timedelta
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# Database-backed queue for slow LLM work. Views enqueue an LLMJob row and
+# return immediately; `manage.py run_llm_worker` claims pending rows and runs
+# the handler registered for the job's kind (see chatbot/tasks.py). Only the
+# existing database is needed, no external broker.
+#
+# A job's attempts are counted when it is claimed, so an attempt that never
+# reports back (the worker was killed) still counts: requeue_stale_jobs fails
+# such a job once it has used up max_attempts instead of retrying it forever.
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register a function(job) as the handler for a job kind"""
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue_job(kind, payload, user=None, max_attempts=None):
+    return LLMJob.objects.create(
+        kind=kind,
+        payload=payload,
+        user=user,
+        max_attempts=max_attempts or settings.LLM_JOB_MAX_ATTEMPTS,
+    )
+
+
+def claim_jobs(worker, limit):
+    """Atomically mark up to `limit` due jobs as running for this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        candidates = list(
+            LLMJob.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+    claimed = []
+    for job_id in candidates:
+        # The status guard makes the claim safe even where SKIP LOCKED is unavailable
+        updated = LLMJob.objects.filter(id=job_id, status='pending').update(
+            status='running', worker=worker, started_at=now, attempts=F('attempts') + 1
+        )
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs():
+    """Return jobs whose worker died mid-run to the queue, or fail them if that was their last attempt"""
+    now = timezone.now()
+    stale = LLMJob.objects.filter(status='running', started_at__lt=now - timedelta(seconds=settings.LLM_JOB_STALE_AFTER))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', worker='', error='Worker stopped during the last attempt', finished_at=now
+    )
+    requeued = stale.update(status='pending', worker='')
+    if failed:
+        logger.error(f"Failed {failed} stale LLM jobs that had no attempts left")
+    if requeued:
+        logger.warning(f"Requeued {requeued} stale LLM jobs")
+    return requeued
+
+
+def run_job(job_id, worker):
+    """Run a job claimed by this worker and record its outcome"""
+    close_old_connections()
+    try:
+        job = LLMJob.objects.get(id=job_id)
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            job.result = handler(job)
+            job.status = 'succeeded'
+            job.error = ''
+        except Exception as e:
+            logger.error(f"LLM job {job.id} ({job.kind}) failed: {str(e)}", exc_info=True)
+            job.error = str(e)
+            if handler is not None and job.attempts < job.max_attempts:
+                job.status = 'pending'
+                delay = random.uniform(0, settings.LLM_JOB_RETRY_DELAY * 2 ** job.attempts)
+                job.run_after = timezone.now() + timedelta(seconds=delay)
+            else:
+                job.status = 'failed'
+        job.finished_at = timezone.now() if job.status in ('succeeded', 'failed') else None
+        # Only while still ours: a job requeued as stale may be running elsewhere
+        updated = LLMJob.objects.filter(id=job.id, status='running', worker=worker).update(
+            status=job.status, result=job.result, error=job.error,
+            run_after=job.run_after, finished_at=job.finished_at,
+        )
+        if not updated:
+            logger.warning(f"LLM job {job.id} was requeued while running; dropping this attempt's outcome")
+        return job
+    finally:
+        close_old_connections()
@@ -0,0 +1,316 @@
+"""Shared OpenAI client used by every chat call site.
+
+Wraps the sync and async OpenAI clients with a sized connection pool,
+per-request timeouts and an overall deadline, jittered retries on 429/5xx
+and connection errors, and a circuit breaker that fails fast while the
+provider is degraded. Configure it through the ``LLM_*`` settings. Each call
+reports its latency, attempts and token usage to chatbot.telemetry.
+
+The openai package (and httpx and pydantic with it) is imported when the
+client is first created, not when this module is, so worker boot doesn't pay
+for it.
+"""
+from django.conf import settings
+from .telemetry import LLMCall, current_call
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are short-circuited"""
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures, half-open after a cool-down.
+
+    While half-open a single probe call is let through; the others fail fast
+    until its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == 'open':
+                raise CircuitOpenError("LLM provider circuit is open")
+            if state == 'half-open':
+                if self._probe_in_flight:
+                    raise CircuitOpenError("LLM provider circuit is half-open, waiting for the probe call")
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """End a call that says nothing about provider health (a 4xx, a dropped client)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._probe_in_flight = False
+            self._failures += 1
+            # A failed probe while half-open re-opens the circuit immediately
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning(f"Opening LLM circuit after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+
+
+def is_retryable(error):
+    """Timeouts, connection errors, 429 and 5xx responses are worth retrying"""
+    from openai import APIConnectionError, APIStatusError, APITimeoutError
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """Seconds requested by the provider's Retry-After header, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    def __init__(self, api_key=None, base_url=None, model='gpt-4', pool_size=20,
+                 timeout=60.0, connect_timeout=5.0, deadline=120.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, failure_threshold=5, reset_timeout=30.0):
+        self.model = model
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+        import httpx
+        client_timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        # Retries are handled here so they can share the deadline and breaker
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=client_timeout,
+            max_retries=0,
+            http_client=DefaultHttpxClient(limits=limits, timeout=client_timeout),
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=client_timeout,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=limits, timeout=client_timeout),
+        )
+
+    def _backoff(self, attempt, error):
+        delay = retry_after(error)
+        if delay is None:
+            # Full jitter: uniform over the exponential window
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return min(delay, self.backoff_max)
+
+    def _request_kwargs(self, messages, kwargs, remaining):
+        kwargs.setdefault('model', self.model)
+        kwargs['messages'] = messages
+        kwargs['timeout'] = min(remaining, kwargs.get('timeout') or self.timeout)
+        return kwargs
+
+    def _should_retry(self, error, attempt, deadline_at):
+        # Client errors such as 400/401 say nothing about provider health
+        if not is_retryable(error):
+            self.breaker.release_probe()
+            return None
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= deadline_at:
+            return None
+        logger.warning(f"LLM call failed ({error.__class__.__name__}), retrying in {delay:.2f}s")
+        return delay
+
+    def _begin(self, kwargs):
+        """The telemetry call to report into, and whether this method owns it"""
+        if kwargs.get('stream'):
+            # Ask for a final usage chunk so streamed calls report tokens too
+            kwargs.setdefault('stream_options', {'include_usage': True})
+        call = current_call()
+        if call is None:
+            return LLMCall('completion'), True
+        return call, False
+
+    def chat_completion(self, messages, **kwargs):
+        """Create a chat completion; pass stream=True to get a chunk iterator"""
+        call, standalone = self._begin(kwargs)
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+                remaining = deadline_at - time.monotonic()
+                request = self._request_kwargs(messages, dict(kwargs), remaining)
+                call.upstream_started(request['model'])
+                response = self.client.chat.completions.create(**request)
+            except Exception as e:
+                delay = None if isinstance(e, CircuitOpenError) else self._should_retry(e, attempt, deadline_at)
+                if delay is None:
+                    call.upstream_finished(error=e)
+                    if standalone:
+                        call.finish('error')
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if kwargs.get('stream'):
+                return self._guard_stream(response, call, standalone)
+            self.breaker.record_success()
+            call.upstream_finished(getattr(response, 'usage', None))
+            if standalone:
+                call.finish()
+            return response
+
+    async def achat_completion(self, messages, **kwargs):
+        """Async version of chat_completion"""
+        call, standalone = self._begin(kwargs)
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                self.breaker.before_call()
+                remaining = deadline_at - time.monotonic()
+                request = self._request_kwargs(messages, dict(kwargs), remaining)
+                call.upstream_started(request['model'])
+                response = await self.async_client.chat.completions.create(**request)
+            except Exception as e:
+                delay = None if isinstance(e, CircuitOpenError) else self._should_retry(e, attempt, deadline_at)
+                if delay is None:
+                    call.upstream_finished(error=e)
+                    if standalone:
+                        call.finish('error')
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if kwargs.get('stream'):
+                return self._aguard_stream(response, call, standalone)
+            self.breaker.record_success()
+            call.upstream_finished(getattr(response, 'usage', None))
+            if standalone:
+                call.finish()
+            return response
+
+    def _stream_failed(self, call, standalone, usage, error):
+        self.breaker.record_failure()
+        call.upstream_finished(usage, error=error)
+        if standalone:
+            call.finish('error')
+
+    def _stream_finished(self, call, standalone, usage):
+        self.breaker.record_success()
+        call.upstream_finished(usage)
+        if standalone:
+            call.finish()
+
+    def _stream_abandoned(self, call, standalone, usage):
+        # The client went away (GeneratorExit, CancelledError); the provider was fine so far
+        self.breaker.release_probe()
+        call.upstream_finished(usage)
+        if standalone:
+            call.finish('cancelled')
+
+    def _guard_stream(self, stream, call, standalone):
+        usage = None
+        try:
+            for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    call.first_token()
+                yield chunk
+        except Exception as e:
+            self._stream_failed(call, standalone, usage, e)
+            raise
+        except BaseException:
+            self._stream_abandoned(call, standalone, usage)
+            if hasattr(stream, 'close'):
+                stream.close()
+            raise
+        self._stream_finished(call, standalone, usage)
+
+    async def _aguard_stream(self, stream, call, standalone):
+        usage = None
+        try:
+            async for chunk in stream:
+                usage = getattr(chunk, 'usage', None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    call.first_token()
+                yield chunk
+        except Exception as e:
+            self._stream_failed(call, standalone, usage, e)
+            raise
+        except BaseException:
+            self._stream_abandoned(call, standalone, usage)
+            if hasattr(stream, 'close'):
+                await stream.close()
+            raise
+        self._stream_finished(call, standalone, usage)
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Return the process-wide LLMClient, creating it on first use"""
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient(
+                    api_key=settings.OPENAI_API_KEY,
+                    base_url=settings.OPENAI_BASE_URL,
+                    model=settings.OPENAI_MODEL,
+                    pool_size=settings.LLM_POOL_SIZE,
+                    timeout=settings.LLM_TIMEOUT,
+                    connect_timeout=settings.LLM_CONNECT_TIMEOUT,
+                    deadline=settings.LLM_DEADLINE,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    backoff_base=settings.LLM_BACKOFF_BASE,
+                    backoff_max=settings.LLM_BACKOFF_MAX,
+                    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                    reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+                )
+    return _llm_client
@@ -0,0 +1,157 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from chatbot import llm
+from chatbot.bench.fake_openai import FakeOpenAIServer
+from chatbot.bench.runner import SCENARIOS, compare, run_scenario
+from chatbot.bench.seed import seed
+import django
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the chat and event endpoints on a throwaway test database against a fake "
+            "OpenAI server, optionally comparing with an earlier run")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=sorted(SCENARIOS),
+                            help="Scenario to run (repeatable); default is all of them")
+        parser.add_argument('--requests', type=int, default=100, help="Measured requests per scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help="Worker threads; SQLite serializes writes, so use PostgreSQL above 1")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--events', type=int, default=3, help="Events per user")
+        parser.add_argument('--messages', type=int, default=40, help="Chat messages per event")
+        parser.add_argument('--sessions', type=int, default=5, help="Saved sessions per event")
+        parser.add_argument('--session-messages', type=int, default=20, help="Messages per saved session")
+        parser.add_argument('--latency', type=float, default=0.05, help="Fake OpenAI seconds to first token")
+        parser.add_argument('--token-rate', type=float, default=200.0, help="Fake OpenAI tokens per second")
+        parser.add_argument('--completion-tokens', type=int, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--admission', action='store_true',
+                            help="Keep admission control on; by default it is off so every request is measured")
+        parser.add_argument('--uncached-auth', action='store_true',
+                            help="Load the session and user from the database on every request, for comparison")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="Results file of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read baseline {options['baseline']}: {e}")
+
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        params = {key: options[key] for key in (
+            'requests', 'warmup', 'concurrency', 'users', 'events', 'messages', 'sessions',
+            'session_messages', 'latency', 'token_rate', 'completion_tokens', 'seed', 'admission',
+            'uncached_auth'
+        )}
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'params': params,
+            },
+            'scenarios': {},
+        }
+
+        # One JSON line per LLM call would drown the report
+        telemetry_logger = logging.getLogger('chatbot.telemetry.calls')
+        telemetry_level = telemetry_logger.level
+        telemetry_logger.setLevel(logging.WARNING)
+
+        setup_test_environment()
+        tmp_dir = None
+        if connection.vendor == 'sqlite':
+            # The in-memory test database locks whole tables against the background
+            # summary and embedding threads; a file database just waits for the writer
+            tmp_dir = tempfile.mkdtemp(prefix='bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with FakeOpenAIServer(options['latency'], options['token_rate'], options['completion_tokens']) as server:
+                auth_settings = {}
+                if options['uncached_auth']:
+                    auth_settings = {
+                        'SESSION_ENGINE': settings.SESSION_ENGINES['db'],
+                        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+                    }
+                # Static files are served by name and tokens estimated, so the run
+                # doesn't depend on collectstatic or the tiktoken download
+                static_storages = {
+                    **settings.STORAGES,
+                    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+                }
+                with override_settings(OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY='bench',
+                                       ADMISSION_ENABLED=options['admission'], STORAGES=static_storages,
+                                       TOKEN_COUNTER='estimate', **auth_settings):
+                    # The shared client was built from the real settings
+                    llm._llm_client = None
+                    self.stdout.write(f"Seeding {options['users']} users on {connection.vendor}...")
+                    seeded = seed(options['users'], options['events'], options['messages'],
+                                  options['sessions'], options['session_messages'], options['seed'])
+                    for name in scenarios:
+                        stats = run_scenario(name, seeded, options['requests'], options['concurrency'],
+                                             options['warmup'], options['seed'])
+                        results['scenarios'][name] = stats
+                        self.report(name, stats)
+        finally:
+            llm._llm_client = None
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            teardown_test_environment()
+            telemetry_logger.setLevel(telemetry_level)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self.report_comparison(baseline, results)
+
+    def report(self, name, stats):
+        latency = stats['latency_ms']
+        queries = stats['queries_per_request']
+        self.stdout.write(
+            f"{name:<16} {stats['requests']:>5} req  {stats['throughput_rps']:>8} req/s  "
+            f"p50 {latency.get('p50')} ms  p95 {latency.get('p95')} ms  p99 {latency.get('p99')} ms  "
+            f"{queries.get('mean')} queries/req  {stats['errors']} errors"
+        )
+
+    def report_comparison(self, baseline, results):
+        commit = baseline['meta'].get('commit')
+        if baseline['meta'].get('params') != results['meta']['params']:
+            self.stdout.write(self.style.WARNING("Baseline was run with different parameters"))
+        self.stdout.write(f"\nCompared with {commit or 'baseline'}:")
+        for name, metric, old, new, change in compare(baseline, results):
+            # Lower is better for everything except throughput
+            better = change is not None and (change > 0) == (metric == 'throughput_rps')
+            change_text = f"{change:+.1f}%" if change is not None else "n/a"
+            if change:
+                change_text = (self.style.SUCCESS if better else self.style.ERROR)(change_text)
+            self.stdout.write(f"  {name:<16} {metric:<15} {old} -> {new}  {change_text}")
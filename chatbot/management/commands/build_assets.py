@@ -0,0 +1,25 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.assets import BUNDLES, build_assets
+
+
+class Command(BaseCommand):
+    help = "Bundle and minify the page scripts and styles into static/dist"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report bundles that are out of date; exit with an error if any are")
+        parser.add_argument('--collect', action='store_true',
+                            help="Run collectstatic afterwards to hash and compress the bundles")
+
+    def handle(self, *args, **options):
+        changed = build_assets(check=options['check'])
+        if options['check']:
+            if changed:
+                raise CommandError(f"Out of date: {', '.join(changed)}. Run `manage.py build_assets`.")
+            self.stdout.write(f"All {len(BUNDLES)} bundles are up to date")
+            return
+
+        self.stdout.write(f"Built {len(changed)} of {len(BUNDLES)} bundles" + (f": {', '.join(changed)}" if changed else ""))
+        if options['collect']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.export import FORMATS, export_chunks, export_filename
+from pathlib import Path
+import sys
+
+
+class Command(BaseCommand):
+    help = "Export users' events, chat messages and saved sessions as NDJSON, Markdown or zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Users to export")
+        parser.add_argument('--all', action='store_true', help="Export every user")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output-dir',
+                            help="Write one file per user here; without it a single user's export goes to stdout")
+        parser.add_argument('--chunk-size', type=int, help="Rows fetched per query (default EXPORT_CHUNK_SIZE)")
+
+    def handle(self, *args, **options):
+        if options['all']:
+            users = User.objects.order_by('id')
+        elif options['usernames']:
+            users = User.objects.filter(username__in=options['usernames']).order_by('id')
+            missing = set(options['usernames']) - set(users.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"No such user: {', '.join(sorted(missing))}")
+        else:
+            raise CommandError("Name the users to export, or pass --all")
+
+        export_format = options['format']
+        if not options['output_dir']:
+            if options['all'] or len(options['usernames']) > 1:
+                raise CommandError("--output-dir is required to export more than one user")
+            if export_format == 'zip' and sys.stdout.isatty():
+                raise CommandError("Not writing a zip archive to a terminal; use --output-dir or a redirect")
+            for chunk in export_chunks(users.get(), export_format, options['chunk_size']):
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
+            return
+
+        output_dir = Path(options['output_dir'])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for user in users.iterator():
+            path = output_dir / export_filename(user, export_format)
+            with open(path, 'wb') as f:
+                for chunk in export_chunks(user, export_format, options['chunk_size']):
+                    f.write(chunk)
+            count += 1
+            self.stdout.write(f"Exported {user.username} to {path}")
+        self.stdout.write(f"Exported {count} users")
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chatbot.context_window import fetch_encoding
+
+
+class Command(BaseCommand):
+    help = "Download the tiktoken encoding of OPENAI_MODEL into TIKTOKEN_CACHE_DIR, for the build step"
+
+    def handle(self, *args, **options):
+        encoding = fetch_encoding()
+        self.stdout.write(f"Encoding {encoding.name} for {settings.OPENAI_MODEL} is in {settings.TIKTOKEN_CACHE_DIR}")
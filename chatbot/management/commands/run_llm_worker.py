@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chatbot.context_window import load_encoding
+from chatbot.jobs import claim_jobs, requeue_stale_jobs, run_job
+import chatbot.tasks  # noqa: F401 - registers the job handlers
+import os
+import signal
+import socket
+import threading
+
+
+class Command(BaseCommand):
+    help = "Run queued LLM jobs (see chatbot/jobs.py) on a thread pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=settings.LLM_WORKER_THREADS,
+                            help="Number of jobs to run concurrently")
+        parser.add_argument('--poll-interval', type=float, default=settings.LLM_WORKER_POLL_INTERVAL,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the currently due jobs and exit")
+
+    def handle(self, *args, **options):
+        load_encoding()
+        threads = options['threads']
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        slots = threading.BoundedSemaphore(threads)
+        self.stdout.write(f"LLM worker {worker} running with {threads} threads")
+
+        # SIGTERM (sent on deploys and scale-downs) and Ctrl-C stop claiming jobs;
+        # leaving the executor then waits for the running ones to finish
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            if not stopping.is_set():
+                self.stdout.write("Shutting down, waiting for running jobs")
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='llm-worker') as executor:
+            while not stopping.is_set():
+                requeue_stale_jobs()
+                free = 0
+                while slots.acquire(blocking=False):
+                    free += 1
+                claimed = claim_jobs(worker, free) if free else []
+                for _ in range(free - len(claimed)):
+                    slots.release()
+
+                for job_id in claimed:
+                    future = executor.submit(run_job, job_id, worker)
+                    future.add_done_callback(lambda f: slots.release())
+
+                if options['once'] and not claimed:
+                    break
+                if not claimed:
+                    stopping.wait(options['poll_interval'])
+        self.stdout.write(f"LLM worker {worker} stopped")
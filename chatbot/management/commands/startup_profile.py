@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.bench.startup import profile_startup
+import json
+
+
+class Command(BaseCommand):
+    help = "Boot a fresh worker process and report where its startup time goes, import by import"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=['asgi', 'wsgi'], default='asgi',
+                            help="Application module the worker imports (ep.asgi or ep.wsgi)")
+        parser.add_argument('--limit', type=int, default=15, help="Packages and modules to list")
+        parser.add_argument('--output', help="Write the full profile as JSON to this file")
+
+    def handle(self, *args, **options):
+        try:
+            profile = profile_startup(options['app'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        limit = options['limit']
+
+        self.stdout.write(
+            f"ep.{options['app']}: application {profile['application_ms']:.0f}ms, "
+            f"URLconf {profile['urls_ms']:.0f}ms, {profile['modules']} modules, "
+            f"{profile['import_ms']:.0f}ms importing"
+        )
+        self.stdout.write("\nImport time by package (self time):")
+        for package, self_us in profile['packages'][:limit]:
+            self.stdout.write(f"  {self_us / 1000:8.1f}ms  {package}")
+        self.stdout.write("\nSlowest imports (including what they import):")
+        for name, _, cumulative_us, _ in profile['slowest'][:limit]:
+            self.stdout.write(f"  {cumulative_us / 1000:8.1f}ms  {name}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(profile, f, indent=2)
+            self.stdout.write(f"\nWrote {options['output']}")
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from chatbot.retrieval import events_hash_path, index_path, update_index
+
+
+class Command(BaseCommand):
+    help = "Build or refresh the per-user embedding indexes used for prompt retrieval"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only this user id (repeatable); default is every user with events")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Discard existing indexes first, e.g. after changing EMBEDDING_FUNCTION")
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or User.objects.filter(event__isnull=False).distinct().values_list('id', flat=True)
+        for user_id in user_ids:
+            if options['rebuild']:
+                index_path(user_id).unlink(missing_ok=True)
+                events_hash_path(user_id).unlink(missing_ok=True)
+            records = update_index(user_id, batch=1)
+            self.stdout.write(f"User {user_id}: {records} records")
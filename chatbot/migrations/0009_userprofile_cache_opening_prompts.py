@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_chatmessage_phase_chatmessage_chat_thread_phase_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='cache_opening_prompts',
+            field=models.BooleanField(default=True, help_text="Reuse the assistant's opening message when starting the same writing phase again"),
+        ),
+    ]
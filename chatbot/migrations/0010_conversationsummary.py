@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_userprofile_cache_opening_prompts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phase', models.CharField(choices=[('facts', 'Facts'), ('feelings', 'Feelings'), ('thoughts', 'Thoughts'), ('growth', 'Growth')], default='facts', max_length=20)),
+                ('summary', models.TextField(blank=True)),
+                ('last_message_id', models.BigIntegerField(default=0)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='chatbot.userthread')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_thread', 'phase'), name='summary_thread_phase_uniq')],
+            },
+        ),
+    ]
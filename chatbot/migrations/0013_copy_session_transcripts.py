@@ -0,0 +1,52 @@
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def split_transcripts(apps, schema_editor):
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatSessionMessage = apps.get_model('chatbot', 'ChatSessionMessage')
+
+    sessions = ChatSession.objects.only('id', 'messages_json').iterator(chunk_size=BATCH_SIZE)
+    for session in sessions:
+        try:
+            messages = json.loads(session.messages_json) if session.messages_json else []
+        except ValueError:
+            messages = []
+        ChatSessionMessage.objects.bulk_create([
+            ChatSessionMessage(
+                session_id=session.id,
+                position=position,
+                message_type=msg.get('type', 'user'),
+                content=msg.get('content', ''),
+            )
+            for position, msg in enumerate(messages)
+        ], batch_size=BATCH_SIZE)
+        ChatSession.objects.filter(id=session.id).update(message_count=len(messages))
+
+
+def join_transcripts(apps, schema_editor):
+    ChatSession = apps.get_model('chatbot', 'ChatSession')
+    ChatSessionMessage = apps.get_model('chatbot', 'ChatSessionMessage')
+
+    for session in ChatSession.objects.only('id').iterator(chunk_size=BATCH_SIZE):
+        messages = [
+            {'content': content, 'type': message_type}
+            for message_type, content in ChatSessionMessage.objects.filter(
+                session_id=session.id
+            ).order_by('position').values_list('message_type', 'content')
+        ]
+        ChatSession.objects.filter(id=session.id).update(messages_json=json.dumps(messages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0012_chatsessionmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_transcripts, join_transcripts),
+    ]
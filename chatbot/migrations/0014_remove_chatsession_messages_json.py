@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0013_copy_session_transcripts'),
+    ]
+
+    operations = [
+        # A default lets the column be re-added when this migration is reversed
+        migrations.AlterField(
+            model_name='chatsession',
+            name='messages_json',
+            field=models.TextField(default='[]'),
+        ),
+        migrations.RemoveField(
+            model_name='chatsession',
+            name='messages_json',
+        ),
+    ]
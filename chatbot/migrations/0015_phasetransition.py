@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0014_remove_chatsession_messages_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhaseTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_phase', models.CharField(choices=[('facts', 'Facts'), ('feelings', 'Feelings'), ('thoughts', 'Thoughts'), ('growth', 'Growth')], max_length=20)),
+                ('to_phase', models.CharField(choices=[('facts', 'Facts'), ('feelings', 'Feelings'), ('thoughts', 'Thoughts'), ('growth', 'Growth')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phase_transitions', to='chatbot.event')),
+                ('user_thread', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='chatbot.userthread')),
+            ],
+            options={
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['event', '-created_at'], name='phase_transition_event_idx'), models.Index(fields=['to_phase', 'created_at'], name='phase_transition_phase_idx')],
+            },
+        ),
+    ]
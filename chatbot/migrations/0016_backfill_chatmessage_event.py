@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_event(apps, schema_editor):
+    # Chat turns used to be saved without an event; take it from the thread
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+    UserThread = apps.get_model('chatbot', 'UserThread')
+    ChatMessage.objects.filter(event__isnull=True).update(
+        event_id=Subquery(UserThread.objects.filter(id=OuterRef('user_thread_id')).values('event_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0015_phasetransition'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_event, migrations.RunPython.noop),
+    ]
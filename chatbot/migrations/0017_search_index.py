@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Full-text index over ChatMessage and ChatSessionMessage content: a GIN
+# tsvector index on PostgreSQL, FTS5 tables with sync triggers on SQLite. The
+# DDL is spelled out here rather than imported from chatbot.search so the
+# migration keeps doing what it did when it was written. The PostgreSQL index
+# uses the 'english' configuration; a different SEARCH_CONFIG needs a migration
+# that rebuilds it.
+
+TABLES = ['chatbot_chatmessage', 'chatbot_chatsessionmessage']
+
+POSTGRESQL_FORWARDS = [
+    f"CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} "
+    f"USING GIN (to_tsvector('english'::regconfig, COALESCE(content, '')))"
+    for table in TABLES
+]
+POSTGRESQL_BACKWARDS = [f"DROP INDEX IF EXISTS {table}_search_idx" for table in TABLES]
+
+SQLITE_FORWARDS = []
+SQLITE_BACKWARDS = []
+for table in TABLES:
+    SQLITE_FORWARDS += [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(content, content='{table}', content_rowid='id')",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts({table}_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE OF content ON {table} BEGIN
+            INSERT INTO {table}_fts({table}_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO {table}_fts(rowid, content) VALUES (new.id, new.content);
+        END""",
+        # Index whatever is already in the content table
+        f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')",
+    ]
+    SQLITE_BACKWARDS += [
+        f"DROP TRIGGER IF EXISTS {table}_fts_ai",
+        f"DROP TRIGGER IF EXISTS {table}_fts_ad",
+        f"DROP TRIGGER IF EXISTS {table}_fts_au",
+        f"DROP TABLE IF EXISTS {table}_fts",
+    ]
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_FORWARDS, POSTGRESQL_BACKWARDS),
+    'sqlite': (SQLITE_FORWARDS, SQLITE_BACKWARDS),
+}
+
+
+def run_for_vendor(direction):
+    # Other databases have no index; search falls back to a substring match
+    def run(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        for statement in statements[direction] if statements else []:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0016_backfill_chatmessage_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_for_vendor(0), run_for_vendor(1)),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-import json
+from django.utils import timezone
 
 # Create your models here.
 
@@ -123,6 +124,10 @@ class UserProfile(models.Model):
         default='professional',
         help_text="Choose how you'd like the AI to interact with you"
     )
+    cache_opening_prompts = models.BooleanField(
+        default=True,
+        help_text="Reuse the assistant's opening message when starting the same writing phase again"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -138,7 +143,7 @@ class ChatSession(models.Model):
     )
     title = models.CharField(max_length=200, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    messages_json = models.TextField()
+    message_count = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-timestamp']
@@ -146,17 +151,157 @@ class ChatSession(models.Model):
             models.Index(fields=['event', 'phase', 'timestamp'], name='chat_session_lookup_idx'),
         ]
     
-    def set_messages(self, messages):
-        self.messages_json = json.dumps(messages)
+    DATE_FORMAT = "%B %d, %Y %I:%M %p"
+    
+    def append_messages(self, messages):
+        """Append {'content', 'type'} dicts after the messages already stored"""
+        if not messages:
+            return []
+        with transaction.atomic():
+            # Lock the row so concurrent appends get distinct positions
+            start = ChatSession.objects.select_for_update().values_list(
+                'message_count', flat=True
+            ).get(pk=self.pk)
+            created = ChatSessionMessage.objects.bulk_create([
+                ChatSessionMessage(
+                    session=self,
+                    position=start + offset,
+                    message_type=msg['type'],
+                    content=msg['content']
+                )
+                for offset, msg in enumerate(messages)
+            ])
+            ChatSession.objects.filter(pk=self.pk).update(message_count=F('message_count') + len(messages))
+        self.message_count = start + len(messages)
+        return created
     
     def get_messages(self):
-        return json.loads(self.messages_json) if self.messages_json else []
+        return [
+            {'content': msg.content, 'type': msg.message_type}
+            for msg in self.session_messages.all()
+        ]
     
     def __str__(self):
-        return f"{self.event.title} - {self.phase} ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
+        # Avoid self.event here: listing sessions would cost a query per row
+        return f"{self.title or f'Session {self.id}'} - {self.phase} ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
     
     def get_formatted_date(self):
-        return self.timestamp.strftime("%B %d, %Y %I:%M %p")
+        return self.timestamp.strftime(self.DATE_FORMAT)
+
+class ChatSessionMessage(models.Model):
+    """One message of a saved ChatSession transcript, in order"""
+    session = models.ForeignKey(ChatSession, on_delete=models.CASCADE, related_name='session_messages')
+    position = models.PositiveIntegerField()
+    message_type = models.CharField(max_length=10, choices=ChatMessage.MESSAGE_TYPES)
+    content = models.TextField()
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'position'], name='session_message_position_uniq'),
+        ]
+
+class ConversationSummary(models.Model):
+    """Rolling summary of a thread's messages in one writing phase"""
+    user_thread = models.ForeignKey(UserThread, on_delete=models.CASCADE, related_name='summaries')
+    phase = models.CharField(
+        max_length=20,
+        choices=Event.WRITING_PHASE_CHOICES,
+        default='facts'
+    )
+    summary = models.TextField(blank=True)
+    # Highest ChatMessage id folded into the summary; newer messages are sent verbatim
+    last_message_id = models.BigIntegerField(default=0)
+    message_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_thread', 'phase'], name='summary_thread_phase_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Summary of thread {self.user_thread_id} ({self.phase})"
+
+class LLMJob(models.Model):
+    """Queued LLM work picked up by the `run_llm_worker` management command"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='llm_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+class PhaseTransition(models.Model):
+    """One step of an event through the writing phases (see chatbot/phases.py)"""
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='phase_transitions')
+    user_thread = models.ForeignKey(UserThread, on_delete=models.SET_NULL, null=True, blank=True)
+    from_phase = models.CharField(max_length=20, choices=Event.WRITING_PHASE_CHOICES)
+    to_phase = models.CharField(max_length=20, choices=Event.WRITING_PHASE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['event', '-created_at'], name='phase_transition_event_idx'),
+            models.Index(fields=['to_phase', 'created_at'], name='phase_transition_phase_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_id}: {self.from_phase} -> {self.to_phase}"
+
+class AdmissionSlot(models.Model):
+    """One place in the shared LLM concurrency limit or its wait queue (see chatbot/admission.py)"""
+    POOL_CHOICES = [
+        ('run', 'Running'),
+        ('queue', 'Waiting'),
+    ]
+
+    pool = models.CharField(max_length=10, choices=POOL_CHOICES)
+    number = models.PositiveIntegerField()
+    holder = models.CharField(max_length=32, blank=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pool', 'number'], name='admission_slot_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.pool} slot {self.number} ({self.holder or 'free'})"
+
+class RateLimitBucket(models.Model):
+    """Token bucket limiting how often one user can start LLM requests"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='rate_limit_bucket')
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id}: {self.tokens:.2f} tokens"
 
 # Signal to create UserProfile when a new User is created
 @receiver(post_save, sender=User)
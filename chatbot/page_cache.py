@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.db.models import Count, Max
+from .models import Event
+import hashlib
+
+# Conditional GET and fragment cache versions for the event and chat pages.
+#
+# Each page is identified by a small "state" read with one aggregate query: the
+# newest Event.updated_at (phase changes and edits bump it) and, for an event,
+# the newest ChatSession.timestamp, plus row counts so deletions show up too
+# and the event's id, since two events can share an updated_at.
+# The state feeds the ETag and Last-Modified of the condition() decorator, so
+# an unchanged page costs that one query and a 304. On a 200 the same state is
+# passed to the template as `page_version`, the key of its {% cache %} fragments.
+# RELEASE_VERSION is part of every key, so a deploy with new templates doesn't
+# serve old markup, and so is the CSRF secret, since the fragments contain forms
+# whose tokens stop working when it is rotated at login. Pages with flash
+# messages pending are always rendered.
+
+STATE_ATTR = '_page_state'
+
+
+def _state(request, compute):
+    """Compute the page state once per request; the view and both validators share it"""
+    if not hasattr(request, STATE_ATTR):
+        setattr(request, STATE_ATTR, compute())
+    return getattr(request, STATE_ATTR)
+
+
+def event_list_state(request):
+    return _state(request, lambda: {
+        **Event.objects.filter(user=request.user).aggregate(updated=Max('updated_at'), count=Count('id')),
+        'event_id': None,
+    })
+
+
+def event_detail_state(request, event_id):
+    def compute():
+        event = Event.objects.filter(id=event_id, user=request.user).order_by().annotate(
+            last_session=Max('chat_sessions__timestamp'), sessions=Count('chat_sessions')
+        ).values('updated_at', 'last_session', 'sessions').first()
+        if event is None:
+            return None
+        return {
+            'updated': max(filter(None, [event['updated_at'], event['last_session']])),
+            'count': event['sessions'],
+            'event_id': int(event_id),
+        }
+    return _state(request, compute)
+
+
+def chat_state(request):
+    def compute():
+        event_id = request.GET.get('event_id')
+        if not event_id:
+            return {'updated': None, 'count': 0, 'event_id': None}
+        if not event_id.isdigit():
+            return None
+        updated = Event.objects.filter(id=event_id, user=request.user).values_list('updated_at', flat=True).first()
+        return {'updated': updated, 'count': 1, 'event_id': int(event_id)} if updated else None
+    return _state(request, compute)
+
+
+def page_version(request, state, *parts):
+    """Hash of everything a page's markup depends on besides the templates"""
+    # get_token makes sure the secret exists before a cached form is served
+    get_token(request)
+    raw = "|".join(str(part) for part in (
+        settings.RELEASE_VERSION, request.META['CSRF_COOKIE'], request.user.pk,
+        state['event_id'], state['updated'], state['count'], *parts
+    ))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def fragment_context(request, state, *parts):
+    """Template context for the page's {% cache %} fragments"""
+    return {'page_version': page_version(request, state, *parts), 'fragment_ttl': settings.FRAGMENT_CACHE_TTL}
+
+
+def _cacheable(request):
+    # Pending flash messages are shown once, so that response can't be reused
+    return request.method in ('GET', 'HEAD') and not len(get_messages(request))
+
+
+def validators(state_func, *query_params):
+    """(etag_func, last_modified_func) for condition(), built on a page state function"""
+    def etag(request, *args, **kwargs):
+        if not _cacheable(request):
+            return None
+        state = state_func(request, *args, **kwargs)
+        if state is None:
+            return None
+        return page_version(request, state, *(request.GET.get(param, '') for param in query_params))
+
+    def last_modified(request, *args, **kwargs):
+        if not _cacheable(request):
+            return None
+        state = state_func(request, *args, **kwargs)
+        return state['updated'] if state else None
+
+    return etag, last_modified
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import Event, PhaseTransition
+from .user_cache import forget_event
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The writing flow is a linear state machine over Event.WRITING_PHASE_CHOICES.
+# The assistant ends a phase by writing PHASE_COMPLETE_MARKER; each advance
+# updates Event.current_phase and is logged as a PhaseTransition row, so the
+# current phase and its history are read from the database instead of being
+# inferred from message text.
+
+PHASES = [phase for phase, _ in Event.WRITING_PHASE_CHOICES]
+NEXT_PHASE = dict(zip(PHASES, PHASES[1:]))
+PHASE_COMPLETE_MARKER = "PHASE_COMPLETE:"
+
+
+def next_phase(phase):
+    """The phase after this one, or None for the last phase"""
+    return NEXT_PHASE.get(phase)
+
+
+def has_completion_marker(text):
+    return PHASE_COMPLETE_MARKER in text
+
+
+class MarkerDetector:
+    """Spots the completion marker in a token stream, even when split across tokens.
+
+    Only the last len(marker) - 1 characters are kept between calls, so each
+    token is checked in time proportional to its own length.
+    """
+
+    def __init__(self, marker=PHASE_COMPLETE_MARKER):
+        self.marker = marker
+        self.tail = ""
+        self.found = False
+
+    def feed(self, token):
+        if not self.found:
+            window = self.tail + token
+            self.found = self.marker in window
+            self.tail = window[-(len(self.marker) - 1):]
+        return self.found
+
+
+def advance_phase(event, from_phase, user_thread=None):
+    """Move the event from from_phase to the next phase and log the transition.
+
+    Returns the PhaseTransition, or None if from_phase is the last phase or the
+    event is no longer in from_phase (another turn advanced it first).
+    """
+    to_phase = next_phase(from_phase)
+    if to_phase is None:
+        return None
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Only the columns that change are written, and only from the expected state
+        updated = Event.objects.filter(id=event.id, current_phase=from_phase).update(
+            current_phase=to_phase,
+            updated_at=now
+        )
+        if not updated:
+            return None
+        transition = PhaseTransition.objects.create(
+            event=event,
+            user_thread=user_thread,
+            from_phase=from_phase,
+            to_phase=to_phase
+        )
+        # update() skips the post_save signal that clears the user cache
+        transaction.on_commit(lambda: forget_event(event))
+
+    event.current_phase = to_phase
+    event.updated_at = now
+    logger.info(f"Event {event.id} moved from {from_phase} to {to_phase}")
+    return transition
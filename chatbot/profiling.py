@@ -0,0 +1,151 @@
+from collections import deque
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.base import Template
+from django.utils import timezone
+import contextvars
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Sampled request profiling. When PROFILING_SAMPLE_RATE is above zero,
+# ProfilingMiddleware profiles that fraction of requests: ORM query count and
+# time, template render time, and a cProfile summary of the functions with the
+# most cumulative time. Each sample is added to an in-process ring buffer of the
+# last PROFILING_BUFFER_SIZE samples, which staff can download from
+# /admin/profiles/. With the rate at zero the middleware removes itself at
+# startup and Template.render is left unpatched, so unsampled requests pay one
+# random() call at most.
+#
+# Only one cProfile profiler can run at a time; a sample that overlaps another
+# one on a different thread still records queries and templates, without a stack.
+
+_current_sample = contextvars.ContextVar('profiling_sample', default=None)
+_profiler_lock = threading.Lock()
+_original_template_render = Template.render
+
+
+class ProfileBuffer:
+    """The most recent profiling samples"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+
+    def clear(self):
+        with self._lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.samples)
+
+
+profiles = ProfileBuffer(settings.PROFILING_BUFFER_SIZE)
+
+
+class Sample:
+    """Query, template and timing figures for one profiled request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_ms = 0.0
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_ms += (time.perf_counter() - started) * 1000
+
+
+def _timed_template_render(self, context):
+    sample = _current_sample.get()
+    if sample is None:
+        return _original_template_render(self, context)
+    # Included and extended templates render inside their parent; only the outermost is timed
+    sample.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_template_render(self, context)
+    finally:
+        sample.template_depth -= 1
+        if not sample.template_depth:
+            sample.template_ms += (time.perf_counter() - started) * 1000
+
+
+def format_stats(profiler, lines):
+    """The top functions by cumulative time, as pstats prints them"""
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative').print_stats(lines)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """Profile a random PROFILING_SAMPLE_RATE fraction of requests"""
+
+    def __init__(self, get_response):
+        self.rate = settings.PROFILING_SAMPLE_RATE
+        if self.rate <= 0:
+            raise MiddlewareNotUsed("Request profiling is disabled")
+        self.get_response = get_response
+        Template.render = _timed_template_render
+        logger.info(f"Profiling {self.rate:.2%} of requests")
+
+    def __call__(self, request):
+        if random.random() >= self.rate:
+            return self.get_response(request)
+        return self.profile(request)
+
+    def profile(self, request):
+        sample = Sample()
+        token = _current_sample.set(sample)
+        profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(sample):
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    profiler.enable()
+                    try:
+                        response = self.get_response(request)
+                    finally:
+                        profiler.disable()
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            if profiler is not None:
+                _profiler_lock.release()
+            _current_sample.reset(token)
+
+        match = request.resolver_match
+        user = getattr(request, 'user', None)
+        profiles.add({
+            'at': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'user_id': user.id if user is not None and user.is_authenticated else None,
+            'total_ms': round(total_ms, 2),
+            'queries': sample.queries,
+            'db_ms': round(sample.db_ms, 2),
+            'template_ms': round(sample.template_ms, 2),
+            'stack': format_stats(profiler, settings.PROFILING_STACK_LINES) if profiler is not None else None,
+        })
+        return response
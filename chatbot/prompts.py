@@ -0,0 +1,128 @@
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import UserProfile
+from .context_window import count_message_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+BASE_INSTRUCTIONS = """Your role is to guide users through four distinct writing phases:
+
+1. Factual Description: Help users objectively describe what happened, focusing on the concrete details.
+2. Emotional Response: Guide users to explore and express their feelings about the event.
+3. Behavioral Associations: Help users connect the event to their behaviors, patterns, and potential future actions.
+4. Positive Reframing & Growth: Guide users to:
+   - Identify positive aspects or potential benefits from the experience
+   - Reflect on personal growth and lessons learned
+   - Set goals or action steps for future improvement
+   - Find meaning or purpose in their experience
+
+For each phase:
+- Guide users with appropriate prompts and questions for that specific phase
+- Evaluate when they've adequately completed the current phase
+- When you feel they're ready to move to the next phase, respond with: "PHASE_COMPLETE: [current_phase]"
+"""
+
+PERSONALITY_STYLES = {
+    'friendly': """Maintain a warm, casual, and approachable tone. Use informal language,
+        share occasional light-hearted comments, and make the writing process feel fun and engaging.
+        Feel free to use encouraging emojis and conversational phrases.""",
+
+    'professional': """Maintain a formal, academic tone. Use precise language and professional terminology.
+        Focus on structured analysis and methodical progression through the writing phases.
+        Provide clear, well-organized guidance with academic references when relevant.""",
+
+    'encouraging': """Be highly motivational and energetic. Celebrate small wins, provide frequent positive reinforcement,
+        and maintain an upbeat, supportive tone throughout the conversation. Focus on building confidence
+        and maintaining momentum."""
+}
+
+PHASE_PROMPTS = {
+    'facts': "Let's focus on describing the factual details of this event. What happened? When? Where? Who was involved?",
+    'feelings': "Now, let's explore your emotional response to this event. How did you feel during and after?",
+    'thoughts': "Let's examine your thoughts and behaviors associated with this event. What patterns do you notice?",
+    'growth': "Finally, let's reflect on personal growth. How has this experience shaped you? What strengths or insights have you gained?"
+}
+
+DEFAULT_PHASE_PROMPT = "Let's begin your writing session."
+
+# Base instructions plus tone, compiled once per personality
+SYSTEM_PROMPTS = {
+    personality: f"{BASE_INSTRUCTIONS}\n\nTone and Style:\n{style}"
+    for personality, style in PERSONALITY_STYLES.items()
+}
+
+USER_CONTEXT_CACHE_KEY = 'prompt-user-context:{user_id}'
+
+
+def get_personality_instructions(personality):
+    return SYSTEM_PROMPTS.get(personality, SYSTEM_PROMPTS['friendly'])
+
+
+def get_user_context(profile):
+    """Get the profile's biographical context and writing goals, memoized per profile"""
+    key = USER_CONTEXT_CACHE_KEY.format(user_id=profile.user_id)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == profile.updated_at:
+        return cached[1]
+
+    context = []
+    if profile.bio_context:
+        context.append(f"Bio: {profile.bio_context}")
+    if profile.writing_goals:
+        context.append(f"Writing Goals: {profile.writing_goals}")
+    fragment = "\n".join(context) if context else None
+
+    cache.set(key, (profile.updated_at, fragment), timeout=None)
+    return fragment
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_user_context(sender, instance, **kwargs):
+    cache.delete(USER_CONTEXT_CACHE_KEY.format(user_id=instance.user_id))
+
+
+def build_system_prompt(profile, event=None, phase=None):
+    system_prompt = get_personality_instructions(profile.personality_preference)
+
+    user_context = get_user_context(profile)
+    if user_context:
+        system_prompt += f"\n\nUser Context:\n{user_context}"
+
+    if event:
+        system_prompt += f"\n\nCurrent Event: {event.title}"
+        system_prompt += f"\nCurrent Phase: {phase or event.current_phase}"
+    return system_prompt
+
+
+def build_turn_messages(profile, event, phase, history, message, summary=None, snippets=None):
+    """Message list for a chat turn: system prompt, phase summary, prior turns, then the new message"""
+    system_prompt = build_system_prompt(profile, event, phase)
+    if snippets:
+        system_prompt += "\n\nRelevant excerpts from the user's earlier writing:\n"
+        system_prompt += "\n".join(f"- {snippet}" for snippet in snippets)
+    if summary:
+        system_prompt += f"\n\nSummary of the conversation so far in this phase:\n{summary}"
+    messages = [{"role": "system", "content": system_prompt}]
+    for prev_msg in history:
+        messages.append({
+            "role": "user" if prev_msg.message_type == "user" else "assistant",
+            "content": prev_msg.content
+        })
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def build_opening_messages(profile, event):
+    """Message list for the assistant's opening turn of a writing session"""
+    initial_prompt = PHASE_PROMPTS.get(event.current_phase, DEFAULT_PHASE_PROMPT)
+    return [
+        {"role": "system", "content": build_system_prompt(profile, event)},
+        {"role": "assistant", "content": initial_prompt}
+    ]
+
+
+def prompt_size(messages):
+    """Prompt size in tokens, as counted by the context window manager"""
+    return count_message_tokens(messages)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.cache import caches
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cache of LLM completions keyed by a hash of the exact request. Used for the
+# opening turn of a writing session, whose input depends only on the profile,
+# the event and the phase. The backend is whatever the LLM_RESPONSE_CACHE
+# alias in settings.CACHES points at (local memory, file or database).
+
+
+def get_response_cache():
+    return caches[settings.LLM_RESPONSE_CACHE]
+
+
+def completion_cache_key(messages, **params):
+    """Stable key for a completion request: model params plus the full message list"""
+    params.setdefault('model', settings.OPENAI_MODEL)
+    payload = json.dumps({'messages': messages, 'params': params}, sort_keys=True)
+    return 'completion:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_completion(messages, **params):
+    key = completion_cache_key(messages, **params)
+    content = get_response_cache().get(key)
+    if content is not None:
+        logger.info(f"Completion cache hit {key[:20]}")
+    return content
+
+
+def set_cached_completion(messages, content, **params):
+    key = completion_cache_key(messages, **params)
+    get_response_cache().set(key, content, timeout=settings.LLM_RESPONSE_CACHE_TTL)
+
@@ -0,0 +1,259 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from functools import lru_cache
+from pathlib import Path
+from .context_window import count_tokens
+from .jobs import enqueue_job
+from .models import ChatMessage, Event, LLMJob
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Retrieval of relevant snippets from a user's earlier writing. A background
+# pass embeds the user's own chat messages and their event descriptions into a
+# per-user index: one .npy file of fixed-size records (kind, object id, event
+# id, float16 vector), opened memory-mapped at query time. At prompt time the
+# latest message is embedded and the closest snippets from *other* events (the
+# current event is already covered by its summary and recent turns) are added
+# to the system prompt within RETRIEVAL_TOKEN_BUDGET.
+#
+# The pass runs after every chat turn but only rewrites the index when the
+# events changed (a hash of them is kept beside the index) or when
+# RETRIEVAL_INDEX_BATCH new messages have accumulated. New messages mostly
+# belong to the current event, which retrieval skips anyway, and a new event
+# changes the hash, so the last event's messages are in before its first turn.
+#
+# EMBEDDING_FUNCTION is a dotted path to a function(texts, dim) returning an
+# array of shape (len(texts), dim). The default hashes words into buckets, so
+# it needs no model download and runs offline.
+#
+# numpy is imported inside the functions that use it, so importing this module
+# (and the views that do) stays cheap at worker boot.
+
+KIND_EVENT = 0
+KIND_MESSAGE = 1
+TOKEN_RE = re.compile(r"\w+")
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embeddings')
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def hashing_embedding(texts, dim):
+    """Signed feature hashing of lowercase words"""
+    import numpy as np
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in TOKEN_RE.findall(text.lower()):
+            value = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+            vectors[row, value % dim] += 1.0 if value >> 63 else -1.0
+    return vectors
+
+
+@lru_cache(maxsize=1)
+def get_embedding_function():
+    return import_string(settings.EMBEDDING_FUNCTION)
+
+
+def embed(texts):
+    """Unit-length float32 embeddings for a list of texts"""
+    import numpy as np
+    vectors = np.asarray(get_embedding_function()(texts, settings.EMBEDDING_DIM), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def index_dtype():
+    import numpy as np
+    return np.dtype([
+        ('kind', 'u1'),
+        ('object_id', 'i8'),
+        ('event_id', 'i8'),
+        ('vector', 'f2', (settings.EMBEDDING_DIM,)),
+    ])
+
+
+def index_path(user_id):
+    return Path(settings.EMBEDDING_INDEX_DIR) / f"user-{user_id}.npy"
+
+
+def load_index(user_id):
+    """The user's index as a read-only memory map, or None if it has not been built"""
+    import numpy as np
+    path = index_path(user_id)
+    try:
+        index = np.load(path, mmap_mode='r')
+    except FileNotFoundError:
+        return None
+    if index.dtype != index_dtype():
+        logger.warning(f"Ignoring embedding index {path} built with different settings")
+        return None
+    return index
+
+
+def _records(kind, object_ids, event_ids, texts):
+    import numpy as np
+    records = np.zeros(len(texts), dtype=index_dtype())
+    if texts:
+        records['kind'] = kind
+        records['object_id'] = object_ids
+        records['event_id'] = event_ids
+        records['vector'] = embed(texts)
+    return records
+
+
+def events_hash_path(user_id):
+    return index_path(user_id).with_suffix('.events')
+
+
+def update_index(user_id, batch=None):
+    """Embed the user's changed events and the messages added since the last pass.
+
+    The index is only rewritten when the events changed or at least `batch`
+    (default RETRIEVAL_INDEX_BATCH) new messages are waiting. Returns the number
+    of records in the index.
+    """
+    import numpy as np
+    batch = settings.RETRIEVAL_INDEX_BATCH if batch is None else batch
+    existing = load_index(user_id)
+    events = list(Event.objects.filter(user_id=user_id).order_by('id').values_list('id', 'title', 'description'))
+    events_hash = hashlib.sha1(repr(events).encode('utf-8')).hexdigest()
+    hash_path = events_hash_path(user_id)
+    events_changed = existing is None or not hash_path.exists() or hash_path.read_text() != events_hash
+    if existing is None:
+        existing = np.zeros(0, dtype=index_dtype())
+
+    # Messages never change: keep the embedded ones and look for newer ones
+    message_records = existing[existing['kind'] == KIND_MESSAGE]
+    last_message_id = int(message_records['object_id'].max()) if len(message_records) else 0
+    new_messages = ChatMessage.objects.filter(
+        user_thread__user_id=user_id, message_type='user', id__gt=last_message_id
+    ).exclude(content='')
+    if not events_changed and new_messages.count() < max(batch, 1):
+        return len(existing)
+
+    if events_changed:
+        event_ids = [event_id for event_id, _, _ in events]
+        event_records = _records(
+            KIND_EVENT, event_ids, event_ids,
+            [f"{title}\n{description}" for _, title, description in events]
+        )
+        # Drop the messages of deleted events
+        message_records = message_records[np.isin(message_records['event_id'], event_ids)]
+    else:
+        event_records = existing[existing['kind'] == KIND_EVENT]
+
+    new_messages = list(new_messages.order_by('id').values_list('id', 'user_thread__event_id', 'content'))
+    new_records = _records(
+        KIND_MESSAGE,
+        [msg_id for msg_id, _, _ in new_messages],
+        [event_id for _, event_id, _ in new_messages],
+        [content for _, _, content in new_messages]
+    )
+
+    index = np.concatenate([event_records, message_records, new_records])
+    path = index_path(user_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write beside the live file and swap it in, so readers never see a partial index
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.npy')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, index)
+    os.replace(tmp_path, path)
+    # Written after the index, so a failed pass re-embeds the events next time
+    hash_path.write_text(events_hash)
+    logger.info(f"Embedding index for user {user_id}: {len(index)} records ({len(new_records)} new messages"
+                f"{', events re-embedded' if events_changed else ''})")
+    return len(index)
+
+
+def schedule_index_update(user_id):
+    """Bring the user's index up to date in the background after this transaction commits"""
+    if settings.LLM_BACKGROUND_JOBS:
+        queued = LLMJob.objects.filter(
+            kind='embeddings', status__in=['pending', 'running'], payload__user_id=user_id
+        ).exists()
+        if not queued:
+            enqueue_job('embeddings', {'user_id': user_id})
+        return
+    transaction.on_commit(lambda: _submit_update(user_id))
+
+
+def _submit_update(user_id):
+    with _in_flight_lock:
+        if user_id in _in_flight:
+            return
+        _in_flight.add(user_id)
+    _executor.submit(_run_update, user_id)
+
+
+def _run_update(user_id):
+    close_old_connections()
+    try:
+        update_index(user_id)
+    except Exception as e:
+        logger.error(f"Error updating embedding index for user {user_id}: {str(e)}", exc_info=True)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(user_id)
+        close_old_connections()
+
+
+def retrieve_snippets(user, text, current_event=None, k=None, budget=None):
+    """Up to k snippets of the user's earlier writing most similar to text, within a token budget"""
+    import numpy as np
+    k = settings.RETRIEVAL_TOP_K if k is None else k
+    budget = settings.RETRIEVAL_TOKEN_BUDGET if budget is None else budget
+    index = load_index(user.id)
+    if index is None or not len(index) or not k:
+        return []
+
+    scores = np.asarray(index['vector'], dtype=np.float32) @ embed([text])[0]
+    if current_event is not None:
+        scores[(index['kind'] == KIND_MESSAGE) & (index['event_id'] == current_event.id)] = -np.inf
+    candidates = min(len(scores), k * 4)
+    top = np.argpartition(-scores, candidates - 1)[:candidates]
+    top = top[np.argsort(-scores[top])]
+    top = top[scores[top] >= settings.RETRIEVAL_MIN_SCORE]
+    if not len(top):
+        return []
+
+    hits = index[top]
+    message_ids = hits['object_id'][hits['kind'] == KIND_MESSAGE].tolist()
+    messages = ChatMessage.objects.filter(
+        id__in=message_ids, user_thread__user=user
+    ).only('id', 'content').in_bulk()
+    events = Event.objects.filter(
+        id__in=hits['event_id'].tolist(), user=user
+    ).only('id', 'title', 'description').in_bulk()
+
+    snippets = []
+    used = 0
+    for kind, object_id, event_id in zip(hits['kind'].tolist(), hits['object_id'].tolist(), hits['event_id'].tolist()):
+        event = events.get(event_id)
+        if event is None:
+            continue
+        if kind == KIND_EVENT:
+            body = event.description
+        elif object_id in messages:
+            body = messages[object_id].content
+        else:
+            continue
+        if not body:
+            continue
+        body = body if len(body) <= settings.RETRIEVAL_SNIPPET_CHARS else body[:settings.RETRIEVAL_SNIPPET_CHARS] + "..."
+        snippet = f"[{event.title}] {body}"
+        tokens = count_tokens(snippet)
+        if used + tokens > budget:
+            continue
+        snippets.append(snippet)
+        used += tokens
+        if len(snippets) >= k:
+            break
+    return snippets
@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from .models import ChatMessage, ChatSessionMessage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Full-text search over chat messages and saved session transcripts.
+#
+# On PostgreSQL each table has a GIN index on to_tsvector(SEARCH_CONFIG, content),
+# which the database keeps current on every insert; queries use websearch syntax
+# and are ranked with ts_rank. On SQLite each table has an external-content FTS5
+# table kept in sync by triggers and ranked with bm25(). Other databases fall
+# back to an unranked substring match. Migration 0017 creates the indexes;
+# the SQLite statements below only restore triggers that a later table rebuild
+# dropped.
+
+SEARCHABLE_TABLES = {
+    'messages': ChatMessage._meta.db_table,
+    'sessions': ChatSessionMessage._meta.db_table,
+}
+
+
+def _fts_table(table):
+    return f"{table}_fts"
+
+
+def _sqlite_statements(table):
+    fts = _fts_table(table)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(content, content='{table}', content_rowid='id')",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content);
+        END""",
+    ]
+
+
+def _sqlite_triggers_complete(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+            [table, f"{_fts_table(table)}_%"]
+        )
+        return cursor.fetchone()[0] == 3
+
+
+def _install_sqlite(schema_editor, table):
+    fts = _fts_table(table)
+    for statement in _sqlite_statements(table):
+        schema_editor.execute(statement)
+    # Index whatever is already in the content table
+    schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+@receiver(post_migrate)
+def repair_search_index(sender, app_config=None, using='default', **kwargs):
+    """SQLite drops a table's triggers when a migration rebuilds it; restore them"""
+    db = connections[using]
+    if app_config is None or app_config.label != 'chatbot' or db.vendor != 'sqlite':
+        return
+    existing = set(db.introspection.table_names())
+    for table in SEARCHABLE_TABLES.values():
+        if _fts_table(table) in existing and not _sqlite_triggers_complete(db, table):
+            logger.warning(f"Restoring full-text search triggers on {table}")
+            with db.schema_editor() as schema_editor:
+                _install_sqlite(schema_editor, table)
+
+
+def fts5_query(text):
+    """Quote each term so user input can't inject FTS5 query syntax; terms are ANDed"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in text.split())
+
+
+def _owned(kind, user):
+    if kind == 'messages':
+        return ChatMessage.objects.filter(user_thread__user=user)
+    return ChatSessionMessage.objects.filter(session__event__user=user).select_related('session')
+
+
+def search(user, kind, text, offset=0, limit=None):
+    """Ranked hits for text among the user's messages or saved sessions.
+
+    Returns (hits, has_more). Each hit has a `rank` attribute; higher is better.
+    """
+    limit = limit or settings.SEARCH_RESULTS_PER_PAGE
+    queryset = _owned(kind, user)
+    vendor = connection.vendor
+
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+        vector = SearchVector('content', config=settings.SEARCH_CONFIG)
+        query = SearchQuery(text, config=settings.SEARCH_CONFIG, search_type='websearch')
+        hits = list(
+            queryset.annotate(document=vector, rank=SearchRank(vector, query))
+            .filter(document=query)
+            .order_by('-rank', '-id')[offset:offset + limit + 1]
+        )
+    elif vendor == 'sqlite':
+        table = SEARCHABLE_TABLES[kind]
+        fts = _fts_table(table)
+        owned_ids = queryset.values('id')
+        owned_sql, owned_params = owned_ids.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid IN ({owned_sql}) "
+                f"ORDER BY bm25({fts}), rowid DESC LIMIT %s OFFSET %s",
+                [fts5_query(text), *owned_params, limit + 1, offset]
+            )
+            ranked = cursor.fetchall()
+        rows = queryset.in_bulk([row_id for row_id, _ in ranked])
+        hits = []
+        for row_id, rank in ranked:
+            if row_id in rows:
+                rows[row_id].rank = rank
+                hits.append(rows[row_id])
+    else:
+        logger.warning(f"No full-text index for {vendor}, using a substring match")
+        hits = list(queryset.filter(content__icontains=text).order_by('-id')[offset:offset + limit + 1])
+        for hit in hits:
+            hit.rank = None
+
+    return hits[:limit], len(hits) > limit
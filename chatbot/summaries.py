@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce
+from .llm import get_llm_client
+from .telemetry import track_llm_call
+from .jobs import enqueue_job
+from .models import ChatMessage, ConversationSummary, LLMJob, UserThread
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Rolling per-thread, per-phase conversation summaries. Once a phase has
+# CHAT_SUMMARY_INTERVAL messages that are not yet summarized, everything but the
+# latest CHAT_SUMMARY_KEEP_RECENT of them is folded into the stored summary in a
+# background thread, or as an LLM job when LLM_BACKGROUND_JOBS is on. Prompts
+# then carry the summary of the event's active thread plus only the turns it
+# doesn't cover.
+#
+# The in-flight set only stops one process from folding the same messages
+# twice; across processes the fold is saved with an UPDATE conditional on the
+# last_message_id it started from, so of two concurrent folds only the first
+# is kept and the other's messages are not counted twice.
+
+SUMMARY_PROMPT = """You maintain a concise running summary of an expressive writing conversation.
+Update the existing summary with the new messages. Keep the facts, feelings and insights the
+user shared and any guidance already given. Write in the third person, at most {max_words} words.
+
+Existing summary:
+{summary}
+
+New messages:
+{transcript}"""
+
+_executor = ThreadPoolExecutor(max_workers=settings.CHAT_SUMMARY_WORKERS, thread_name_prefix='summaries')
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def _active_thread_summary(user, event, phase):
+    # The active thread (see user_cache.get_active_thread) is read in a subquery
+    active_thread = UserThread.objects.filter(user=user, event=event).order_by('-created_at').values('id')[:1]
+    return ConversationSummary.objects.filter(user_thread_id=Subquery(active_thread), phase=phase)
+
+
+def get_phase_summary(user, event, phase):
+    """Summary of this phase in the event's active thread, the one new turns are saved to, or None"""
+    return _active_thread_summary(user, event, phase).first()
+
+
+async def aget_phase_summary(user, event, phase):
+    """Async version of get_phase_summary"""
+    return await _active_thread_summary(user, event, phase).afirst()
+
+
+def unsummarized(chat_messages, summary):
+    """Exclude the messages folded into summary; those of other threads are kept"""
+    if summary is None:
+        return chat_messages
+    return chat_messages.exclude(user_thread_id=summary.user_thread_id, id__lte=summary.last_message_id)
+
+
+def maybe_schedule_summary(user_thread, phase):
+    """Queue a summary update if enough new messages have accumulated"""
+    # One query: the summary's high-water mark is read in a subquery
+    last_message_id = ConversationSummary.objects.filter(
+        user_thread=user_thread, phase=phase
+    ).values('last_message_id')[:1]
+    pending = ChatMessage.objects.filter(
+        user_thread=user_thread, phase=phase,
+        id__gt=Coalesce(Subquery(last_message_id), 0)
+    ).count()
+    if pending < settings.CHAT_SUMMARY_INTERVAL:
+        return False
+
+    if settings.LLM_BACKGROUND_JOBS:
+        payload = {'user_thread_id': user_thread.id, 'phase': phase}
+        queued = LLMJob.objects.filter(
+            kind='summary', status__in=['pending', 'running'],
+            payload__user_thread_id=user_thread.id, payload__phase=phase
+        ).exists()
+        if not queued:
+            enqueue_job('summary', payload, user=user_thread.user)
+        return not queued
+
+    transaction.on_commit(lambda: _submit_update(user_thread.id, phase))
+    return True
+
+
+def _submit_update(user_thread_id, phase):
+    key = (user_thread_id, phase)
+    with _in_flight_lock:
+        if key in _in_flight:
+            return
+        _in_flight.add(key)
+    _executor.submit(_run_update, user_thread_id, phase)
+
+
+def _run_update(user_thread_id, phase):
+    close_old_connections()
+    try:
+        update_summary(user_thread_id, phase)
+    except Exception as e:
+        logger.error(f"Error updating summary for thread {user_thread_id}, phase {phase}: {str(e)}", exc_info=True)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard((user_thread_id, phase))
+        close_old_connections()
+
+
+def update_summary(user_thread_id, phase):
+    """Fold all but the most recent unsummarized messages into the summary"""
+    summary, created = ConversationSummary.objects.get_or_create(
+        user_thread_id=user_thread_id, phase=phase
+    )
+    new_messages = list(
+        ChatMessage.objects.filter(
+            user_thread_id=user_thread_id, phase=phase, id__gt=summary.last_message_id
+        ).only('id', 'message_type', 'content').order_by('created_at', 'id')
+    )
+    to_fold = new_messages[:len(new_messages) - settings.CHAT_SUMMARY_KEEP_RECENT]
+    if not to_fold:
+        return summary
+
+    transcript = "\n".join(f"{msg.message_type}: {msg.content}" for msg in to_fold)
+    with track_llm_call('summary', phase=phase):
+        response = get_llm_client().chat_completion(
+            [{"role": "user", "content": SUMMARY_PROMPT.format(
+                max_words=settings.CHAT_SUMMARY_MAX_WORDS,
+                summary=summary.summary or "(none yet)",
+                transcript=transcript,
+            )}],
+            temperature=0.3,
+            max_tokens=settings.CHAT_SUMMARY_MAX_WORDS * 2
+        )
+
+    folded = ConversationSummary.objects.filter(
+        id=summary.id, last_message_id=summary.last_message_id
+    ).update(
+        summary=response.choices[0].message.content.strip(),
+        last_message_id=to_fold[-1].id,
+        message_count=F('message_count') + len(to_fold),
+        updated_at=timezone.now(),
+    )
+    summary.refresh_from_db()
+    if not folded:
+        logger.info(f"Summary for thread {user_thread_id}, phase {phase} was updated concurrently; discarding this fold")
+        return summary
+    logger.info(f"Summarized {len(to_fold)} messages for thread {user_thread_id}, phase {phase}")
+    return summary
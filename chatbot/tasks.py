@@ -0,0 +1,51 @@
+from .jobs import job_handler
+from .llm import get_llm_client
+from .models import Event, UserThread
+from .summaries import update_summary
+from .telemetry import track_llm_call
+from .retrieval import update_index
+from .views import build_chat_messages, save_chat_turn, create_opening_message
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Handlers for the LLM job queue, one per job kind. Each receives the LLMJob
+# and returns a JSON-serializable result stored on the job.
+
+
+@job_handler('opening_turn')
+def run_opening_turn(job):
+    event = Event.objects.get(id=job.payload['event_id'], user=job.user)
+    user_thread = UserThread.objects.get(id=job.payload['user_thread_id'], user=job.user)
+    return {'response': create_opening_message(job.user, event, user_thread)}
+
+
+@job_handler('chat_turn')
+def run_chat_turn(job):
+    message = job.payload['message']
+    with track_llm_call('chat_turn', job.user) as call:
+        with call.stage('prompt'):
+            messages, current_event, active_phase = build_chat_messages(
+                job.user, message, job.payload.get('event_id'), job.payload.get('phase')
+            )
+        call.set_context(current_event, active_phase)
+        response = get_llm_client().chat_completion(
+            messages,
+            temperature=0.7,
+            max_tokens=1000
+        )
+        assistant_message = response.choices[0].message.content
+        if current_event:
+            save_chat_turn(job.user, current_event, active_phase, message, assistant_message)
+    return {'response': assistant_message}
+
+
+@job_handler('summary')
+def run_summary(job):
+    summary = update_summary(job.payload['user_thread_id'], job.payload['phase'])
+    return {'summary_id': summary.id, 'message_count': summary.message_count}
+
+
+@job_handler('embeddings')
+def run_embeddings(job):
+    return {'records': update_index(job.payload['user_id'])}
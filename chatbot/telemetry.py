@@ -0,0 +1,214 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import contextvars
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+# Structured sink: one JSON object per LLM-backed request (see LOGGING in settings)
+record_logger = logging.getLogger('chatbot.telemetry.calls')
+
+# Instrumentation for LLM-backed requests. A view wraps its work in an LLMCall;
+# while the call is active, database time is added up by an execute wrapper on
+# every connection, and LLMClient reports upstream latency, time to first
+# token, attempts and token usage into it. When the call finishes, its record
+# is logged as JSON and added to an in-process aggregator that reports
+# p50/p95/p99 latencies and token totals per kind, model, phase and user.
+# LLM calls made outside an LLMCall (summaries, for example) are recorded as
+# standalone 'completion' calls.
+
+_current_call = contextvars.ContextVar('llm_call', default=None)
+
+LATENCY_METRICS = ['total_ms', 'upstream_ms', 'ttft_ms', 'prompt_ms', 'db_ms']
+PERCENTILES = [50, 95, 99]
+
+
+def current_call():
+    """The LLMCall active in this context, or None"""
+    return _current_call.get()
+
+
+class LLMCall:
+    """Timings, usage and outcome of one LLM-backed request"""
+
+    def __init__(self, kind, user=None, event=None, phase=None):
+        self.record = {
+            'kind': kind,
+            'user_id': getattr(user, 'id', None),
+            'event_id': getattr(event, 'id', None),
+            'phase': phase,
+            'model': None,
+            'outcome': None,
+            'error': None,
+            'attempts': 0,
+            'total_ms': None,
+            'prompt_ms': None,
+            'db_ms': 0.0,
+            'upstream_ms': None,
+            'ttft_ms': None,
+            'prompt_tokens': None,
+            'completion_tokens': None,
+        }
+        self._started = time.perf_counter()
+        self._upstream_started = None
+        self._finished = False
+
+    def set_context(self, event=None, phase=None):
+        if event is not None:
+            self.record['event_id'] = event.id
+        if phase is not None:
+            self.record['phase'] = phase
+
+    @contextmanager
+    def active(self):
+        """Attribute DB time and LLM client reports in this block to the call"""
+        token = _current_call.set(self)
+        try:
+            yield self
+        finally:
+            _current_call.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block into record['<name>_ms']"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.record[f'{name}_ms'] = (self.record.get(f'{name}_ms') or 0) + elapsed
+
+    def add_db_time(self, ms):
+        self.record['db_ms'] += ms
+
+    # Reported by LLMClient
+
+    def upstream_started(self, model):
+        self.record['model'] = model
+        self.record['attempts'] += 1
+        if self._upstream_started is None:
+            self._upstream_started = time.perf_counter()
+
+    def first_token(self):
+        if self.record['ttft_ms'] is None and self._upstream_started is not None:
+            self.record['ttft_ms'] = (time.perf_counter() - self._upstream_started) * 1000
+
+    def upstream_finished(self, usage=None, error=None):
+        if self._upstream_started is not None:
+            self.record['upstream_ms'] = (time.perf_counter() - self._upstream_started) * 1000
+        if usage is not None:
+            self.record['prompt_tokens'] = getattr(usage, 'prompt_tokens', None)
+            self.record['completion_tokens'] = getattr(usage, 'completion_tokens', None)
+        if error is not None:
+            self.record['error'] = error.__class__.__name__
+
+    def finish(self, outcome=None):
+        """Close the call and emit its record; later calls are ignored"""
+        if self._finished:
+            return
+        self._finished = True
+        if outcome is None:
+            outcome = self.record['outcome'] or ('error' if self.record['error'] else 'ok')
+        self.record['outcome'] = outcome
+        self.record['total_ms'] = (time.perf_counter() - self._started) * 1000
+        for key in LATENCY_METRICS:
+            if self.record[key] is not None:
+                self.record[key] = round(self.record[key], 2)
+        record_logger.info(json.dumps(self.record))
+        aggregator.add(self.record)
+
+
+@contextmanager
+def track_llm_call(kind, user=None, event=None, phase=None):
+    """Run a block as an active LLMCall and finish it on exit"""
+    call = LLMCall(kind, user, event, phase)
+    try:
+        with call.active():
+            yield call
+    except Exception as e:
+        call.record['error'] = call.record['error'] or e.__class__.__name__
+        call.finish('error')
+        raise
+    call.finish()
+
+
+def _time_query(execute, sql, params, many, context):
+    call = _current_call.get()
+    if call is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        call.add_db_time((time.perf_counter() - started) * 1000)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Aggregator:
+    """Rolling window of the most recent call records with percentile summaries"""
+
+    def __init__(self, size):
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+    @staticmethod
+    def _summarize(records):
+        summary = {'count': len(records), 'errors': sum(1 for r in records if r['outcome'] == 'error')}
+        for metric in LATENCY_METRICS:
+            values = sorted(r[metric] for r in records if r[metric] is not None)
+            summary[metric] = {f'p{pct}': percentile(values, pct) for pct in PERCENTILES}
+        summary['prompt_tokens'] = sum(r['prompt_tokens'] or 0 for r in records)
+        summary['completion_tokens'] = sum(r['completion_tokens'] or 0 for r in records)
+        return summary
+
+    def summary(self, top_users=10):
+        with self._lock:
+            records = list(self.records)
+
+        groups = {'kind': defaultdict(list), 'model': defaultdict(list), 'phase': defaultdict(list),
+                  'outcome': defaultdict(list), 'user_id': defaultdict(list)}
+        for record in records:
+            for field, buckets in groups.items():
+                buckets[str(record[field])].append(record)
+
+        by_user = sorted(
+            ((user_id, self._summarize(user_records)) for user_id, user_records in groups.pop('user_id').items()),
+            key=lambda item: item[1]['prompt_tokens'] + item[1]['completion_tokens'],
+            reverse=True
+        )
+        return {
+            'window': len(records),
+            'overall': self._summarize(records),
+            **{f'by_{field}': {key: self._summarize(group) for key, group in buckets.items()}
+               for field, buckets in groups.items()},
+            'top_users_by_tokens': dict(by_user[:top_users]),
+        }
+
+
+aggregator = Aggregator(settings.TELEMETRY_WINDOW)
@@ -1,3 +1,1180 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.template.base import Template
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from unittest import mock
+import io
+import json
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from .models import Event, ChatSession, ChatMessage, UserThread, PhaseTransition, LLMJob, ConversationSummary
+from .phases import MarkerDetector, advance_phase
+from .retrieval import retrieve_snippets, update_index
+from .context_window import count_tokens, load_encoding
+from .summaries import maybe_schedule_summary, update_summary
+from .prompts import get_user_context
+from .response_cache import get_response_cache
+from .telemetry import aggregator, percentile
+from . import profiling
+from .bench.fake_openai import FakeOpenAIServer
+from .bench.runner import compare, run_scenario
+from .bench.seed import seed
+from .bench.startup import profile_startup
+from .llm import CircuitBreaker, CircuitOpenError, LLMClient, is_retryable
+from .admission import acquire_slot, take_token
+from .assets import build_assets
+from .export import export_records
+from .jobs import JOB_HANDLERS, claim_jobs, enqueue_job, requeue_stale_jobs, run_job
+from .user_cache import forget_event, get_active_thread, get_event, get_profile, get_profile_and_event
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
+from django.templatetags.static import static
+from . import async_views, context_window, llm, retrieval, views
 
-# Create your tests here.
+# Pages are rendered without running collectstatic, so the manifest storage
+# used in production (STATIC_MANIFEST, which fails on unknown names) is never
+# picked up from the environment
+MANIFEST_STORAGES = {
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+plain_static_storage = override_settings(STORAGES={
+    **settings.STORAGES,
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+})
+# Nor is the tiktoken encoding fetched; tokens are estimated instead
+estimated_tokens = override_settings(TOKEN_COUNTER='estimate')
+
+
+def setUpModule():
+    plain_static_storage.enable()
+    estimated_tokens.enable()
+
+
+def tearDownModule():
+    estimated_tokens.disable()
+    plain_static_storage.disable()
+
+
+def use_test_llm_client(test):
+    """Build the shared LLM client with a dummy key, so its requests can be patched offline"""
+    settings_override = override_settings(OPENAI_API_KEY='test')
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+    llm._llm_client = None
+    test.addCleanup(setattr, llm, '_llm_client', None)
+
+
+@override_settings(SESSIONS_PER_PAGE=20)
+class SessionListingQueryTests(TestCase):
+    """Listing saved sessions must cost a fixed number of queries and never load transcripts"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def create_sessions(self, count):
+        ChatSession.objects.bulk_create([
+            ChatSession(event=self.event, phase='facts', title=f'Session {i}')
+            for i in range(count)
+        ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def test_event_detail_query_count_is_constant(self):
+        self.create_sessions(2)
+        few = len(self.count_queries(f'/events/{self.event.id}/'))
+        self.create_sessions(40)
+        many = self.count_queries(f'/events/{self.event.id}/')
+        self.assertEqual(len(many), few)
+        # Session, user, page state, event, session count, one page of sessions
+        self.assertEqual(len(many), 6)
+        self.assertFalse(any('chatbot_chatsessionmessage' in q['sql'] for q in many.captured_queries))
+
+    def test_phase_sessions_query_count_is_constant(self):
+        url = f'/api/sessions/{self.event.id}/facts/'
+        self.create_sessions(2)
+        few = len(self.count_queries(url))
+        self.create_sessions(40)
+        many = self.count_queries(url)
+        self.assertEqual(len(many), few)
+        self.assertEqual(len(many), 5)
+        self.assertFalse(any('chatbot_chatsessionmessage' in q['sql'] for q in many.captured_queries))
+
+    def test_phase_sessions_are_paginated(self):
+        self.create_sessions(25)
+        data = self.client.get(f'/api/sessions/{self.event.id}/facts/?page=2').json()
+        self.assertTrue(data['success'])
+        self.assertEqual(data['page'], 2)
+        self.assertEqual(len(data['sessions']), 5)
+        self.assertFalse(data['has_next'])
+
+
+@override_settings(SESSION_MESSAGES_PER_PAGE=2)
+class SessionTranscriptTests(TestCase):
+    """Saved sessions store one row per message and can be extended without rewriting"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def save(self, messages, **extra):
+        body = {'event_id': self.event.id, 'phase': 'facts', 'messages': messages, **extra}
+        return self.client.post('/chat/save/', json.dumps(body), content_type='application/json').json()
+
+    def test_save_then_append(self):
+        first = [{'content': 'hello', 'type': 'user'}, {'content': 'hi', 'type': 'assistant'}]
+        data = self.save(first)
+        self.assertTrue(data['success'])
+        more = first + [{'content': 'again', 'type': 'user'}]
+        data = self.save(more, session_id=data['session_id'])
+        self.assertTrue(data['success'])
+        session = ChatSession.objects.get(id=data['session_id'])
+        self.assertEqual(session.message_count, 3)
+        self.assertEqual(session.get_messages(), more)
+
+    def test_view_session_is_paginated(self):
+        data = self.save([{'content': f'm{i}', 'type': 'user'} for i in range(5)])
+        response = self.client.get(f'/session/{data["session_id"]}/?page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m.content for m in response.context['session_messages']], ['m4'])
+
+
+class PhaseProgressionTests(TestCase):
+    """Phases advance in WRITING_PHASE_CHOICES order and every step is logged"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def test_marker_split_across_tokens(self):
+        detector = MarkerDetector()
+        for token in ['Well done. PHASE_', 'COMP', 'LETE: facts']:
+            detector.feed(token)
+        self.assertTrue(detector.found)
+        self.assertFalse(MarkerDetector().feed('PHASE COMPLETE'))
+
+    def test_advance_logs_transition(self):
+        transition = advance_phase(self.event, 'facts')
+        self.assertEqual((transition.from_phase, transition.to_phase), ('facts', 'feelings'))
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.current_phase, 'feelings')
+        # A stale turn still in 'facts' must not advance the event again
+        self.assertIsNone(advance_phase(self.event, 'facts'))
+        self.assertEqual(PhaseTransition.objects.filter(event=self.event).count(), 1)
+
+    def test_last_phase_does_not_advance(self):
+        Event.objects.filter(id=self.event.id).update(current_phase='growth')
+        self.assertIsNone(advance_phase(self.event, 'growth'))
+
+
+class HistoryApiTests(TestCase):
+    """History endpoints page by cursor, project fields and honour If-None-Match"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        thread = UserThread.objects.create(user=self.user, event=self.event, thread_id='t')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(event=self.event, user_thread=thread, content=f'm{i}', message_type='user', phase='facts')
+            for i in range(5)
+        ])
+        self.url = f'/chat/history/{self.event.id}/facts/'
+
+    def test_cursor_walks_all_messages_once(self):
+        seen = []
+        cursor = ''
+        while True:
+            data = self.client.get(self.url, {'limit': 2, 'cursor': cursor, 'fields': 'content'}).json()
+            seen += [msg['content'] for msg in data['messages']]
+            self.assertEqual(set().union(*data['messages']), {'content'})
+            if not data['has_more']:
+                break
+            cursor = data['next_cursor']
+        self.assertEqual(seen, [f'm{i}' for i in range(5)])
+
+    def test_unchanged_history_is_not_modified(self):
+        response = self.client.get(self.url)
+        cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        thread = UserThread.objects.get()
+        ChatMessage.objects.create(event=self.event, user_thread=thread, content='new', message_type='user', phase='facts')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_validator_does_not_scan_the_history(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertFalse(any('COUNT(' in q['sql'] or 'MAX(' in q['sql'] for q in queries.captured_queries))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'nope'}).status_code, 400)
+
+
+class SearchTests(TestCase):
+    """Full-text search is ranked, scoped to the user and kept current on insert"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.thread = UserThread.objects.create(user=self.user, event=event, thread_id='t')
+        other = User.objects.create_user('other')
+        other_event = Event.objects.create(user=other, title='Other', date_occurred='2024-01-01')
+        other_thread = UserThread.objects.create(user=other, event=other_event, thread_id='o')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(event=event, user_thread=self.thread, message_type='user', content='We moved to a new city'),
+            ChatMessage(event=event, user_thread=self.thread, message_type='user', content='The city felt huge, city noise everywhere'),
+            ChatMessage(event=other_event, user_thread=other_thread, message_type='user', content='My city'),
+        ])
+
+    def test_ranked_and_scoped_to_user(self):
+        data = self.client.get('/search/', {'q': 'city'}).json()
+        contents = [hit['content'] for hit in data['results']]
+        self.assertEqual(contents, ['The city felt huge, city noise everywhere', 'We moved to a new city'])
+
+    def test_new_messages_are_indexed(self):
+        self.assertEqual(self.client.get('/search/', {'q': 'harbour'}).json()['results'], [])
+        ChatMessage.objects.create(user_thread=self.thread, message_type='user', content='the harbour at dusk')
+        self.assertEqual(len(self.client.get('/search/', {'q': 'harbour'}).json()['results']), 1)
+
+    def test_saved_sessions(self):
+        session = ChatSession.objects.create(event=self.thread.event, phase='facts', title='Day one')
+        session.append_messages([{'content': 'Unpacking boxes "all" day', 'type': 'user'}])
+        data = self.client.get('/search/', {'q': 'boxes "all', 'type': 'sessions'}).json()
+        self.assertEqual([hit['session_id'] for hit in data['results']], [session.id])
+
+
+@override_settings(RETRIEVAL_MIN_SCORE=0.1)
+class RetrievalTests(TestCase):
+    """Snippets from the user's other events are retrieved by similarity"""
+
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.index_dir.cleanup)
+        override = override_settings(EMBEDDING_INDEX_DIR=self.index_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('writer', password='secret')
+        self.old_event = Event.objects.create(user=self.user, title='Exam', date_occurred='2023-01-01',
+                                              description='Failing my driving exam made me anxious')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        thread = UserThread.objects.create(user=self.user, event=self.old_event, thread_id='t')
+        ChatMessage.objects.create(event=self.old_event, user_thread=thread, message_type='user',
+                                   content='I practised parking every evening before the second exam')
+
+    def test_retrieves_related_snippets(self):
+        self.assertEqual(update_index(self.user.id), 3)
+        snippets = retrieve_snippets(self.user, 'nervous about my driving exam again', self.event)
+        self.assertTrue(snippets)
+        self.assertTrue(all(snippet.startswith('[Exam]') for snippet in snippets))
+
+    def test_index_is_incremental(self):
+        update_index(self.user.id)
+        thread = UserThread.objects.get()
+        ChatMessage.objects.create(event=self.old_event, user_thread=thread, message_type='user', content='Passed')
+        self.assertEqual(update_index(self.user.id, batch=1), 4)
+        self.assertEqual(retrieve_snippets(self.user, 'exam', self.event, budget=0), [])
+
+    @override_settings(RETRIEVAL_INDEX_BATCH=2)
+    def test_messages_are_added_in_batches(self):
+        update_index(self.user.id)
+        thread = UserThread.objects.get()
+        ChatMessage.objects.create(event=self.old_event, user_thread=thread, message_type='user', content='Passed')
+        with mock.patch('chatbot.retrieval.embed', wraps=retrieval.embed) as embed:
+            self.assertEqual(update_index(self.user.id), 3)
+            embed.assert_not_called()
+            ChatMessage.objects.create(event=self.old_event, user_thread=thread, message_type='user', content='Again')
+            self.assertEqual(update_index(self.user.id), 5)
+            # Only the new messages are embedded; the events haven't changed
+            self.assertEqual(embed.call_args_list, [mock.call(['Passed', 'Again'])])
+
+            self.old_event.description = 'Passing my driving exam'
+            self.old_event.save()
+            self.assertEqual(update_index(self.user.id), 5)
+            self.assertEqual(embed.call_count, 2)
+
+
+def api_error(status):
+    """The openai exception for an HTTP status, as the client raises it"""
+    import httpx
+    import openai
+    response = httpx.Response(status, request=httpx.Request('POST', 'https://api.openai.com/v1/chat/completions'))
+    return openai.APIStatusError(f"HTTP {status}", response=response, body=None)
+
+
+@override_settings(CHAT_SUMMARY_INTERVAL=4, CHAT_SUMMARY_KEEP_RECENT=2)
+class SummaryTests(TestCase):
+    """Older messages are folded into one rolling summary per thread and phase"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.thread = UserThread.objects.create(user=self.user, event=self.event, thread_id='t1')
+        self.llm = mock.patch('chatbot.summaries.get_llm_client').start().return_value
+        self.addCleanup(mock.patch.stopall)
+        self.llm.chat_completion.return_value.choices = [mock.Mock(message=mock.Mock(content=' The move. '))]
+
+    def add_messages(self, count, thread=None, prefix='Message'):
+        return [
+            ChatMessage.objects.create(event=self.event, user_thread=thread or self.thread, phase='facts',
+                                       message_type='user', content=f'{prefix} {i}')
+            for i in range(count)
+        ]
+
+    def prompt_text(self):
+        messages, _, _ = views.build_chat_messages(self.user, 'Hello', self.event.id)
+        return '\n'.join(message['content'] for message in messages)
+
+    def test_folds_all_but_the_recent_messages(self):
+        messages = self.add_messages(5)
+        summary = update_summary(self.thread.id, 'facts')
+        self.assertEqual(summary.summary, 'The move.')
+        self.assertEqual(summary.last_message_id, messages[2].id)
+        self.assertEqual(summary.message_count, 3)
+        prompt = self.llm.chat_completion.call_args[0][0][0]['content']
+        self.assertIn('Message 2', prompt)
+        self.assertNotIn('Message 3', prompt)
+
+    @override_settings(RETRIEVAL_ENABLED=False)
+    def test_prompt_uses_the_active_thread_summary(self):
+        self.add_messages(5)
+        update_summary(self.thread.id, 'facts')
+        prompt = self.prompt_text()
+        self.assertIn('The move.', prompt)
+        self.assertNotIn('Message 2', prompt)
+        self.assertIn('Message 3', prompt)
+
+        # A new session's thread starts without a summary; the earlier thread's
+        # turns are sent as messages rather than through its summary
+        later = UserThread.objects.create(user=self.user, event=self.event, thread_id='t2')
+        self.add_messages(5, later, prefix='Later')
+        prompt = self.prompt_text()
+        self.assertNotIn('The move.', prompt)
+        self.assertIn('Message 2', prompt)
+
+        self.llm.chat_completion.return_value.choices = [mock.Mock(message=mock.Mock(content='Later summary'))]
+        update_summary(later.id, 'facts')
+        prompt = self.prompt_text()
+        self.assertIn('Later summary', prompt)
+        self.assertNotIn('Later 2', prompt)
+        self.assertIn('Message 2', prompt)
+
+    def test_nothing_to_fold(self):
+        self.add_messages(2)
+        self.assertEqual(update_summary(self.thread.id, 'facts').message_count, 0)
+        self.llm.chat_completion.assert_not_called()
+
+    def test_concurrent_fold_is_discarded(self):
+        messages = self.add_messages(5)
+
+        def fold_elsewhere(*args, **kwargs):
+            ConversationSummary.objects.filter(user_thread=self.thread).update(
+                summary='Folded elsewhere', last_message_id=messages[2].id, message_count=3
+            )
+            return mock.DEFAULT
+        self.llm.chat_completion.side_effect = fold_elsewhere
+        summary = update_summary(self.thread.id, 'facts')
+        self.assertEqual((summary.summary, summary.message_count), ('Folded elsewhere', 3))
+
+    @override_settings(LLM_BACKGROUND_JOBS=True)
+    def test_schedules_one_job_after_the_interval(self):
+        self.add_messages(3)
+        self.assertFalse(maybe_schedule_summary(self.thread, 'facts'))
+        self.add_messages(1)
+        self.assertTrue(maybe_schedule_summary(self.thread, 'facts'))
+        self.assertFalse(maybe_schedule_summary(self.thread, 'facts'))
+        self.assertEqual(LLMJob.objects.filter(kind='summary').count(), 1)
+
+
+class ContextWindowTests(TestCase):
+    """Token counts use the encoding fetched at build time, never a download"""
+
+    def test_missing_encoding_falls_back_to_estimate(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.addCleanup(setattr, context_window, '_encoding_missing', False)
+        with override_settings(TOKEN_COUNTER='tiktoken', TIKTOKEN_CACHE_DIR=cache_dir.name):
+            with self.assertLogs('chatbot.context_window', 'WARNING') as logs:
+                self.assertIsNone(load_encoding())
+            self.assertIn('fetch_encoding', logs.output[0])
+            with self.assertNoLogs('chatbot.context_window'):
+                self.assertEqual(count_tokens('x' * 40), 11)
+
+    def test_estimate(self):
+        self.assertEqual(count_tokens('x' * 40), 11)
+
+
+class LLMClientTests(TestCase):
+    """Retries cover transient provider errors only, and the breaker sheds load while it recovers"""
+
+    def setUp(self):
+        aggregator.clear()
+        self.addCleanup(aggregator.clear)
+        self.client_under_test = LLMClient(api_key='test', max_retries=2, backoff_base=0, backoff_max=0,
+                                           failure_threshold=5, reset_timeout=30)
+        self.create = mock.patch.object(self.client_under_test.client.chat.completions, 'create').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_is_retryable(self):
+        import openai
+        self.assertTrue(is_retryable(api_error(429)))
+        self.assertTrue(is_retryable(api_error(503)))
+        self.assertTrue(is_retryable(openai.APIConnectionError(request=None)))
+        self.assertFalse(is_retryable(api_error(400)))
+        self.assertFalse(is_retryable(ValueError()))
+
+    def test_retries_429_and_5xx(self):
+        self.create.side_effect = [api_error(429), api_error(500), 'response']
+        self.assertEqual(self.client_under_test.chat_completion([]), 'response')
+        self.assertEqual(self.create.call_count, 3)
+        self.assertEqual(aggregator.records[-1]['attempts'], 3)
+
+    def test_does_not_retry_4xx(self):
+        self.create.side_effect = api_error(400)
+        with self.assertRaises(Exception):
+            self.client_under_test.chat_completion([])
+        self.assertEqual(self.create.call_count, 1)
+        self.assertEqual(self.client_under_test.breaker.state, 'closed')
+
+    def test_gives_up_after_max_retries(self):
+        self.create.side_effect = api_error(502)
+        with self.assertRaises(Exception):
+            self.client_under_test.chat_completion([])
+        self.assertEqual(self.create.call_count, 3)
+        self.assertEqual(aggregator.records[-1]['outcome'], 'error')
+
+    def test_breaker_transitions(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker._opened_at -= 30
+        self.assertEqual(breaker.state, 'half-open')
+        breaker.before_call()
+        # Only the probe goes through until it resolves
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'open')
+
+        breaker._opened_at -= 30
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.before_call()
+        breaker.before_call()
+
+    def test_abandoned_stream_is_recorded(self):
+        chunk = mock.Mock(usage=None)
+        chunk.choices = [mock.Mock(delta=mock.Mock(content='Hi'))]
+        self.create.return_value = iter([chunk, chunk, chunk])
+        breaker = self.client_under_test.breaker
+        breaker._opened_at = time.monotonic() - 60  # half-open: this call is the probe
+
+        stream = self.client_under_test.chat_completion([], stream=True)
+        next(stream)
+        stream.close()
+        self.assertEqual(aggregator.records[-1]['outcome'], 'cancelled')
+        self.assertFalse(breaker._probe_in_flight)
+
+
+class TelemetryTests(TestCase):
+    """LLM calls are timed, their token usage recorded, and summarized for staff"""
+
+    def setUp(self):
+        aggregator.clear()
+        self.addCleanup(aggregator.clear)
+        use_test_llm_client(self)
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_chat_turn_is_recorded(self):
+        response = mock.Mock()
+        response.choices = [mock.Mock(message=mock.Mock(content='Tell me more'))]
+        response.usage = mock.Mock(prompt_tokens=120, completion_tokens=8)
+        self.client.force_login(self.user)
+        with mock.patch.object(views.get_llm_client().client.chat.completions, 'create', return_value=response):
+            self.client.post('/chat/response/', json.dumps({'message': 'Hi', 'event_id': self.event.id}),
+                             content_type='application/json')
+
+        record = aggregator.records[-1]
+        self.assertEqual((record['kind'], record['outcome'], record['phase']), ('chat_turn', 'ok', 'facts'))
+        self.assertEqual((record['prompt_tokens'], record['completion_tokens']), (120, 8))
+        self.assertEqual(record['event_id'], self.event.id)
+        self.assertGreater(record['db_ms'], 0)
+        self.assertIsNotNone(record['upstream_ms'])
+
+        summary = aggregator.summary()
+        self.assertEqual(summary['by_phase']['facts']['prompt_tokens'], 120)
+        self.assertIn(str(self.user.id), summary['top_users_by_tokens'])
+
+    def test_summary_endpoint_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/ht/llm/').status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/ht/llm/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['window'], 0)
+
+
+class ProfilingTests(TestCase):
+    """Sampled requests are profiled into the ring buffer that staff download"""
+
+    def setUp(self):
+        profiling.profiles.clear()
+        self.addCleanup(profiling.profiles.clear)
+        self.user = User.objects.create_user('writer', password='secret', is_staff=True)
+        Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def test_disabled_by_default(self):
+        client = Client()
+        client.force_login(self.user)
+        client.get('/events/')
+        self.assertEqual(profiling.profiles.snapshot(), [])
+        self.assertIs(Template.render, profiling._original_template_render)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_request_is_profiled(self):
+        self.addCleanup(setattr, Template, 'render', profiling._original_template_render)
+        client = Client()
+        client.force_login(self.user)
+        client.get('/events/')
+
+        sample = profiling.profiles.snapshot()[-1]
+        self.assertEqual((sample['view'], sample['status'], sample['user_id']), ('event_list', 200, self.user.id))
+        self.assertGreater(sample['queries'], 0)
+        self.assertGreater(sample['template_ms'], 0)
+        self.assertIn('cumulative', sample['stack'])
+
+        response = client.get('/admin/profiles/')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(json.loads(response.content)[0]['view'], 'event_list')
+
+
+class BenchTests(TestCase):
+    """The benchmark harness seeds data, drives scenarios and serves fake completions"""
+
+    def test_fake_openai_server(self):
+        with FakeOpenAIServer(latency=0, token_rate=10000, completion_tokens=5) as server:
+            client = LLMClient(api_key='bench', base_url=server.base_url, max_retries=0)
+            response = client.chat_completion([{'role': 'user', 'content': 'Hello there'}])
+            self.assertEqual(len(response.choices[0].message.content.split()), 5)
+            self.assertEqual(response.usage.completion_tokens, 5)
+            stream = client.chat_completion([{'role': 'user', 'content': 'Hello'}], stream=True)
+            tokens = [chunk.choices[0].delta.content for chunk in stream if chunk.choices and chunk.choices[0].delta.content]
+            self.assertEqual(len(tokens), 5)
+
+    def test_scenario_reports_latency_and_queries(self):
+        seeded = seed(users=2, events_per_user=2, messages_per_event=6, sessions_per_event=2, messages_per_session=4)
+        self.assertEqual(ChatSession.objects.count(), 8)
+
+        stats = run_scenario('phase_sessions', seeded, requests=10, warmup=2)
+        self.assertEqual((stats['requests'], stats['errors']), (10, 0))
+        self.assertLessEqual(stats['latency_ms']['p50'], stats['latency_ms']['p99'])
+        self.assertGreater(stats['queries_per_request']['mean'], 0)
+
+        rows = compare({'scenarios': {'phase_sessions': stats}}, {'scenarios': {'phase_sessions': stats}})
+        self.assertTrue(all(change in (0, None) for *_, change in rows))
+
+    def test_worker_boot_skips_heavy_imports(self):
+        profile = profile_startup('wsgi', env={'TOKEN_COUNTER': 'estimate'})
+        self.assertGreater(profile['import_ms'], 0)
+        packages = dict(profile['packages'])
+        self.assertIn('chatbot', packages)
+        for heavy in ('openai', 'numpy', 'httpx', 'pydantic'):
+            self.assertNotIn(heavy, packages)
+
+
+def completion(content):
+    return mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))], usage=None)
+
+
+def stream_chunks(*tokens):
+    return [mock.Mock(choices=[mock.Mock(delta=mock.Mock(content=token))]) for token in tokens]
+
+
+def sse_frames(body):
+    """(event, data) for each frame of a text/event-stream body"""
+    frames = []
+    for frame in body.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+        frames.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return frames
+
+
+@override_settings(ADMISSION_ENABLED=False, RETRIEVAL_ENABLED=False)
+class ChatStreamTests(TestCase):
+    """Streamed chat turns arrive as SSE token frames, then a done frame"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.client.force_login(self.user)
+        self.llm = mock.patch.object(views, 'get_llm_client').start().return_value
+        self.addCleanup(mock.patch.stopall)
+
+    def post_stream(self):
+        response = self.client.post('/chat/response/', json.dumps({
+            'message': 'We moved', 'event_id': self.event.id, 'stream': True
+        }), content_type='application/json')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return sse_frames(b"".join(response.streaming_content))
+
+    def test_tokens_then_done(self):
+        self.llm.chat_completion.return_value = iter(stream_chunks('Tell ', 'me ', None, 'more'))
+        self.assertEqual(self.post_stream(), [
+            ('message', {'token': 'Tell '}),
+            ('message', {'token': 'me '}),
+            ('message', {'token': 'more'}),
+            ('done', {'response': 'Tell me more'}),
+        ])
+        self.assertEqual(
+            list(ChatMessage.objects.order_by('id').values_list('message_type', 'content')),
+            [('user', 'We moved'), ('assistant', 'Tell me more')]
+        )
+
+    def test_error_frame(self):
+        self.llm.chat_completion.side_effect = RuntimeError('upstream down')
+        self.assertEqual(self.post_stream(), [('error', {'error': 'upstream down'})])
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_open_circuit(self):
+        self.llm.chat_completion.side_effect = CircuitOpenError('open')
+        self.assertEqual(self.post_stream(), [('error', {'error': views.LLM_UNAVAILABLE_MESSAGE})])
+
+
+@override_settings(ADMISSION_ENABLED=False, RETRIEVAL_ENABLED=False)
+class AsyncViewTests(TestCase):
+    """The async chat views answer like the sync ones"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.llm = mock.patch.object(async_views, 'get_llm_client').start().return_value
+        self.addCleanup(mock.patch.stopall)
+
+    def request(self, body):
+        request = AsyncRequestFactory().post('/chat/response/', json.dumps(body), content_type='application/json')
+
+        async def auser():
+            return self.user
+        request.user, request.auser = self.user, auser
+        return request
+
+    async def test_response(self):
+        self.llm.achat_completion = mock.AsyncMock(return_value=completion('Tell me more'))
+        response = await async_views.aget_chatbot_response(
+            self.request({'message': 'We moved', 'event_id': self.event.id})
+        )
+        self.assertEqual(json.loads(response.content), {'response': 'Tell me more'})
+        self.assertEqual(await ChatMessage.objects.filter(event=self.event).acount(), 2)
+
+    async def test_stream(self):
+        async def chunks():
+            for chunk in stream_chunks('Tell ', 'me more'):
+                yield chunk
+        self.llm.achat_completion = mock.AsyncMock(return_value=chunks())
+        response = await async_views.aget_chatbot_response(
+            self.request({'message': 'We moved', 'event_id': self.event.id, 'stream': True})
+        )
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(sse_frames(body)[-1], ('done', {'response': 'Tell me more'}))
+        self.assertEqual(await ChatMessage.objects.filter(event=self.event).acount(), 2)
+
+
+class OpeningCacheTests(TestCase):
+    """Opening turns are reused from the response cache unless the user opts out"""
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.llm = mock.patch.object(views, 'get_llm_client').start().return_value
+        self.addCleanup(mock.patch.stopall)
+        self.llm.chat_completion.return_value = completion('What happened?')
+
+    def open_session(self):
+        thread = UserThread.objects.create(user=self.user, event=self.event, thread_id=str(time.time()))
+        return views.create_opening_message(self.user, self.event, thread)
+
+    def set_opt_in(self, value):
+        profile = get_profile(self.user)
+        profile.cache_opening_prompts = value
+        profile.save()
+
+    def test_second_opening_is_cached(self):
+        self.set_opt_in(True)
+        self.assertEqual(self.open_session(), 'What happened?')
+        self.assertEqual(self.open_session(), 'What happened?')
+        self.assertEqual(self.llm.chat_completion.call_count, 1)
+        self.assertEqual(ChatMessage.objects.filter(message_type='assistant').count(), 2)
+
+    def test_opt_out(self):
+        self.set_opt_in(False)
+        self.open_session()
+        self.open_session()
+        self.assertEqual(self.llm.chat_completion.call_count, 2)
+
+    def test_other_events_miss(self):
+        self.set_opt_in(True)
+        self.open_session()
+        self.event = Event.objects.create(user=self.user, title='New job', date_occurred='2024-02-01')
+        self.open_session()
+        self.assertEqual(self.llm.chat_completion.call_count, 2)
+
+
+class PromptTests(TestCase):
+    """The user context fragment is memoized until the profile is saved"""
+
+    def test_profile_save_refreshes_user_context(self):
+        user = User.objects.create_user('writer', password='secret')
+        profile = get_profile(user)
+        profile.bio_context = 'Teacher'
+        profile.save()
+        self.assertEqual(get_user_context(profile), 'Bio: Teacher')
+        profile.bio_context = 'Nurse'
+        profile.save()
+        self.assertEqual(get_user_context(profile), 'Bio: Nurse')
+
+
+class SaveChatTurnTests(TestCase):
+    """A chat turn is saved whole or not at all"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    @override_settings(RETRIEVAL_ENABLED=False)
+    def test_saves_both_messages(self):
+        views.save_chat_turn(self.user, self.event, 'facts', 'We moved', 'Tell me more')
+        self.assertEqual(ChatMessage.objects.filter(event=self.event, phase='facts').count(), 2)
+
+    def test_failure_rolls_back_both_messages(self):
+        with mock.patch.object(views, 'maybe_schedule_summary', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                views.save_chat_turn(self.user, self.event, 'facts', 'We moved', 'Tell me more')
+        self.assertFalse(ChatMessage.objects.exists())
+        self.assertFalse(UserThread.objects.exists())
+
+
+@override_settings(ADMISSION_USER_RATE=6, ADMISSION_USER_BURST=2, ADMISSION_MAX_CONCURRENT=1,
+                   ADMISSION_QUEUE_SIZE=0, ADMISSION_BUSY_RETRY_AFTER=7)
+class AdmissionTests(TestCase):
+    """LLM views are limited per user and by a shared concurrency limit"""
+
+    def setUp(self):
+        use_test_llm_client(self)
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.client.force_login(self.user)
+
+    def post_message(self):
+        response = mock.Mock()
+        response.choices = [mock.Mock(message=mock.Mock(content='Tell me more'))]
+        response.usage = None
+        with mock.patch.object(views.get_llm_client().client.chat.completions, 'create', return_value=response):
+            return self.client.post('/chat/response/', json.dumps({'message': 'Hi', 'event_id': self.event.id}),
+                                    content_type='application/json')
+
+    def test_token_bucket(self):
+        self.assertEqual(take_token(self.user.id), 0)
+        self.assertEqual(take_token(self.user.id), 0)
+        # Six a minute: the next token is about ten seconds away
+        self.assertAlmostEqual(take_token(self.user.id), 10, delta=0.5)
+
+    def test_rate_limited_requests_get_429(self):
+        self.assertEqual(self.post_message().status_code, 200)
+        self.assertEqual(self.post_message().status_code, 200)
+        response = self.post_message()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+
+    def test_busy_when_slots_and_queue_are_full(self):
+        self.assertIsNotNone(acquire_slot('run', 1, 'other-request'))
+        response = self.post_message()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertIn('error', response.json())
+
+    def test_slot_is_released_after_response(self):
+        self.assertEqual(self.post_message().status_code, 200)
+        self.assertIsNotNone(acquire_slot('run', 1, 'next-request'))
+
+
+@override_settings(LLM_JOB_RETRY_DELAY=0, LLM_JOB_STALE_AFTER=60)
+class JobQueueTests(TestCase):
+    """Jobs count an attempt when claimed and fail once they run out"""
+
+    def setUp(self):
+        self.handler = mock.Mock(return_value={'ok': True})
+        JOB_HANDLERS['test'] = self.handler
+        self.addCleanup(JOB_HANDLERS.pop, 'test')
+
+    def claim(self, job):
+        self.assertEqual(claim_jobs('worker-1', 5), [job.id])
+        job.refresh_from_db()
+
+    def test_claim_counts_the_attempt(self):
+        job = enqueue_job('test', {})
+        self.claim(job)
+        self.assertEqual((job.status, job.worker, job.attempts), ('running', 'worker-1', 1))
+        self.assertEqual(claim_jobs('worker-2', 5), [])
+
+    def test_success(self):
+        job = enqueue_job('test', {'n': 1})
+        self.claim(job)
+        run_job(job.id, 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), ('succeeded', {'ok': True}))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failures_are_retried_then_failed(self):
+        self.handler.side_effect = RuntimeError('upstream down')
+        job = enqueue_job('test', {}, max_attempts=2)
+        self.claim(job)
+        run_job(job.id, 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('pending', 'upstream down'))
+
+        self.claim(job)
+        run_job(job.id, 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_stale_jobs_are_requeued_until_out_of_attempts(self):
+        job = enqueue_job('test', {}, max_attempts=2)
+        for expected in ('pending', 'failed'):
+            self.claim(job)
+            LLMJob.objects.filter(id=job.id).update(started_at=timezone.now() - timedelta(seconds=120))
+            requeue_stale_jobs()
+            job.refresh_from_db()
+            self.assertEqual(job.status, expected)
+        self.assertEqual(job.attempts, 2)
+        self.handler.assert_not_called()
+
+    def test_outcome_of_a_requeued_job_is_dropped(self):
+        job = enqueue_job('test', {})
+        self.claim(job)
+        LLMJob.objects.filter(id=job.id).update(status='running', worker='worker-2')
+        run_job(job.id, 'worker-1')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('running', 'worker-2'))
+
+
+class StaticAssetTests(TestCase):
+    """Page scripts and styles are served as hashed, compressed, immutable bundles"""
+
+    def test_bundles_are_up_to_date(self):
+        self.assertEqual(build_assets(check=True), [])
+
+    def test_pages_have_no_inline_scripts(self):
+        user = User.objects.create_user('writer', password='secret')
+        event = Event.objects.create(user=user, title='Move', date_occurred='2024-01-01')
+        self.client.force_login(user)
+        for url in ('/chat/', f'/events/{event.id}/'):
+            html = self.client.get(url).content.decode()
+            self.assertNotIn('<script>', html)
+            self.assertNotIn('<style>', html)
+
+    def test_collected_bundles_are_immutable(self):
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        with override_settings(STATIC_ROOT=static_root.name, STORAGES=MANIFEST_STORAGES):
+            with self.assertRaises(ValueError):
+                static('dist/chat.js')
+            call_command('collectstatic', interactive=False, verbosity=0)
+            url = static('dist/chat.js')
+            self.assertRegex(url, r'/dist/chat\.[0-9a-f]{12}\.js$')
+
+            response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class PageCacheTests(TestCase):
+    """Event pages answer revalidation with 304 until their rows change"""
+
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.client.force_login(self.user)
+        self.url = f'/events/{self.event.id}/'
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('private', response['Cache-Control'])
+        with self.assertNumQueries(3):  # session, user and page state
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_fragment_is_reused(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('"chatbot_chatsession"."title"' in q['sql'] for q in queries.captured_queries))
+
+    def test_changes_invalidate_the_page(self):
+        etag = self.client.get(self.url)['ETag']
+        ChatSession.objects.create(event=self.event, phase='facts', title='First session')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'First session')
+
+        etag = response['ETag']
+        self.event.title = 'Moving house'
+        self.event.save()
+        response = self.client.get('/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Moving house')
+
+    def test_events_updated_together_have_their_own_chat_page(self):
+        other = Event.objects.create(user=self.user, title='Job', date_occurred='2024-02-01')
+        Event.objects.filter(user=self.user).update(updated_at=self.event.updated_at)
+        etag = self.client.get(f'/chat/?event_id={self.event.id}')['ETag']
+        response = self.client.get(f'/chat/?event_id={other.id}', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pending_messages_are_rendered(self):
+        etag = self.client.get('/events/')['ETag']
+        self.client.post(f'/events/{self.event.id}/update/', {
+            'title': 'Moving house', 'description': '', 'date_occurred': '2024-01-01'
+        })
+        self.assertEqual(self.client.get('/events/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(USER_CACHE_SHARED=True, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class AuthCacheTests(TestCase):
+    """With a shared cache, authenticated requests load the session and user from it"""
+
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.client.get('/jobs/0/')
+
+    def auth_queries(self, client):
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/jobs/0/')
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        return sql.count('FROM "django_session"') + sql.count('FROM "auth_user"')
+
+    def test_cached_session_and_user(self):
+        self.assertEqual(self.auth_queries(self.client), 0)
+
+    @override_settings(USER_CACHE_SHARED=False, SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_local_cache_reads_the_database(self):
+        # A new client, since the session engine is chosen when middleware loads
+        client = Client()
+        client.force_login(self.user)
+        client.get('/jobs/0/')
+        self.assertEqual(self.auth_queries(client), 2)
+
+    def test_saving_the_user_refreshes_the_cache(self):
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/jobs/0/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_model_backend_sessions_still_resolve(self):
+        client = Client()
+        client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(client.get('/jobs/0/').status_code, 404)
+
+    def test_wrong_password_is_rejected(self):
+        self.assertTrue(Client().login(username='writer', password='secret'))
+        self.assertFalse(Client().login(username='writer', password='wrong'))
+
+
+@override_settings(USER_CACHE_SHARED=True)
+class UserCacheTests(TestCase):
+    """Cached profiles and events are dropped when their rows change"""
+
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def test_event_is_cached_until_saved(self):
+        get_event(self.user, self.event.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_event(self.user, self.event.id).title, 'Move')
+        self.event.title = 'Moving house'
+        self.event.save()
+        self.assertEqual(get_event(self.user, self.event.id).title, 'Moving house')
+
+    def test_forget_event_after_update(self):
+        get_event(self.user, self.event.id)
+        Event.objects.filter(id=self.event.id).update(title='Moving house')
+        forget_event(self.event)
+        self.assertEqual(get_event(self.user, self.event.id).title, 'Moving house')
+
+    def test_other_users_events_are_not_returned(self):
+        other = User.objects.create_user('other', password='secret')
+        self.assertIsNone(get_event(other, self.event.id))
+
+    def test_profile_is_cached_until_saved(self):
+        profile = get_profile(self.user)
+        with self.assertNumQueries(0):
+            get_profile(self.user)
+        profile.bio_context = 'Nurse'
+        profile.save()
+        self.assertEqual(get_profile(self.user).bio_context, 'Nurse')
+
+    def test_new_thread_replaces_the_cached_one(self):
+        first = UserThread.objects.create(user=self.user, event=self.event, thread_id='t1')
+        self.assertEqual(get_active_thread(self.user, self.event), (first, False))
+        with self.assertNumQueries(0):
+            get_active_thread(self.user, self.event)
+        newer = UserThread.objects.create(user=self.user, event=self.event, thread_id='t2')
+        self.assertEqual(get_active_thread(self.user, self.event), (newer, False))
+
+
+class LocalUserCacheTests(TestCase):
+    """The per-process cache reuses rows only while their updated_at is current"""
+
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+
+    def test_one_query_for_profile_and_event(self):
+        get_profile_and_event(self.user, self.event.id)
+        with self.assertNumQueries(1):
+            profile, event = get_profile_and_event(self.user, self.event.id)
+        self.assertEqual((profile.user_id, event.title), (self.user.id, 'Move'))
+
+    def test_changes_in_other_processes_are_seen(self):
+        get_profile_and_event(self.user)
+        # Bypasses this process's signal receivers, as a save elsewhere would
+        with mock.patch.object(caches[settings.USER_CACHE], 'delete_many'):
+            Event.objects.filter(id=self.event.id).update(title='Moving house', updated_at=timezone.now())
+            forget_event(self.event)
+        self.assertEqual(get_profile_and_event(self.user)[1].title, 'Moving house')
+
+    def test_missing_event(self):
+        other = User.objects.create_user('other', password='secret')
+        self.assertIsNone(get_profile_and_event(other, self.event.id)[1])
+        self.assertIsNone(get_profile_and_event(other)[1])
+
+
+@override_settings(ADMISSION_ENABLED=False, RETRIEVAL_ENABLED=False)
+class ChatTurnQueryTests(TestCase):
+    """A warm chat turn's queries, with the default and a shared user cache"""
+
+    def setUp(self):
+        caches[settings.USER_CACHE].clear()
+        self.user = User.objects.create_user('writer', password='secret')
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.client.force_login(self.user)
+        self.llm = mock.patch.object(views, 'get_llm_client').start().return_value
+        self.addCleanup(mock.patch.stopall)
+        self.llm.chat_completion.return_value = completion('Tell me more')
+
+    def turn_queries(self):
+        # The first turn creates the thread, the second caches it
+        for _ in range(2):
+            self.client.post('/chat/response/', json.dumps({'message': 'Hi', 'event_id': self.event.id}),
+                             content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/chat/response/', json.dumps({'message': 'Hi', 'event_id': self.event.id}),
+                                        content_type='application/json')
+        self.assertEqual(response.json(), {'response': 'Tell me more'})
+        return len(queries)
+
+    def test_default_settings(self):
+        # Session, user, profile and event versions, summary, history, then in
+        # a savepoint the thread, messages, thread update and summary check
+        self.assertEqual(self.turn_queries(), 11)
+
+    @override_settings(USER_CACHE_SHARED=True)
+    def test_shared_cache(self):
+        # No user, profile, event or thread reads
+        self.assertEqual(self.turn_queries(), 8)
+
+
+class ExportTests(TestCase):
+    """A user's whole history streams out in every format at a fixed query cost"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='secret')
+        self.client.force_login(self.user)
+        self.event = Event.objects.create(user=self.user, title='Move', date_occurred='2024-01-01')
+        self.thread = UserThread.objects.create(user=self.user, event=self.event, thread_id='t1')
+        for session_number in range(2):
+            session = ChatSession.objects.create(event=self.event, phase='facts', title=f'Session {session_number}')
+            session.append_messages([{'type': 'user', 'content': f'Saved {session_number}'}])
+
+    def add_messages(self, count):
+        ChatMessage.objects.bulk_create([
+            ChatMessage(user_thread=self.thread, event=self.event, message_type='user', content=f'Message {i}')
+            for i in range(count)
+        ])
+
+    def test_ndjson(self):
+        self.add_messages(3)
+        response = self.client.get('/export/?format=ndjson')
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment', response['Content-Disposition'])
+        records = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([r['type'] for r in records], [
+            'event', 'message', 'message', 'message', 'session', 'session_message', 'session', 'session_message'
+        ])
+        self.assertEqual(records[5]['content'], 'Saved 0')
+        self.assertEqual(records[7]['content'], 'Saved 1')
+
+    def test_markdown_and_zip(self):
+        self.add_messages(1)
+        markdown = b"".join(self.client.get('/export/?format=markdown').streaming_content).decode()
+        self.assertIn('## Move', markdown)
+        self.assertIn('**You**', markdown)
+        self.assertIn('#### Session 1', markdown)
+
+        archive = b"".join(self.client.get('/export/?format=zip').streaming_content)
+        with zipfile.ZipFile(io.BytesIO(archive)) as zipped:
+            self.assertEqual(zipped.namelist(), ['history.ndjson', 'history.md'])
+            self.assertEqual(zipped.read('history.md').decode().split('\n')[2:], markdown.split('\n')[2:])
+
+    def test_query_count_does_not_grow(self):
+        self.add_messages(5)
+        with CaptureQueriesContext(connection) as few:
+            list(export_records(self.user, chunk_size=100))
+        self.add_messages(500)
+        with CaptureQueriesContext(connection) as many:
+            list(export_records(self.user, chunk_size=100))
+        self.assertEqual(len(many), len(few))
+
+    def test_command(self):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        call_command('export_history', 'writer', format='ndjson', output_dir=output_dir.name, stdout=io.StringIO())
+        [path] = Path(output_dir.name).iterdir()
+        self.assertIn('"title": "Move"', path.read_text())
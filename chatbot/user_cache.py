@@ -0,0 +1,264 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Subquery
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import UserProfile, Event, UserThread
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Read-through cache for the rows every chat turn needs: the user's profile,
+# the event being written about and its active (latest) thread. Entries are
+# keyed by user id so a cached event is only ever returned to its owner. The
+# backend is the USER_CACHE alias in settings.CACHES.
+#
+# When settings.USER_CACHE_SHARED (the 'file', 'db' and 'redis' backends, which
+# every process reads), entries are dropped by the signal receivers below
+# whenever a row is saved or deleted, and a warm chat turn reads none of them
+# from the database. The per-process 'locmem' cache can't see deletes made by
+# other processes, so get_profile_and_event reads the rows' updated_at in one
+# query and reuses copies cached under those versions; a changed row simply
+# misses. There the other lookups go to the database.
+#
+# CachedModelBackend applies the same to the User row that
+# AuthenticationMiddleware loads on every authenticated request, but only with
+# a shared cache: the row carries the password hash that sessions are checked
+# against and the is_active flag, so a password change or a deactivation (both
+# save the user) must reach every worker at once. Change users and events with
+# save() rather than QuerySet.update() for the same reason, or bump updated_at
+# and call forget_event().
+
+USER_KEY = 'user:{user_id}:auth'
+PROFILE_KEY = 'user:{user_id}:profile'
+EVENT_KEY = 'user:{user_id}:event:{event_id}'
+LATEST_EVENT_KEY = 'user:{user_id}:latest-event'
+THREAD_KEY = 'user:{user_id}:event:{event_id}:thread'
+# Per-process copies of a row, valid for as long as its updated_at is current
+VERSIONED_KEY = '{key}@{version}'
+
+
+def get_user_cache():
+    return caches[settings.USER_CACHE]
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that reads the logged-in user from a shared USER_CACHE"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # ModelBackend follows in AUTHENTICATION_BACKENDS and would hash the
+            # same wrong password again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        if not settings.USER_CACHE_SHARED:
+            return super().get_user(user_id)
+        key = USER_KEY.format(user_id=user_id)
+        user = get_user_cache().get(key)
+        if user is None:
+            user = User._default_manager.filter(pk=user_id).first()
+            if user is None:
+                return None
+            get_user_cache().set(key, user)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        if not settings.USER_CACHE_SHARED:
+            return await super().aget_user(user_id)
+        key = USER_KEY.format(user_id=user_id)
+        user = await get_user_cache().aget(key)
+        if user is None:
+            user = await User._default_manager.filter(pk=user_id).afirst()
+            if user is None:
+                return None
+            await get_user_cache().aset(key, user)
+        return user if self.user_can_authenticate(user) else None
+
+
+def _cached(key, load):
+    """load() through USER_CACHE when it is shared; None is not cached"""
+    if not settings.USER_CACHE_SHARED:
+        return load()
+    value = get_user_cache().get(key)
+    if value is None:
+        value = load()
+        if value is not None:
+            get_user_cache().set(key, value)
+    return value
+
+
+async def _acached(key, load):
+    """Async version of _cached, for a coroutine function load"""
+    if not settings.USER_CACHE_SHARED:
+        return await load()
+    value = await get_user_cache().aget(key)
+    if value is None:
+        value = await load()
+        if value is not None:
+            await get_user_cache().aset(key, value)
+    return value
+
+
+def get_profile(user):
+    """The user's UserProfile; raises UserProfile.DoesNotExist"""
+    return _cached(PROFILE_KEY.format(user_id=user.id), lambda: UserProfile.objects.get(user=user))
+
+
+def get_event(user, event_id):
+    """The user's event with this id, or None"""
+    return _cached(EVENT_KEY.format(user_id=user.id, event_id=event_id),
+                   lambda: Event.objects.filter(id=event_id, user=user).first())
+
+
+def get_latest_event(user):
+    """The user's most recently created event, or None"""
+    return _cached(LATEST_EVENT_KEY.format(user_id=user.id),
+                   lambda: Event.objects.filter(user=user).order_by('-created_at').first())
+
+
+def get_active_thread(user, event):
+    """The latest UserThread for the user's event, created if there is none yet.
+
+    Returns a tuple of (user_thread, created).
+    """
+    key = THREAD_KEY.format(user_id=user.id, event_id=event.id)
+    user_thread = _cached(key, lambda: UserThread.objects.filter(user=user, event=event).order_by('-created_at').first())
+    if user_thread is not None:
+        return user_thread, False
+    user_thread = UserThread.objects.create(user=user, event=event, thread_id=str(uuid.uuid4()))
+    if settings.USER_CACHE_SHARED:
+        # Don't cache a row that a surrounding transaction could still roll back
+        transaction.on_commit(lambda: get_user_cache().set(key, user_thread))
+    return user_thread, True
+
+
+def _versions(user, event_id):
+    """Query for (profile updated_at, event id, event updated_at) of a chat turn"""
+    events = Event.objects.filter(user=user)
+    events = events.filter(id=event_id) if event_id else events.order_by('-created_at')
+    return UserProfile.objects.filter(user=user).annotate(
+        event_id=Subquery(events.values('id')[:1]),
+        event_updated_at=Subquery(events.values('updated_at')[:1]),
+    ).values_list('updated_at', 'event_id', 'event_updated_at')
+
+
+def _versioned_key(key, updated_at):
+    return VERSIONED_KEY.format(key=key, version=updated_at.isoformat())
+
+
+def _versioned_keys(user, versions):
+    profile_version, event_id, event_version = versions
+    keys = {'profile': _versioned_key(PROFILE_KEY.format(user_id=user.id), profile_version)}
+    if event_id is not None:
+        keys['event'] = _versioned_key(EVENT_KEY.format(user_id=user.id, event_id=event_id), event_version)
+    return keys
+
+
+def get_profile_and_event(user, event_id=None):
+    """The user's profile and their event with event_id (or their latest event), for a chat turn.
+
+    The event is None if there is no such event. Raises UserProfile.DoesNotExist.
+    """
+    if settings.USER_CACHE_SHARED:
+        return get_profile(user), get_event(user, event_id) if event_id else get_latest_event(user)
+
+    versions = _versions(user, event_id).first()
+    if versions is None:
+        raise UserProfile.DoesNotExist("User has no profile")
+    keys = _versioned_keys(user, versions)
+    cached = get_user_cache().get_many(keys.values())
+    profile = cached.get(keys['profile'])
+    if profile is None:
+        profile = UserProfile.objects.get(user=user)
+        # Keyed on the row as read, which may be newer than the version above
+        get_user_cache().set(_versioned_key(PROFILE_KEY.format(user_id=user.id), profile.updated_at), profile)
+    event = None
+    if 'event' in keys:
+        event = cached.get(keys['event'])
+        if event is None:
+            event = Event.objects.filter(id=versions[1], user=user).first()
+            if event is not None:
+                get_user_cache().set(
+                    _versioned_key(EVENT_KEY.format(user_id=user.id, event_id=event.id), event.updated_at), event
+                )
+    return profile, event
+
+
+async def aget_profile(user):
+    """Async version of get_profile"""
+    return await _acached(PROFILE_KEY.format(user_id=user.id), lambda: UserProfile.objects.aget(user=user))
+
+
+async def aget_event(user, event_id):
+    """Async version of get_event"""
+    return await _acached(EVENT_KEY.format(user_id=user.id, event_id=event_id),
+                          lambda: Event.objects.filter(id=event_id, user=user).afirst())
+
+
+async def aget_latest_event(user):
+    """Async version of get_latest_event"""
+    return await _acached(LATEST_EVENT_KEY.format(user_id=user.id),
+                          lambda: Event.objects.filter(user=user).order_by('-created_at').afirst())
+
+
+async def aget_profile_and_event(user, event_id=None):
+    """Async version of get_profile_and_event"""
+    if settings.USER_CACHE_SHARED:
+        event = await (aget_event(user, event_id) if event_id else aget_latest_event(user))
+        return await aget_profile(user), event
+
+    versions = await _versions(user, event_id).afirst()
+    if versions is None:
+        raise UserProfile.DoesNotExist("User has no profile")
+    keys = _versioned_keys(user, versions)
+    cached = await get_user_cache().aget_many(keys.values())
+    profile = cached.get(keys['profile'])
+    if profile is None:
+        profile = await UserProfile.objects.aget(user=user)
+        await get_user_cache().aset(_versioned_key(PROFILE_KEY.format(user_id=user.id), profile.updated_at), profile)
+    event = None
+    if 'event' in keys:
+        event = cached.get(keys['event'])
+        if event is None:
+            event = await Event.objects.filter(id=versions[1], user=user).afirst()
+            if event is not None:
+                await get_user_cache().aset(
+                    _versioned_key(EVENT_KEY.format(user_id=user.id, event_id=event.id), event.updated_at), event
+                )
+    return profile, event
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    get_user_cache().delete(USER_KEY.format(user_id=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_profile(sender, instance, **kwargs):
+    get_user_cache().delete(PROFILE_KEY.format(user_id=instance.user_id))
+
+
+def forget_event(event):
+    """Drop cached copies of an event, for changes made with QuerySet.update()"""
+    get_user_cache().delete_many([
+        EVENT_KEY.format(user_id=event.user_id, event_id=event.id),
+        LATEST_EVENT_KEY.format(user_id=event.user_id),
+    ])
+
+
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_event(sender, instance, **kwargs):
+    forget_event(instance)
+
+
+@receiver([post_save, post_delete], sender=UserThread)
+def invalidate_thread(sender, instance, **kwargs):
+    get_user_cache().delete(THREAD_KEY.format(user_id=instance.user_id, event_id=instance.event_id))
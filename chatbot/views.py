@@ -1,90 +1,164 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse, StreamingHttpResponse, Http404
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_http_methods
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import require_http_methods, condition
+from django.views.decorators.cache import cache_control
 from django.contrib import messages
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from openai import OpenAI
-from .models import Event, UserProfile, UserThread, ChatMessage, ChatSession, Conversation
+from django.urls import reverse
+from django.core.paginator import Paginator
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.db.models import OuterRef, Subquery
+from .models import Event, UserProfile, UserThread, ChatMessage, ChatSession, Conversation, LLMJob, PhaseTransition
 from .forms import UserProfileForm, EventForm
-from dotenv import load_dotenv
+from .llm import get_llm_client, CircuitOpenError
+from .response_cache import get_cached_completion, set_cached_completion
+from .prompts import build_turn_messages, build_opening_messages, prompt_size
+from .context_window import select_recent_turns
+from .summaries import get_phase_summary, maybe_schedule_summary, unsummarized
+from .jobs import enqueue_job
+from .phases import MarkerDetector, has_completion_marker, advance_phase
+from .history import parse_fields, parse_limit, decode_cursor, history_etag, paginate_messages
+from .search import SEARCHABLE_TABLES, search
+from .retrieval import retrieve_snippets, schedule_index_update
+from .telemetry import LLMCall, track_llm_call, aggregator
+from .profiling import profiles
+from .admission import admission_control
+from .page_cache import validators, fragment_context, event_list_state, event_detail_state, chat_state
+from .export import FORMATS, export_chunks, export_filename
+from .user_cache import get_profile, get_profile_and_event, get_active_thread, forget_event
 import json
 import logging
-import os
-import time
-import uuid
 
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+LLM_UNAVAILABLE_MESSAGE = "The writing assistant is temporarily unavailable. Please try again shortly."
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+def build_chat_messages(user, message, event_id=None, phase=None):
+    """Load what a chat turn needs and assemble the OpenAI message list.
 
-def get_personality_instructions(personality):
-    base_instructions = """Your role is to guide users through four distinct writing phases:
-            
-1. Factual Description: Help users objectively describe what happened, focusing on the concrete details.
-2. Emotional Response: Guide users to explore and express their feelings about the event.
-3. Behavioral Associations: Help users connect the event to their behaviors, patterns, and potential future actions.
-4. Positive Reframing & Growth: Guide users to:
-   - Identify positive aspects or potential benefits from the experience
-   - Reflect on personal growth and lessons learned
-   - Set goals or action steps for future improvement
-   - Find meaning or purpose in their experience
-
-For each phase:
-- Guide users with appropriate prompts and questions for that specific phase
-- Evaluate when they've adequately completed the current phase
-- When you feel they're ready to move to the next phase, respond with: "PHASE_COMPLETE: [current_phase]"
-"""
-    
-    personality_styles = {
-        'friendly': """Maintain a warm, casual, and approachable tone. Use informal language, 
-        share occasional light-hearted comments, and make the writing process feel fun and engaging. 
-        Feel free to use encouraging emojis and conversational phrases.""",
-        
-        'professional': """Maintain a formal, academic tone. Use precise language and professional terminology. 
-        Focus on structured analysis and methodical progression through the writing phases. 
-        Provide clear, well-organized guidance with academic references when relevant.""",
-        
-        'encouraging': """Be highly motivational and energetic. Celebrate small wins, provide frequent positive reinforcement, 
-        and maintain an upbeat, supportive tone throughout the conversation. Focus on building confidence 
-        and maintaining momentum."""
-    }
-    
-    return f"{base_instructions}\n\nTone and Style:\n{personality_styles.get(personality, personality_styles['friendly'])}"
+    Returns a tuple of (messages, current_event, active_phase). Raises
+    UserProfile.DoesNotExist or Http404 if the profile or event is missing.
+    """
+    user_profile, current_event = get_profile_and_event(user, event_id)
+    logger.info(f"Got user profile for {user.username}")
+
+    # The event if event_id is provided, otherwise the latest event
+    if event_id:
+        if current_event is None:
+            raise Http404("Event not found")
+        logger.info(f"Found event with id {event_id}")
+    else:
+        logger.info("Using latest event")
+
+    active_phase = None
+    summary = None
+    previous_messages = []
+    if current_event:
+        active_phase = phase or current_event.current_phase
+        # Older turns are covered by the rolling summary; send only newer ones
+        summary = get_phase_summary(user, current_event, active_phase)
+        # Get the most recent messages for this event and phase that fit the token budget
+        previous_messages = select_recent_turns(unsummarized(ChatMessage.objects.filter(
+            user_thread__user=user,
+            user_thread__event=current_event,
+            phase=active_phase
+        ), summary))
+
+    # Relevant excerpts from the user's other events
+    snippets = retrieve_snippets(user, message, current_event) if settings.RETRIEVAL_ENABLED else []
+
+    messages = build_turn_messages(
+        user_profile, current_event, active_phase, previous_messages, message,
+        summary=summary.summary if summary else None,
+        snippets=snippets
+    )
+    logger.info(f"Built prompt of {prompt_size(messages)} tokens from {len(previous_messages)} previous messages and {len(snippets)} retrieved snippets")
+    return messages, current_event, active_phase
+
+def save_chat_turn(user, current_event, phase, message, assistant_message, phase_complete=None):
+    """Persist the user/assistant message pair and check for phase progression.
+
+    Everything is written in one transaction, so a turn is saved whole or not at all.
+    Streaming callers pass phase_complete from their MarkerDetector so the reply
+    is not scanned twice.
+    """
+    with transaction.atomic():
+        logger.info("Getting/creating user thread")
+        # Get the latest thread or create a new one
+        user_thread, created = get_active_thread(user, current_event)
+        logger.info(f"{'Created new' if created else 'Using existing'} user thread")
+
+        logger.info("Saving user and assistant messages")
+        ChatMessage.objects.bulk_create([
+            ChatMessage(event=current_event, user_thread=user_thread, content=message, message_type='user', phase=phase),
+            ChatMessage(event=current_event, user_thread=user_thread, content=assistant_message, message_type='assistant', phase=phase),
+        ])
+        UserThread.objects.filter(id=user_thread.id).update(last_interaction=timezone.now())
+
+        if maybe_schedule_summary(user_thread, phase):
+            logger.info(f"Scheduled summary update for thread {user_thread.id}, phase {phase}")
+        if settings.RETRIEVAL_ENABLED:
+            schedule_index_update(user.id)
+
+        # Advance the event if the assistant marked this phase complete
+        if phase_complete is None:
+            phase_complete = has_completion_marker(assistant_message)
+        if phase_complete and advance_phase(current_event, phase, user_thread):
+            logger.info(f"Phase progressed for event {current_event.id}")
+
+def sse_event(data, event=None):
+    """Format a payload as a server-sent event frame"""
+    frame = f"event: {event}\n" if event else ""
+    return f"{frame}data: {json.dumps(data)}\n\n"
 
-def get_user_context(user):
-    """Get user's biographical context and writing goals"""
+def stream_chat_completion(user, messages, current_event, phase, message, call=None):
+    """Yield assistant tokens as server-sent events, then persist the turn"""
+    call = call or LLMCall('chat_turn', user, current_event, phase)
+    chunks = []
+    marker = MarkerDetector()
     try:
-        profile = UserProfile.objects.get(user=user)
-        context = []
-        if profile.bio_context:
-            context.append(f"Bio: {profile.bio_context}")
-        if profile.writing_goals:
-            context.append(f"Writing Goals: {profile.writing_goals}")
-        return "\n".join(context) if context else None
-    except UserProfile.DoesNotExist:
-        return None
-
-def check_phase_progression(message_content, event):
-    """Check if the AI has indicated phase completion and update accordingly"""
-    if "PHASE_COMPLETE:" in message_content:
-        current_phase = event.current_phase
-        if current_phase == 'factual_description':
-            event.current_phase = 'emotional_response'
-        elif current_phase == 'emotional_response':
-            event.current_phase = 'behavioral_associations'
-        elif current_phase == 'behavioral_associations':
-            event.current_phase = 'positive_reframing'
-        event.save()
-        return True
-    return False
+        logger.info("Attempting to stream from OpenAI API")
+        # The call is only made current around synchronous work, never across a yield
+        with call.active():
+            stream = get_llm_client().chat_completion(
+                messages,
+                temperature=0.7,
+                max_tokens=1000,
+                stream=True
+            )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                chunks.append(token)
+                marker.feed(token)
+                yield sse_event({'token': token})
+        logger.info("OpenAI stream finished")
+
+        assistant_message = "".join(chunks)
+        if current_event:
+            with call.active():
+                save_chat_turn(user, current_event, phase, message, assistant_message, phase_complete=marker.found)
+        call.finish()
+
+        yield sse_event({'response': assistant_message}, event='done')
+    except CircuitOpenError:
+        logger.warning("OpenAI circuit open, failing fast")
+        call.finish('circuit_open')
+        yield sse_event({'error': LLM_UNAVAILABLE_MESSAGE}, event='error')
+    except Exception as e:
+        logger.error(f"Error streaming OpenAI response: {str(e)}", exc_info=True)
+        call.finish('error')
+        yield sse_event({'error': str(e)}, event='error')
 
 @login_required
+@admission_control
 def get_chatbot_response(request):
     try:
         logger.info("Starting get_chatbot_response")
@@ -93,8 +167,10 @@ def get_chatbot_response(request):
             message = data.get('message')
             event_id = data.get('event_id')
             phase = data.get('phase')
+            stream = bool(data.get('stream'))
+            background = bool(data.get('background'))
             
-            logger.info(f"Received request data: message={message}, event_id={event_id}, phase={phase}")
+            logger.info(f"Received request data: message={message}, event_id={event_id}, phase={phase}, stream={stream}")
             
             if not message:
                 logger.warning("No message provided in request")
@@ -103,118 +179,72 @@ def get_chatbot_response(request):
             logger.error(f"Failed to parse JSON request: {str(e)}")
             return JsonResponse({'error': 'Invalid request format'})
 
+        if background:
+            job = enqueue_job('chat_turn', {
+                'message': message,
+                'event_id': event_id,
+                'phase': phase,
+            }, user=request.user)
+            logger.info(f"Enqueued chat turn as job {job.id}")
+            return JsonResponse({
+                'job_id': job.id,
+                'status_url': reverse('job_status', args=[job.id])
+            }, status=202)
+
+        call = LLMCall('chat_turn', user=request.user)
         try:
-            user_profile = UserProfile.objects.get(user=request.user)
-            logger.info(f"Got user profile for {request.user.username}")
-            
-            system_prompt = get_personality_instructions(user_profile.personality_preference)
-            logger.info("Generated system prompt")
-            
-            user_context = get_user_context(request.user)
-            if user_context:
-                system_prompt += f"\n\nUser Context:\n{user_context}"
-            
-            # Get the event if event_id is provided, otherwise get the latest event
-            if event_id:
-                current_event = get_object_or_404(Event, id=event_id, user=request.user)
-                logger.info(f"Found event with id {event_id}")
-            else:
-                current_event = Event.objects.filter(user=request.user).order_by('-created_at').first()
-                logger.info("Using latest event")
-            
+            with call.active(), call.stage('prompt'):
+                messages, current_event, active_phase = build_chat_messages(request.user, message, event_id, phase)
+            call.set_context(current_event, active_phase)
         except UserProfile.DoesNotExist:
             logger.error(f"UserProfile not found for user {request.user.username}")
             return JsonResponse({'error': 'User profile not found'})
-        except Event.DoesNotExist:
+        except Http404:
             logger.error(f"Event not found: {event_id}")
             return JsonResponse({'error': 'Event not found'})
         except Exception as e:
             logger.error(f"Error getting user context: {str(e)}", exc_info=True)
             return JsonResponse({'error': 'Failed to get user context'})
-
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        if current_event:
-            messages[0]["content"] += f"\n\nCurrent Event: {current_event.title}"
-            messages[0]["content"] += f"\nCurrent Phase: {phase or current_event.current_phase}"
-            
-            # Get previous messages for this event and phase
-            previous_messages = ChatMessage.objects.filter(
-                user_thread__user=request.user,
-                user_thread__event=current_event,
-                phase=phase or current_event.current_phase
-            ).order_by('created_at')[:5]
-            
-            for prev_msg in previous_messages:
-                messages.append({
-                    "role": "user" if prev_msg.message_type == "user" else "assistant",
-                    "content": prev_msg.content
-                })
-        
-        messages.append({"role": "user", "content": message})
         
         logger.info(f"Sending request to OpenAI with {len(messages)} messages")
+
+        if stream:
+            response = StreamingHttpResponse(
+                stream_chat_completion(request.user, messages, current_event, active_phase, message, call),
+                content_type='text/event-stream'
+            )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
         
         try:
-            logger.info("Attempting to call OpenAI API")
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
-            logger.info("Successfully received OpenAI API response")
-            
-            assistant_message = response.choices[0].message.content
-            logger.info("Extracted assistant message")
-
-            # Save messages to database
-            if current_event:
-                logger.info("Getting/creating user thread")
-                # Get the latest thread or create a new one
-                try:
-                    user_thread = UserThread.objects.filter(
-                        user=request.user,
-                        event=current_event
-                    ).latest('created_at')
-                    created = False
-                except UserThread.DoesNotExist:
-                    user_thread = UserThread.objects.create(
-                        user=request.user,
-                        event=current_event,
-                        thread_id=str(uuid.uuid4())
-                    )
-                    created = True
-                
-                logger.info(f"{'Created new' if created else 'Using existing'} user thread")
-                
-                logger.info("Saving user message")
-                ChatMessage.objects.create(
-                    user_thread=user_thread,
-                    content=message,
-                    message_type='user',
-                    phase=phase or current_event.current_phase
+            with call.active():
+                logger.info("Attempting to call OpenAI API")
+                response = get_llm_client().chat_completion(
+                    messages,
+                    temperature=0.7,
+                    max_tokens=1000
                 )
+                logger.info("Successfully received OpenAI API response")
                 
-                logger.info("Saving assistant message")
-                ChatMessage.objects.create(
-                    user_thread=user_thread,
-                    content=assistant_message,
-                    message_type='assistant',
-                    phase=phase or current_event.current_phase
-                )
-                
-                # Check for phase progression
-                if check_phase_progression(assistant_message, current_event):
-                    logger.info(f"Phase progressed for event {current_event.id}")
+                assistant_message = response.choices[0].message.content
+                logger.info("Extracted assistant message")
+
+                # Save messages to database
+                if current_event:
+                    save_chat_turn(request.user, current_event, active_phase, message, assistant_message)
+            call.finish()
             
             logger.info("Sending response back to client")
             return JsonResponse({'response': assistant_message})
             
+        except CircuitOpenError:
+            logger.warning("OpenAI circuit open, failing fast")
+            call.finish('circuit_open')
+            return JsonResponse({'error': LLM_UNAVAILABLE_MESSAGE}, status=503)
         except Exception as e:
             logger.error(f"Error in OpenAI communication: {str(e)}", exc_info=True)
+            call.finish('error')
             return JsonResponse({'error': str(e)})
             
     except Exception as e:
@@ -226,7 +256,10 @@ def home(request):
     conversations = []
     if request.user.is_authenticated:
         conversations = Conversation.objects.filter(user=request.user).order_by('-updated_at')
-    return render(request, 'chatbot/home.html', {'conversations': conversations})
+    return render(request, 'chatbot/home.html', {
+        'conversations': conversations,
+        **fragment_context(request, chat_state(request)),
+    })
 
 @login_required
 def profile(request):
@@ -244,9 +277,19 @@ def profile(request):
     return render(request, 'chatbot/profile.html', {'form': form})
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(*validators(event_list_state))
 def event_list(request):
-    events = Event.objects.filter(user=request.user)
-    return render(request, 'chatbot/event_list.html', {'events': events})
+    # Time of the latest phase change, read from the indexed transition log;
+    # the query only runs when the cached fragment is stale
+    last_transition = PhaseTransition.objects.filter(event=OuterRef('pk')).order_by('-created_at')
+    events = Event.objects.filter(user=request.user).annotate(
+        phase_changed_at=Subquery(last_transition.values('created_at')[:1])
+    )
+    return render(request, 'chatbot/event_list.html', {
+        'events': events,
+        **fragment_context(request, event_list_state(request)),
+    })
 
 @login_required
 def event_create(request):
@@ -264,22 +307,26 @@ def event_create(request):
     return render(request, 'chatbot/event_form.html', {'form': form, 'action': 'Create'})
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(*validators(event_detail_state, 'page'))
 def event_detail(request, event_id):
     event = get_object_or_404(Event, id=event_id, user=request.user)
     
-    # Get chat sessions for the current phase
+    # Get one page of chat sessions for the current phase, without the transcripts
     sessions = ChatSession.objects.filter(
         event=event,
         phase=event.current_phase
-    ).order_by('-timestamp')
+    ).only('id', 'event_id', 'phase', 'title', 'timestamp').order_by('-timestamp', '-id')
+    page = Paginator(sessions, settings.SESSIONS_PER_PAGE).get_page(request.GET.get('page'))
     
-    logger.info(f"Event detail - Found {sessions.count()} sessions for event {event_id}, phase {event.current_phase}")
-    for session in sessions:
-        logger.info(f"Session {session.id}: {session.title} ({session.phase})")
+    # page.object_list stays unevaluated here so a cached fragment doesn't load it
+    logger.info(f"Event detail - Showing page {page.number} of {page.paginator.count} sessions for event {event_id}, phase {event.current_phase}")
     
     return render(request, 'chatbot/event_detail.html', {
         'event': event,
-        'sessions': sessions,
+        'sessions': page.object_list,
+        'page_obj': page,
+        **fragment_context(request, event_detail_state(request, event_id), page.number),
     })
 
 @login_required
@@ -306,7 +353,38 @@ def event_delete(request, event_id):
         return redirect('event_list')
     return redirect('event_detail', event_id=event_id)
 
+def create_opening_message(user, event, user_thread):
+    """Generate and save the assistant's opening message for a writing session"""
+    with track_llm_call('opening_turn', user, event, event.current_phase) as call:
+        with call.stage('prompt'):
+            user_profile = get_profile(user)
+            chat_messages = build_opening_messages(user_profile, event)
+        completion_params = {'temperature': 0.7, 'max_tokens': 1000}
+
+        # Get initial response from OpenAI, reusing a cached opening if allowed
+        assistant_message = None
+        if user_profile.cache_opening_prompts:
+            assistant_message = get_cached_completion(chat_messages, **completion_params)
+            if assistant_message is not None:
+                call.record['outcome'] = 'cached'
+
+        if assistant_message is None:
+            response = get_llm_client().chat_completion(chat_messages, **completion_params)
+            assistant_message = response.choices[0].message.content
+            if user_profile.cache_opening_prompts:
+                set_cached_completion(chat_messages, assistant_message, **completion_params)
+
+        # Save the initial message
+        ChatMessage.objects.create(
+            user_thread=user_thread,
+            event=event,
+            content=assistant_message,
+            message_type='assistant'
+        )
+    return assistant_message
+
 @login_required
+@admission_control
 def start_writing_session(request, event_id):
     event = get_object_or_404(Event, id=event_id, user=request.user)
     
@@ -317,52 +395,16 @@ def start_writing_session(request, event_id):
         thread_id=str(timezone.now().timestamp())
     )
     
-    # Add initial context message
-    phase_prompts = {
-        'factual_description': "Let's focus on describing the factual details of this event. What happened? When? Where? Who was involved?",
-        'emotional_response': "Now, let's explore your emotional response to this event. How did you feel during and after?",
-        'behavioral_associations': "Let's examine your thoughts and behaviors associated with this event. What patterns do you notice?",
-        'positive_reframing': "Finally, let's reflect on personal growth. How has this experience shaped you? What strengths or insights have you gained?"
-    }
-    
-    initial_prompt = phase_prompts.get(event.current_phase, "Let's begin your writing session.")
-    
-    # Get user profile and context
     try:
-        user_profile = UserProfile.objects.get(user=request.user)
-        system_prompt = get_personality_instructions(user_profile.personality_preference)
-        
-        # Add user context
-        user_context = get_user_context(request.user)
-        if user_context:
-            system_prompt += f"\n\nUser Context:\n{user_context}"
-            
-        # Add event context
-        system_prompt += f"\n\nCurrent Event: {event.title}"
-        system_prompt += f"\nCurrent Phase: {event.current_phase}"
-        
-        # Get initial response from OpenAI
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "assistant", "content": initial_prompt}
-        ]
-        
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        assistant_message = response.choices[0].message.content
-        
-        # Save the initial message
-        ChatMessage.objects.create(
-            user_thread=user_thread,
-            event=event,
-            content=assistant_message,
-            message_type='assistant'
-        )
+        if settings.LLM_BACKGROUND_JOBS:
+            # Hand the LLM call to the job worker; the chat page polls for the result
+            job = enqueue_job('opening_turn', {
+                'event_id': event.id,
+                'user_thread_id': user_thread.id,
+            }, user=request.user)
+            return redirect(f'/chat/?event_id={event_id}&job={job.id}')
+
+        create_opening_message(request.user, event, user_thread)
         
         # Redirect to chat with event_id
         return redirect(f'/chat/?event_id={event_id}')
@@ -373,18 +415,27 @@ def start_writing_session(request, event_id):
         return redirect('event_detail', event_id=event.id)
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(*validators(chat_state))
 def chat(request):
     if request.method == 'GET':
         event_id = request.GET.get('event_id')
         if event_id:
             event = get_object_or_404(Event, id=event_id, user=request.user)
-            return render(request, 'chatbot/home.html', {'event': event})
+            return render(request, 'chatbot/home.html', {
+                'event': event,
+                **fragment_context(request, chat_state(request)),
+            })
         else:
             # If no event_id is provided, show the general chat interface
             conversations = []
             if request.user.is_authenticated:
                 conversations = Conversation.objects.filter(user=request.user).order_by('-updated_at')
-            return render(request, 'chatbot/home.html', {'event': None, 'conversations': conversations})
+            return render(request, 'chatbot/home.html', {
+                'event': None,
+                'conversations': conversations,
+                **fragment_context(request, chat_state(request)),
+            })
     elif request.method == 'POST':
         try:
             logger.info("Chat POST request received")
@@ -396,22 +447,44 @@ def chat(request):
             return JsonResponse({'error': 'An error occurred processing your request'}, status=500)
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
+def history_response(request, queryset, default_fields, extra):
+    """Keyset-paginated, ETag-validated JSON page of queryset's messages"""
+    try:
+        fields = parse_fields(request.GET.get('fields'), default_fields)
+        limit = parse_limit(request.GET.get('limit'))
+        cursor = request.GET.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    etag = history_etag(queryset, cursor, limit, ','.join(fields))
+    not_modified = get_conditional_response(request, etag=quote_etag(etag))
+    if not_modified is not None:
+        return not_modified
+
+    messages_data, next_cursor = paginate_messages(queryset, cursor, limit, fields)
+    response = JsonResponse({
+        **extra,
+        'messages': messages_data,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    })
+    response['ETag'] = quote_etag(etag)
+    return response
+
 @login_required
 def get_conversation(request, conversation_id):
     try:
         conversation = Conversation.objects.get(id=conversation_id, user=request.user)
-        messages = ChatMessage.objects.filter(event=conversation.event).order_by('created_at')
-        
-        messages_data = [{
-            'content': msg.content,
-            'message_type': msg.message_type,
-            'timestamp': msg.created_at.isoformat()
-        } for msg in messages]
-        
-        return JsonResponse({
+        # Only this user's messages about the event, not every thread on it
+        messages = ChatMessage.objects.filter(
+            event_id=conversation.event_id,
+            user_thread__user=request.user
+        )
+        return history_response(request, messages, ['content', 'message_type', 'timestamp'], {
             'id': conversation.id,
-            'title': conversation.title,
-            'messages': messages_data
+            'title': conversation.title
         })
     except Conversation.DoesNotExist:
         return JsonResponse({'error': 'Conversation not found'}, status=404)
@@ -423,29 +496,16 @@ def get_conversation(request, conversation_id):
 def get_phase_history(request, event_id, phase):
     try:
         event = get_object_or_404(Event, id=event_id, user=request.user)
-        thread = UserThread.objects.filter(event=event).first()
-        
-        if not thread:
-            return JsonResponse({'messages': []})
-            
-        messages = ChatMessage.objects.filter(
-            user_thread=thread,
-            phase=phase
-        ).order_by('created_at')
-        
-        messages_data = []
-        for msg in messages:
-            messages_data.append({
-                'content': msg.content,
-                'type': msg.message_type,
-                'timestamp': msg.created_at.strftime('%Y-%m-%d %H:%M')
-            })
-            
-        return JsonResponse({
-            'messages': messages_data,
+        if phase not in dict(Event.WRITING_PHASE_CHOICES):
+            return JsonResponse({'error': 'Invalid writing phase'}, status=400)
+
+        messages = ChatMessage.objects.filter(event=event, phase=phase)
+        return history_response(request, messages, ['content', 'type', 'timestamp'], {
             'phase': phase,
-            'phase_display': dict(Event.PHASE_CHOICES)[phase]
+            'phase_display': dict(Event.WRITING_PHASE_CHOICES)[phase]
         })
+    except Http404:
+        return JsonResponse({'error': 'Event not found'}, status=404)
     except Exception as e:
         logger.error(f"Error getting phase history: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
@@ -468,37 +528,30 @@ def get_phase_sessions(request, event_id, phase):
                 'error': 'Invalid writing phase'
             }, status=400)
         
-        # Get all sessions for this event and phase
+        # Get one page of sessions for this event and phase, listing fields only
         sessions = ChatSession.objects.filter(
             event=event,
             phase=phase
-        ).order_by('-timestamp')
-        logger.info(f"API - Found {sessions.count()} sessions")
-        
-        # Log each session for debugging
-        for session in sessions:
-            logger.info(f"Session {session.id}: {session.title} ({session.phase})")
+        ).values('id', 'title', 'timestamp').order_by('-timestamp', '-id')
+        page = Paginator(sessions, settings.SESSIONS_PER_PAGE).get_page(request.GET.get('page'))
+        logger.info(f"API - Returning {len(page.object_list)} of {page.paginator.count} sessions")
         
         # Format the session data
-        sessions_data = []
-        for session in sessions:
-            try:
-                session_data = {
-                    'id': session.id,
-                    'title': session.title or f"Session from {session.timestamp.strftime('%B %d, %Y')}",
-                    'formatted_date': session.get_formatted_date(),
-                }
-                sessions_data.append(session_data)
-            except Exception as e:
-                logger.error(f"Error formatting session {session.id}: {str(e)}", exc_info=True)
-                continue
+        sessions_data = [{
+            'id': session['id'],
+            'title': session['title'] or f"Session from {session['timestamp'].strftime('%B %d, %Y')}",
+            'formatted_date': session['timestamp'].strftime(ChatSession.DATE_FORMAT),
+        } for session in page.object_list]
         
         return JsonResponse({
             'success': True,
-            'sessions': sessions_data
+            'sessions': sessions_data,
+            'page': page.number,
+            'num_pages': page.paginator.num_pages,
+            'has_next': page.has_next()
         })
         
-    except Event.DoesNotExist:
+    except Http404:
         logger.error(f"Event not found: {event_id}")
         return JsonResponse({
             'success': False,
@@ -553,6 +606,22 @@ def save_session(request):
             logger.error(f"Event not found. User: {request.user}, Event ID: {data.get('event_id')}")
             return JsonResponse({'success': False, 'error': 'Event not found'})
         
+        # Continuing a saved session only appends the messages it does not have yet
+        if data.get('session_id'):
+            try:
+                session = ChatSession.objects.get(id=data['session_id'], event=event)
+            except ChatSession.DoesNotExist:
+                logger.error(f"Session not found. User: {request.user}, Session ID: {data.get('session_id')}")
+                return JsonResponse({'success': False, 'error': 'Session not found'})
+            new_messages = data['messages'][session.message_count:]
+            logger.info(f"Appending {len(new_messages)} messages to session {session.id}")
+            session.append_messages(new_messages)
+            return JsonResponse({
+                'success': True,
+                'session_id': session.id,
+                'title': session.title
+            })
+
         # Generate a title based on the first message or use provided title
         title = data.get('title', '')
         if not title and data['messages']:
@@ -563,18 +632,15 @@ def save_session(request):
             else:
                 title = f"{event.title} - {data['phase']} Session"
         
-        # Create a new session
-        logger.info(f"Creating new session for phase: {data['phase']}")
-        session = ChatSession.objects.create(
-            event=event,
-            phase=data['phase'],
-            title=title
-        )
-        
-        # Save messages
-        logger.info(f"Saving {len(data['messages'])} messages")
-        session.set_messages(data['messages'])
-        session.save()
+        # Create the session and its messages together
+        logger.info(f"Creating new session for phase: {data['phase']} with {len(data['messages'])} messages")
+        with transaction.atomic():
+            session = ChatSession.objects.create(
+                event=event,
+                phase=data['phase'],
+                title=title
+            )
+            session.append_messages(data['messages'])
         logger.info(f"Session saved successfully with ID: {session.id}")
         
         return JsonResponse({
@@ -597,16 +663,109 @@ def view_session(request, session_id):
             logger.warning(f"User {request.user} attempted to access session {session_id} belonging to {session.event.user}")
             raise Http404("Session not found")
         
-        # Get the messages from the session
-        messages = session.get_messages()
+        # Read one page of the transcript at a time
+        paginator = Paginator(
+            session.session_messages.only('position', 'message_type', 'content'),
+            settings.SESSION_MESSAGES_PER_PAGE
+        )
+        page_obj = paginator.get_page(request.GET.get('page'))
         
         return render(request, 'chatbot/session_detail.html', {
             'session': session,
-            'messages': messages,
+            'session_messages': page_obj,
+            'page_obj': page_obj,
             'event': session.event
         })
         
+    except Http404:
+        raise
     except Exception as e:
         logger.error(f"Error viewing session {session_id}: {str(e)}", exc_info=True)
         messages.error(request, "Error loading session")
-        return redirect('event_detail', event_id=session.event.id)
+        return redirect('home')
+
+@login_required
+def job_status(request, job_id):
+    """Polling endpoint for a background LLM job"""
+    job = get_object_or_404(LLMJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error or None,
+    })
+
+@login_required
+def search_writing(request):
+    """Ranked full-text search over the user's chat messages or saved sessions"""
+    text = request.GET.get('q', '').strip()
+    kind = request.GET.get('type', 'messages')
+    if not text:
+        return JsonResponse({'error': 'Missing search query'}, status=400)
+    if kind not in SEARCHABLE_TABLES:
+        return JsonResponse({'error': 'type must be messages or sessions'}, status=400)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        return JsonResponse({'error': 'page must be an integer'}, status=400)
+
+    per_page = settings.SEARCH_RESULTS_PER_PAGE
+    hits, has_next = search(request.user, kind, text, offset=(page - 1) * per_page, limit=per_page)
+    if kind == 'messages':
+        results = [{
+            'id': hit.id,
+            'event_id': hit.event_id,
+            'phase': hit.phase,
+            'type': hit.message_type,
+            'content': hit.content,
+            'timestamp': hit.created_at.isoformat(),
+            'rank': hit.rank
+        } for hit in hits]
+    else:
+        results = [{
+            'id': hit.id,
+            'session_id': hit.session_id,
+            'session_title': hit.session.title,
+            'url': reverse('view_session', args=[hit.session_id]),
+            'type': hit.message_type,
+            'content': hit.content,
+            'rank': hit.rank
+        } for hit in hits]
+
+    return JsonResponse({
+        'query': text,
+        'type': kind,
+        'results': results,
+        'page': page,
+        'has_next': has_next
+    })
+
+@staff_member_required
+def llm_telemetry(request):
+    """Latency percentiles and token totals for recent LLM calls in this process"""
+    return JsonResponse(aggregator.summary())
+
+
+def export_response(request, user, stream):
+    """Attachment response for the ?format= of an export, or a 400 for an unknown format"""
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in FORMATS:
+        return JsonResponse({'error': f"Unknown format, use one of: {', '.join(FORMATS)}"}, status=400)
+    response = StreamingHttpResponse(stream(user, export_format), content_type=FORMATS[export_format][0])
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(user, export_format)}"'
+    return response
+
+@login_required
+@require_http_methods(["GET"])
+def export_history(request):
+    """Stream all of the user's events, messages and saved sessions as NDJSON, Markdown or zip"""
+    logger.info(f"Exporting writing history of user {request.user.id} as {request.GET.get('format', 'ndjson')}")
+    return export_response(request, request.user, export_chunks)
+
+@staff_member_required
+def download_profiles(request):
+    """The sampled request profiles held by this process, as a JSON download"""
+    response = JsonResponse(profiles.snapshot(), safe=False, json_dumps_params={'indent': 2})
+    response['Content-Disposition'] = 'attachment; filename="profiles.json"'
+    return response
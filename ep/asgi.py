@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+In production it is served by gunicorn with uvicorn workers (see Procfile):
+
+    gunicorn ep.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -12,5 +16,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ep.settings')
+# Serve the chat endpoints with the async views when running under ASGI
+os.environ.setdefault('DJANGO_ASYNC_CHAT_VIEWS', 'True')
 
 application = get_asgi_application()
+
+# Load the encoding at boot rather than on the first chat turn (warns and
+# estimates token counts if it wasn't fetched)
+from chatbot.context_window import load_encoding  # noqa: E402
+
+load_encoding()
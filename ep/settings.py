@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 import os
+import sys
 import dj_database_url
 from dotenv import load_dotenv
 
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'chatbot.profiling.ProfilingMiddleware',  # removes itself unless PROFILING_SAMPLE_RATE > 0
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,11 +65,18 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'ep.urls'
 
+# Templates are compiled once per process and kept by the cached loader
+# (outside DEBUG, so edits show up while developing). Listed explicitly so the
+# choice doesn't depend on Django's defaults.
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -74,11 +84,26 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
         },
     },
 ]
 
+# Identifies the deployed code; part of every page's ETag and fragment cache
+# key (see chatbot/page_cache.py). Railway and Heroku set the commit SHA.
+RELEASE_VERSION = os.getenv('RELEASE_VERSION') or os.getenv('RAILWAY_GIT_COMMIT_SHA') or os.getenv('SOURCE_VERSION', '')
+# Seconds a rendered event/chat page fragment stays in USER_CACHE. Keys change
+# whenever the underlying rows do, so this only bounds memory, not staleness.
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '600'))
+
 WSGI_APPLICATION = 'ep.wsgi.application'
+ASGI_APPLICATION = 'ep.asgi.application'
+
+# Route the LLM-bound chat views to their async implementations. ep.asgi turns
+# this on by default so one worker can serve many in-flight OpenAI calls.
+ASYNC_CHAT_VIEWS = os.getenv('DJANGO_ASYNC_CHAT_VIEWS', 'False') == 'True'
 
 
 # Database
@@ -103,6 +128,226 @@ else:  # Local development fallback
         }
     }
 
+# OpenAI client (see chatbot/llm.py)
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4')
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '20'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))  # per attempt, seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_DEADLINE = float(os.getenv('LLM_DEADLINE', '120'))  # across all retries
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', '0.5'))
+LLM_BACKOFF_MAX = float(os.getenv('LLM_BACKOFF_MAX', '8'))
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', '5'))
+LLM_CIRCUIT_RESET_TIMEOUT = float(os.getenv('LLM_CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Conversation history sent with each chat turn (see chatbot/context_window.py)
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv('CHAT_CONTEXT_TOKEN_BUDGET', '2000'))
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv('CHAT_CONTEXT_MAX_MESSAGES', '50'))
+# Token counts come from the tiktoken encoding of OPENAI_MODEL, which
+# `manage.py fetch_encoding` downloads into TIKTOKEN_CACHE_DIR at build time and
+# workers load when they boot; a worker without it refuses to start. 'estimate'
+# counts four characters per token instead, for development without it.
+TOKEN_COUNTER = os.getenv('TOKEN_COUNTER', 'tiktoken')
+TIKTOKEN_CACHE_DIR = os.getenv('TIKTOKEN_CACHE_DIR', str(BASE_DIR / '.tiktoken'))
+os.environ['TIKTOKEN_CACHE_DIR'] = TIKTOKEN_CACHE_DIR  # read by tiktoken itself
+
+# Rolling per-phase summaries (see chatbot/summaries.py)
+CHAT_SUMMARY_INTERVAL = int(os.getenv('CHAT_SUMMARY_INTERVAL', '10'))  # new messages before re-summarizing
+CHAT_SUMMARY_KEEP_RECENT = int(os.getenv('CHAT_SUMMARY_KEEP_RECENT', '4'))  # latest messages left verbatim
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv('CHAT_SUMMARY_MAX_WORDS', '250'))
+CHAT_SUMMARY_WORKERS = int(os.getenv('CHAT_SUMMARY_WORKERS', '2'))
+
+# Saved writing sessions listed per page on event pages and the sessions API
+SESSIONS_PER_PAGE = int(os.getenv('SESSIONS_PER_PAGE', '20'))
+
+# Messages shown per page when reading a saved session
+SESSION_MESSAGES_PER_PAGE = int(os.getenv('SESSION_MESSAGES_PER_PAGE', '50'))
+
+# Rows fetched per query while streaming a history export (see chatbot/export.py)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
+
+# Page size of the cursor-paginated message history APIs (?limit= is capped at the max)
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '200'))
+
+# Full-text search (see chatbot/search.py); SEARCH_CONFIG is the PostgreSQL text search configuration.
+# Migration 0017 indexes with 'english'; another configuration needs a migration rebuilding the index.
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', 'english')
+SEARCH_RESULTS_PER_PAGE = int(os.getenv('SEARCH_RESULTS_PER_PAGE', '20'))
+
+# Retrieval of earlier writing into the prompt (see chatbot/retrieval.py).
+# EMBEDDING_FUNCTION(texts, dim) must return a (len(texts), dim) array; changing
+# it or EMBEDDING_DIM needs a rebuild with `manage.py update_embeddings --rebuild`.
+RETRIEVAL_ENABLED = os.getenv('RETRIEVAL_ENABLED', 'True') == 'True'
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '3'))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', '400'))
+RETRIEVAL_MIN_SCORE = float(os.getenv('RETRIEVAL_MIN_SCORE', '0.2'))
+RETRIEVAL_SNIPPET_CHARS = int(os.getenv('RETRIEVAL_SNIPPET_CHARS', '500'))
+RETRIEVAL_INDEX_BATCH = int(os.getenv('RETRIEVAL_INDEX_BATCH', '10'))  # new messages per index rewrite
+EMBEDDING_FUNCTION = os.getenv('EMBEDDING_FUNCTION', 'chatbot.retrieval.hashing_embedding')
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', '256'))
+EMBEDDING_INDEX_DIR = os.getenv('EMBEDDING_INDEX_DIR', str(BASE_DIR / '.cache' / 'embeddings'))
+
+# Admission control for the LLM views (see chatbot/admission.py). Each user may
+# start ADMISSION_USER_RATE requests a minute with bursts of ADMISSION_USER_BURST;
+# across all workers at most ADMISSION_MAX_CONCURRENT run at once (size it to the
+# OpenAI quota) and ADMISSION_QUEUE_SIZE more wait up to ADMISSION_QUEUE_TIMEOUT
+# seconds for a slot. Anything beyond that gets a 429 with Retry-After.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'True') == 'True'
+ADMISSION_USER_RATE = float(os.getenv('ADMISSION_USER_RATE', '20'))  # per minute
+ADMISSION_USER_BURST = int(os.getenv('ADMISSION_USER_BURST', '10'))
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '8'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '16'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '10'))
+ADMISSION_POLL_INTERVAL = float(os.getenv('ADMISSION_POLL_INTERVAL', '0.25'))
+ADMISSION_BUSY_RETRY_AFTER = int(os.getenv('ADMISSION_BUSY_RETRY_AFTER', '5'))
+ADMISSION_SLOT_LEASE = int(os.getenv('ADMISSION_SLOT_LEASE', str(int(LLM_DEADLINE) + 60)))
+
+# Sampled request profiling (see chatbot/profiling.py); 0.01 profiles 1% of
+# requests. The last PROFILING_BUFFER_SIZE samples download from /admin/profiles/.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_BUFFER_SIZE = int(os.getenv('PROFILING_BUFFER_SIZE', '200'))
+PROFILING_STACK_LINES = int(os.getenv('PROFILING_STACK_LINES', '30'))
+
+# LLM call telemetry (see chatbot/telemetry.py). Each call is logged as one JSON
+# line on the 'chatbot.telemetry.calls' logger (to TELEMETRY_LOG_FILE if set,
+# else stderr); the last TELEMETRY_WINDOW calls are summarized at /ht/llm/.
+# `manage.py test` drops the lines, which would otherwise bury the test output.
+TELEMETRY_WINDOW = int(os.getenv('TELEMETRY_WINDOW', '2000'))
+TELEMETRY_LOG_FILE = os.getenv('TELEMETRY_LOG_FILE')
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'raw': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'telemetry': {
+            'class': 'logging.NullHandler' if TESTING
+            else 'logging.FileHandler' if TELEMETRY_LOG_FILE else 'logging.StreamHandler',
+            'formatter': 'raw',
+            **({'filename': TELEMETRY_LOG_FILE} if TELEMETRY_LOG_FILE and not TESTING else {}),
+        },
+    },
+    'loggers': {
+        'chatbot.telemetry.calls': {
+            'handlers': ['telemetry'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Background LLM jobs (see chatbot/jobs.py and `manage.py run_llm_worker`)
+LLM_BACKGROUND_JOBS = os.getenv('LLM_BACKGROUND_JOBS', 'False') == 'True'
+LLM_WORKER_THREADS = int(os.getenv('LLM_WORKER_THREADS', '8'))
+LLM_WORKER_POLL_INTERVAL = float(os.getenv('LLM_WORKER_POLL_INTERVAL', '1'))
+LLM_JOB_MAX_ATTEMPTS = int(os.getenv('LLM_JOB_MAX_ATTEMPTS', '3'))
+LLM_JOB_RETRY_DELAY = float(os.getenv('LLM_JOB_RETRY_DELAY', '2'))
+LLM_JOB_STALE_AFTER = int(os.getenv('LLM_JOB_STALE_AFTER', '600'))  # seconds
+
+# Caches
+# The LLM response cache backend is pluggable: 'locmem' (LRU, per process),
+# 'file' or 'db' (shared between workers; run `manage.py createcachetable`).
+LLM_RESPONSE_CACHE = 'llm_responses'
+LLM_RESPONSE_CACHE_TTL = int(os.getenv('LLM_RESPONSE_CACHE_TTL', str(60 * 60 * 24)))
+LLM_RESPONSE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'llm-responses',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('LLM_RESPONSE_CACHE_DIR', str(BASE_DIR / '.cache' / 'llm_responses')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'chatbot_llm_response_cache',
+    },
+}
+
+# Per-user profile, event and thread cache (see chatbot/user_cache.py). 'file'
+# is shared by every worker on the host, 'db' (run `manage.py createcachetable`)
+# and 'redis' (at REDIS_URL, needs the redis package) by every host; entries in
+# them are dropped by model signals when rows change. The per-process
+# 'locmem' default keys profiles and events on their updated_at instead, so
+# other processes never serve a stale copy.
+USER_CACHE = 'user_data'
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+USER_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'user-data',
+        'OPTIONS': {'MAX_ENTRIES': USER_CACHE_MAX_ENTRIES},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('USER_CACHE_DIR', str(BASE_DIR / '.cache' / 'user_data')),
+        'OPTIONS': {'MAX_ENTRIES': USER_CACHE_MAX_ENTRIES},
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'chatbot_user_cache',
+        'OPTIONS': {'MAX_ENTRIES': USER_CACHE_MAX_ENTRIES},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0'),
+    },
+}
+USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND', 'locmem')
+USER_CACHE_SHARED = USER_CACHE_BACKEND != 'locmem'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    LLM_RESPONSE_CACHE: {
+        **LLM_RESPONSE_CACHE_BACKENDS[os.getenv('LLM_RESPONSE_CACHE_BACKEND', 'locmem')],
+        'TIMEOUT': LLM_RESPONSE_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('LLM_RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    USER_CACHE: {
+        **USER_CACHE_BACKENDS[USER_CACHE_BACKEND],
+        'TIMEOUT': USER_CACHE_TTL,
+    },
+}
+
+# Sessions and the logged-in user, which every @login_required request loads
+# before the view runs. 'cached_db' reads sessions from SESSION_CACHE_ALIAS and
+# only queries the database on a miss (writes still go to both); 'cache' keeps
+# them in the cache alone; 'signed_cookies' keeps them in the cookie itself;
+# 'db' is Django's default. The two cache engines need a shared USER_CACHE: a
+# logout deletes the session from one process's cache, and with a per-process
+# cache the others would keep accepting it.
+# With a shared USER_CACHE the user comes from it through CachedModelBackend
+# (chatbot/user_cache.py); ModelBackend stays listed so sessions logged in
+# before it was added still resolve.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'db')
+if SESSION_BACKEND in ('cached_db', 'cache') and not USER_CACHE_SHARED:
+    raise ImproperlyConfigured(
+        f"SESSION_BACKEND={SESSION_BACKEND} needs a shared cache; set USER_CACHE_BACKEND to file, db or redis"
+    )
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = USER_CACHE
+AUTHENTICATION_BACKENDS = [
+    'chatbot.user_cache.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -141,11 +386,27 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
-# Ensure static directory exists
-os.makedirs(BASE_DIR / 'static', exist_ok=True)
-os.makedirs(BASE_DIR / 'staticfiles', exist_ok=True)
-
-STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+# Page scripts and styles are written under assets/ and bundled into static/dist
+# by `manage.py build_assets` (see chatbot/assets.py). collectstatic gives every
+# file a content-hashed name plus .gz and (with Brotli installed) .br variants,
+# which WhiteNoise serves with immutable far-future cache headers. Deployments
+# opt in with STATIC_MANIFEST=True (at build and run time); a page referencing a
+# file missing from the manifest is then an error, so a skipped or stale
+# collectstatic can't serve unhashed names. Left off, `runserver` and other
+# local checkouts serve the files under their own names without collectstatic.
+STATIC_MANIFEST = os.getenv('STATIC_MANIFEST', 'False') == 'True'
+ASSET_SOURCE_DIR = BASE_DIR / 'assets'
+ASSET_BUILD_DIR = BASE_DIR / 'static' / 'dist'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+        else 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+WHITENOISE_MAX_AGE = int(os.getenv('WHITENOISE_MAX_AGE', str(60 * 60)))  # unhashed files only
 
 # Authentication settings
 LOGIN_REDIRECT_URL = '/'
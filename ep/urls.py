@@ -18,9 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from chatbot.views import download_profiles, llm_telemetry
 
 urlpatterns = [
+    path('admin/profiles/', download_profiles, name='download_profiles'),
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
+    path('ht/llm/', llm_telemetry, name='llm_telemetry'),
+    path('ht/', include('health_check.urls')),
     path('', include('chatbot.urls')),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
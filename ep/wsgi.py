@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ep.settings')
 
 application = get_wsgi_application()
+
+# Load the encoding at boot rather than on the first chat turn (warns and
+# estimates token counts if it wasn't fetched)
+from chatbot.context_window import load_encoding  # noqa: E402
+
+load_encoding()
@@ -0,0 +1,2 @@
+document.addEventListener('DOMContentLoaded',function(){const themeToggle=document.getElementById('theme-toggle');const html=document.documentElement;const savedTheme=localStorage.getItem('theme');if(savedTheme){html.setAttribute('data-bs-theme',savedTheme);updateThemeIcon(savedTheme);}
+themeToggle.addEventListener('click',function(){const currentTheme=html.getAttribute('data-bs-theme');const newTheme=currentTheme==='dark'?'light':'dark';html.setAttribute('data-bs-theme',newTheme);localStorage.setItem('theme',newTheme);updateThemeIcon(newTheme);});function updateThemeIcon(theme){const icon=themeToggle.querySelector('i');if(theme==='dark'){icon.className='bi bi-sun';}else{icon.className='bi bi-moon-stars';}}});